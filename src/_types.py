@@ -1,3 +1,11 @@
-from typing import Literal
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any, Literal
 
 EXP_UNIT_T = Literal["m", "h", "d", "w"]
+
+# Keyset pagination position: the `(date_created, id)` of the last `Flag` of a page.
+FLAG_CURSOR_T = tuple[datetime, str]
+
+# New values of some of the fields of a `Flag`, by field name, for a partial update.
+FLAG_UPDATES_T = Mapping[str, Any]
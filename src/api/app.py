@@ -1,25 +1,339 @@
+import asyncio
+import contextlib
+import functools
+import signal
+import threading
+import time
+from collections.abc import Callable
 from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, PlainTextResponse
+from loguru import logger
+from pydantic_settings import BaseSettings
+from starlette.datastructures import State
 from starlette.staticfiles import StaticFiles
 
 from src.api.flags_router import flags_router
-from src.clients.mongo_db_client import MongoDBAsyncClient
+from src.api.metrics import MetricsMiddleware, app_state_collector
+from src.cache import CacheConfig, CacheStats, TTLCache
+from src.clients.pool_stats import PoolStats
+from src.exceptions import RepositoryConnectionError
+from src.metrics import REGISTRY, STARTUP_DURATION
+from src.repo.base import FlagsShipRepo, StorageConfig
+from src.repo.circuit_breaker import CircuitBreaker, CircuitBreakerConfig
+from src.services.events import EventHub, EventsConfig
+from src.services.expirations import ExpirationScheduler, ExpirationsConfig
+from src.services.last_known import LastKnownFlags
+from src.services.shared_snapshot import SharedFlagSnapshot, SharedSnapshotConfig
+from src.services.single_flight import SingleFlight, SingleFlightConfig
+from src.services.snapshot import FlagSnapshot, FlagSnapshotManager, SnapshotConfig
+from src.services.warm_start import FastStartConfig, WarmSnapshotWriter, load_warm_snapshot
+
+if TYPE_CHECKING:
+    from types import FrameType
+
+    from fastapi.templating import Jinja2Templates
+
+    from src.clients.mongo_db_client import MongoDBAsyncClient
+    from src.domain.flag import Flag
+
+
+class UIConfig(BaseSettings):
+    # Serve the home page and its static files, API only deployments can leave them out.
+    enabled: bool = True
+
+    class Config:
+        env_prefix = "FLAGBIT_UI_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+async def connect_storage(
+    state: State, *, fast_start: bool = False, lazy: bool = False
+) -> FlagsShipRepo:
+    """
+    Connect the storage backend picked by `StorageConfig`, keeping its client on the `state`.
+    Only the picked backend and its driver are imported.
+    With `fast_start`, the MongoDB checks run in the background, as one of `state.startup_tasks`.
+    When `lazy`, the client only connects on its first operation and the checks are left to
+    the worker writing the shared snapshot, so reader workers open no connection of their own
+    while the shared snapshot serves the reads.
+    """
+    state.mongo_client = None
+    state.sql_client = None
+    state.flags_repo = None
+    backend = StorageConfig().backend
+    if backend == "embedded":
+        from src.repo.embedded import EmbeddedRepo, EmbeddedRepoConfig  # noqa: PLC0415
+
+        state.flags_repo = EmbeddedRepo(config=EmbeddedRepoConfig())
+        return state.flags_repo  # type: ignore[no-any-return]
+    if backend == "sql":
+        from src.clients.sql_client import SQLAsyncClient  # noqa: PLC0415
+        from src.repo.sql_store import SQLStoreRepo  # noqa: PLC0415
+
+        state.sql_client = SQLAsyncClient()
+        if lazy:
+            state.sql_client.open()
+        else:
+            await state.sql_client.connect()
+        return SQLStoreRepo(client=state.sql_client)
+    from src.clients.mongo_db_client import MongoDBAsyncClient  # noqa: PLC0415
+    from src.repo.doc_store import DocStoreRepo  # noqa: PLC0415
+
+    state.mongo_client = MongoDBAsyncClient()
+    if lazy or fast_start:
+        state.mongo_client.open()
+        if not lazy:
+            state.startup_tasks.append(asyncio.create_task(check_storage(state.mongo_client)))
+    else:
+        await state.mongo_client.connect()
+    return DocStoreRepo(client=state.mongo_client)
+
+
+async def check_storage(client: "MongoDBAsyncClient") -> None:
+    """
+    The MongoDB checks of a fast start, reported instead of failing the already serving worker.
+    """
+    try:
+        await client.check()
+    except Exception as error:  # noqa: BLE001
+        logger.error(f"MongoDB checks failed, serving anyway: `{error}`")
+
+
+def open_shared_snapshot(state: State) -> SharedFlagSnapshot | None:
+    """
+    Map the snapshot shared by the workers of the host when enabled,
+    and become its writer if no other worker is.
+    """
+    config = SharedSnapshotConfig()
+    if not config.enabled:
+        state.shared_snapshot = None
+        return None
+    shared = state.shared_snapshot = SharedFlagSnapshot(config=config)
+    shared.try_acquire_writer()
+    return shared
+
+
+def create_snapshot_manager(
+    state: State, repo: FlagsShipRepo, *, fast_start: bool = False
+) -> FlagSnapshotManager | None:
+    """
+    The in-process snapshot when enabled, on a `fast_start` as it serves the warm snapshot
+    and writes it, or when this worker writes the shared snapshot.
+    Every worker maps the shared snapshot, only the one holding its lock refreshes it.
+    """
+    snapshot_config = SnapshotConfig()
+    shared = state.shared_snapshot
+    is_writer = shared is not None and shared.is_writer
+    if not (snapshot_config.enabled or fast_start or is_writer):
+        return None
+    manager = FlagSnapshotManager(repo=repo, config=snapshot_config)
+    if shared is not None and is_writer:
+        manager.add_listener(shared.publish)
+    return manager
+
+
+async def take_over_shared_snapshot(state: State, repo: FlagsShipRepo) -> None:
+    """
+    Wait for the writer lock of the shared snapshot, held by another worker until it is gone,
+    then refresh the shared snapshot from this worker.
+    """
+    shared: SharedFlagSnapshot = state.shared_snapshot
+    await shared.acquire_writer()
+    manager: FlagSnapshotManager | None = state.flag_snapshot
+    if manager is not None:
+        manager.add_listener(shared.publish)
+        manager.request_refresh()
+        return
+    manager = FlagSnapshotManager(repo=repo, config=SnapshotConfig())
+    manager.add_listener(shared.publish)
+    if (expirations := state.flag_expirations) is not None:
+        manager.add_listener(expirations.follow_snapshot)
+    await manager.start(wait=False)
+    state.flag_snapshot = manager
+
+
+async def start_expirations(
+    state: State,
+    repo: FlagsShipRepo,
+    manager: FlagSnapshotManager | None,
+    *,
+    load: bool = True,
+) -> ExpirationScheduler | None:
+    """
+    Publish an `expired` event for every `Flag` as soon as it expires. The scheduled `Flags`
+    follow the snapshot when there is one, otherwise they are loaded once, unless not to `load`
+    them, and follow the changes read by the flag events, so the writes made by other workers
+    are scheduled too.
+    """
+    config = ExpirationsConfig()
+    if not config.enabled:
+        return None
+    expirations = ExpirationScheduler(config=config)
+    expirations.add_listener(state.flag_events.publish_expired)
+    if manager is not None:
+        manager.add_listener(expirations.follow_snapshot)
+    elif load:
+        # The changes made while loading are read again, scheduling a `Flag` twice is harmless.
+        try:
+            revision = await repo.get_revision()
+            expirations.replace_all([flag async for flag in repo.iter_all()])
+        except RepositoryConnectionError as error:
+            logger.warning(f"Flag expirations could not be loaded, reading every change: `{error}`")
+            revision = 0
+        state.flag_events.follow(expirations.follow_event, revision=revision)
+    await expirations.start()
+    return expirations
+
+
+def end_streams_on_exit(events: EventHub) -> Callable[[], None]:
+    """
+    End the open event streams as soon as the server is asked to exit: it waits for every open
+    connection to finish before running the lifespan shutdown, so a stream never would.
+    The exit signal then goes on to the previous handler, the server one.
+    Returns the function putting the previous handlers back.
+    """
+    # Only the main thread can handle signals, e.g. not the one of a `TestClient`.
+    if threading.current_thread() is not threading.main_thread():
+        return lambda: None
+    loop = asyncio.get_running_loop()
+    previous: dict[int, Callable[[int, FrameType | None], object] | int | None] = {}
+
+    def handle_exit(sig: int, frame: "FrameType | None") -> None:
+        loop.call_soon_threadsafe(events.close)
+        handler = previous[sig]
+        if callable(handler):
+            handler(sig, frame)
+        elif handler == signal.SIG_DFL:
+            signal.signal(sig, handler)
+            signal.raise_signal(sig)
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous[sig] = signal.signal(sig, handle_exit)
+
+    def restore() -> None:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
+    return restore
+
+
+def create_circuit_breaker(state: State, warm: FlagSnapshot | None) -> None:
+    """
+    The circuit breaker and the last known good flags it serves, starting with the `Flags`
+    of the `warm` snapshot, if any, while the database cannot be reached yet.
+    """
+    breaker_config = CircuitBreakerConfig()
+    state.circuit_breaker = None
+    state.last_known_flags = None
+    if breaker_config.enabled:
+        state.circuit_breaker = CircuitBreaker(config=breaker_config)
+        state.last_known_flags = LastKnownFlags(
+            maxsize=breaker_config.stale_maxsize,
+            max_age_seconds=breaker_config.stale_max_age_seconds,
+        )
+        if warm is not None:
+            state.last_known_flags.remember_flags(list(warm.flags), remembered_at=warm.built_at)
+
+
+async def start_snapshot(
+    manager: FlagSnapshotManager, fast_start: FastStartConfig, warm: FlagSnapshot | None
+) -> WarmSnapshotWriter | None:
+    """
+    Start refreshing the snapshot. On a fast start it is seeded with the `warm` snapshot,
+    its first refresh runs in the background and every new revision is written back to disk
+    for the next workers, by the returned writer.
+    """
+    writer = None
+    if fast_start.enabled:
+        if warm is not None:
+            manager.seed(warm)
+        writer = WarmSnapshotWriter(
+            fast_start.snapshot_path, revision=warm.revision if warm else None
+        )
+        manager.add_listener(writer)
+    await manager.start(wait=not fast_start.enabled)
+    return writer
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):  # type: ignore #noqa: ANN201
-    mongo_client = MongoDBAsyncClient()
-    await mongo_client.connect()
-    app.state.mongo_client = mongo_client
+    started_at = time.perf_counter()
+    app.state.startup_tasks = []
+    fast_start = FastStartConfig()
+    warm = (
+        load_warm_snapshot(fast_start.snapshot_path, max_age_seconds=fast_start.max_age_seconds)
+        if fast_start.enabled
+        else None
+    )
+    shared = open_shared_snapshot(app.state)
+    # A reader of the shared snapshot only reaches the database for what the snapshot cannot serve.
+    reader = shared is not None and not shared.is_writer
+    repo = await connect_storage(app.state, fast_start=fast_start.enabled, lazy=reader)
+
+    cache_config = CacheConfig()
+    app.state.flags_cache = TTLCache.from_config(cache_config) if cache_config.enabled else None
+    app.state.flags_pages_cache = (
+        TTLCache(maxsize=cache_config.pages_maxsize, ttl_seconds=cache_config.ttl_seconds)
+        if cache_config.enabled
+        else None
+    )
+
+    create_circuit_breaker(app.state, warm)
+    app.state.flag_lookups = SingleFlight() if SingleFlightConfig().enabled else None
+    app.state.flag_events = EventHub(repo=repo, config=EventsConfig())
+
+    manager = app.state.flag_snapshot = create_snapshot_manager(
+        app.state, repo, fast_start=fast_start.enabled
+    )
+    app.state.flag_expirations = await start_expirations(app.state, repo, manager, load=not reader)
+    app.state.warm_snapshot_writer = (
+        await start_snapshot(manager, fast_start, warm) if manager else None
+    )
+    if reader:
+        app.state.startup_tasks.append(
+            asyncio.create_task(take_over_shared_snapshot(app.state, repo))
+        )
+    await app.state.flag_events.start()
+    restore_signals = end_streams_on_exit(app.state.flag_events)
+
+    collector = app_state_collector(app.state)
+    REGISTRY.add_collector(collector)
+
+    mode = "fast" if fast_start.enabled else "checked"
+    startup_seconds = time.perf_counter() - started_at
+    STARTUP_DURATION.set(startup_seconds, mode)
+    logger.info(f"Started serving in {startup_seconds:.3f}s, in the {mode} start mode.")
 
     yield
 
-    # Shutdown: close MongoDB
-    await mongo_client.close()
+    # Shutdown: end the open event streams, stop the snapshot refresher and close the storage
+    restore_signals()
+    REGISTRY.remove_collector(collector)
+    for task in app.state.startup_tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await app.state.flag_events.stop()
+    if app.state.flag_expirations:
+        await app.state.flag_expirations.stop()
+    if app.state.flag_snapshot:
+        await app.state.flag_snapshot.stop()
+    if app.state.warm_snapshot_writer:
+        await app.state.warm_snapshot_writer.close()
+    if app.state.shared_snapshot:
+        app.state.shared_snapshot.close()
+    if app.state.flags_repo:
+        app.state.flags_repo.close()
+    if app.state.sql_client:
+        await app.state.sql_client.close()
+    if app.state.mongo_client:
+        await app.state.mongo_client.close()
 
 
 app = FastAPI(
@@ -30,6 +344,7 @@ app = FastAPI(
 )
 
 
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -38,11 +353,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-templates = Jinja2Templates(directory="src/api/templates")
-app.mount("/static", StaticFiles(directory="src/api/static"), name="static")
 app.include_router(flags_router, tags=["Flags"])
 
 
-@app.get("/", response_class=HTMLResponse, tags=["Home"], description="Home page")
+@functools.cache
+def get_templates() -> "Jinja2Templates":
+    """
+    The templates of the home page, Jinja is imported on its first visit, not with the app.
+    """
+    from fastapi.templating import Jinja2Templates  # noqa: PLC0415
+
+    return Jinja2Templates(directory="src/api/templates")
+
+
 async def home(request: Request) -> HTMLResponse:
-    return templates.TemplateResponse("home.html", {"request": request})
+    return get_templates().TemplateResponse("home.html", {"request": request})
+
+
+if UIConfig().enabled:
+    app.mount("/static", StaticFiles(directory="src/api/static"), name="static")
+    app.add_api_route(
+        "/",
+        home,
+        response_class=HTMLResponse,
+        tags=["Home"],
+        description="Home page",
+        methods=["GET"],
+    )
+
+
+@app.get("/cache/stats", tags=["Cache"], description="Flag lookup cache counters")
+async def cache_stats(request: Request) -> CacheStats | None:
+    cache: TTLCache[str, Flag] | None = request.app.state.flags_cache
+    return cache.stats if cache is not None else None
+
+
+@app.get(
+    "/mongo/pool/stats",
+    tags=["Metrics"],
+    description="MongoDB connection pool counters of this worker, for sizing the pools",
+)
+async def mongo_pool_stats(request: Request) -> PoolStats | None:
+    client: MongoDBAsyncClient | None = request.app.state.mongo_client
+    return client.pool_listener.stats if client is not None else None
+
+
+@app.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    tags=["Metrics"],
+    description="Request, repository, cache and connection pool metrics in the Prometheus format",
+)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
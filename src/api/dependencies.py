@@ -1,14 +1,100 @@
 from fastapi import Depends, Request
 
-from src.repo.doc_store import DocStoreRepo
+from src.repo.base import FlagsShipRepo
+from src.repo.cached_repo import CachedRepo
+from src.repo.circuit_breaker import CircuitBreakerRepo
 from src.services.flagbit import FlagBitService
 
 
-def get_doc_store_repo(request: Request) -> DocStoreRepo:
+def get_storage_repo(request: Request) -> FlagsShipRepo:
+    """
+    The repo of the storage backend picked by `StorageConfig` in the lifespan:
+    the app level repo when the backend keeps its own state, like the `EmbeddedRepo`,
+    a `SQLStoreRepo` over the shared SQL engine, otherwise a `DocStoreRepo` over
+    the shared MongoDB client. Like in the lifespan, only the repo of that backend is imported.
+    """
+    repo = getattr(request.app.state, "flags_repo", None)
+    if repo is not None:
+        return repo  # type: ignore[no-any-return]
+    sql_client = getattr(request.app.state, "sql_client", None)
+    if sql_client is not None:
+        from src.repo.sql_store import SQLStoreRepo  # noqa: PLC0415
+
+        return SQLStoreRepo(client=sql_client)
+    from src.repo.doc_store import DocStoreRepo  # noqa: PLC0415
+
     return DocStoreRepo(client=request.app.state.mongo_client)
 
 
+def get_read_only_storage_repo(request: Request) -> FlagsShipRepo:
+    """
+    The storage repo of the read only routes, with MongoDB it looks the flags up
+    with the read preference configured for them, so secondaries can serve them.
+    """
+    state = request.app.state
+    if getattr(state, "flags_repo", None) is None and getattr(state, "sql_client", None) is None:
+        from src.repo.doc_store import DocStoreRepo  # noqa: PLC0415
+
+        return DocStoreRepo(client=state.mongo_client, read_only=True)
+    return get_storage_repo(request)
+
+
+def guard_repo(request: Request, repo: FlagsShipRepo, *, cached: bool = True) -> FlagsShipRepo:
+    """
+    The storage repo behind the circuit breaker, and the cache in front of both when `cached`.
+    """
+    breaker = getattr(request.app.state, "circuit_breaker", None)
+    if breaker is not None:
+        repo = CircuitBreakerRepo(repo=repo, breaker=breaker)
+    cache = getattr(request.app.state, "flags_cache", None)
+    if cache is not None and cached:
+        return CachedRepo(repo=repo, cache=cache)
+    return repo
+
+
+def get_flags_repo(
+    request: Request,
+    repo: FlagsShipRepo = Depends(get_storage_repo),  # noqa: B008
+) -> FlagsShipRepo:
+    """
+    The storage repo behind the circuit breaker, and the cache in front of both.
+    """
+    return guard_repo(request, repo)
+
+
 def get_flag_bit_service(
-    repo: DocStoreRepo = Depends(get_doc_store_repo),  # noqa: B008
+    request: Request,
+    repo: FlagsShipRepo = Depends(get_flags_repo),  # noqa: B008
+) -> FlagBitService:
+    return FlagBitService(
+        repo=repo,
+        snapshot=getattr(request.app.state, "flag_snapshot", None),
+        events=getattr(request.app.state, "flag_events", None),
+        shared=getattr(request.app.state, "shared_snapshot", None),
+        expirations=getattr(request.app.state, "flag_expirations", None),
+        last_known=getattr(request.app.state, "last_known_flags", None),
+        single_flight=getattr(request.app.state, "flag_lookups", None),
+    )
+
+
+def get_read_only_flags_repo(
+    request: Request,
+    repo: FlagsShipRepo = Depends(get_read_only_storage_repo),  # noqa: B008
+) -> FlagsShipRepo:
+    """
+    Like `get_flags_repo`, but lookups that may be served by a lagging secondary skip
+    the cache: writes invalidate it, and such a lookup right after a write would fill it
+    again with the flag from before the write, for the whole TTL.
+    """
+    return guard_repo(request, repo, cached=not getattr(repo, "reads_from_secondaries", False))
+
+
+def get_read_only_flag_bit_service(
+    request: Request,
+    repo: FlagsShipRepo = Depends(get_read_only_flags_repo),  # noqa: B008
 ) -> FlagBitService:
-    return FlagBitService(repo=repo)
+    """
+    The `FlagBitService` of the routes that only read flags, like `/flags`
+    and `/flags/{flag_name}/value`.
+    """
+    return get_flag_bit_service(request, repo=repo)
@@ -0,0 +1,46 @@
+"""
+Helpers for strong `ETag` / `If-None-Match` conditional responses.
+"""
+
+import hashlib
+
+
+def make_etag(*parts: str | bytes) -> str:
+    """
+    Build a strong, quoted `ETag` out of the given parts.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode() if isinstance(part, str) else part)
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Weak comparison of an `If-None-Match` header against `etag`, as RFC 9110 requires for it.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip().removeprefix("W/") for candidate in if_none_match.split(","))
+    return etag.removeprefix("W/") in candidates
+
+
+def version_etag(version: int) -> str:
+    """
+    The strong `ETag` of a single `Flag` at `version`, to send back in `If-Match`.
+    """
+    return f'"v{version}"'
+
+
+def version_from_etag(if_match: str) -> int | None:
+    """
+    The `Flag` version of an `If-Match` header holding one `version_etag`, otherwise `None`.
+    Weak tags never match, as `If-Match` uses the strong comparison.
+    """
+    tag = if_match.strip()
+    if not (tag.startswith('"v') and tag.endswith('"')) or not tag[2:-1].isdigit():
+        return None
+    return int(tag[2:-1])
@@ -1,52 +1,260 @@
+from collections.abc import AsyncIterator
+from datetime import datetime
 from http import HTTPStatus
-from typing import Annotated, cast
+from typing import TYPE_CHECKING, Annotated, Any, cast
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+from pytz import utc
 
-from src.api.dependencies import get_flag_bit_service
-from src.api.models import FlagRequest, FlagResponse, FlagUpdateRequest
-from src.domain.flag import Flag
-from src.exceptions import FlagNotFoundError, FlagPersistenceError
-from src.services.flagbit import FlagAllowedUpdates, FlagBitService
+from src.api.dependencies import get_flag_bit_service, get_read_only_flag_bit_service
+from src.api.etag import etag_matches, make_etag, version_etag, version_from_etag
+from src.api.models import (
+    FlagBatchItemResult,
+    FlagBatchRequest,
+    FlagBatchResponse,
+    FlagChangesResponse,
+    FlagEvaluationRequest,
+    FlagRequest,
+    FlagResponse,
+    FlagUpdateRequest,
+    FlagValuesRequest,
+)
+from src.domain.flag import Flag, FlagChanges
+from src.exceptions import (
+    FlagAlreadyExistsError,
+    FlagNotFoundError,
+    FlagPersistenceError,
+    FlagVersionConflictError,
+    InvalidCursorError,
+)
+from src.helpers import encode_cursor
+from src.metrics import STALE_RESPONSES
+from src.services.events import FlagEvent
+from src.services.flagbit import FlagAllowedUpdates, FlagBitService, NewFlag
+
+if TYPE_CHECKING:
+    from src.cache import TTLCache
 
 flags_router = APIRouter()
 
+SSE_HEARTBEAT = b": heartbeat\n\n"
+# Set when the database was unreachable and last known good flags were served instead,
+# to how old they are in seconds.
+STALE_HEADER = "X-Flagbit-Stale-Seconds"
+
+
+def flag_to_response(flag: Flag, now: datetime) -> dict[str, Any]:
+    """
+    The `FlagResponse` fields of a `Flag` as a plain dict, ready to be encoded
+    without validating it through the pydantic model first.
+    """
+    return {
+        "name": flag.name,
+        "value": flag.value,
+        "desc": flag.desc,
+        "expired": flag.is_expired(now),
+        "id": flag.id,
+        "date_updated": flag.date_updated,
+        "expiration_date": flag.expiration_date,
+        "date_created": flag.date_created,
+        "revision": flag.revision,
+        "rollout_percentage": flag.rollout_percentage,
+        "version": flag.version,
+    }
+
+
+def stale_headers(flagbit: FlagBitService) -> dict[str, str]:
+    if flagbit.stale_seconds is None:
+        return {}
+    STALE_RESPONSES.inc()
+    return {STALE_HEADER: str(int(flagbit.stale_seconds))}
+
+
+def encode_flags(flags: list[Flag]) -> bytes:
+    now = datetime.now(tz=utc)
+    return to_json([flag_to_response(flag, now) for flag in flags])
+
+
+def flag_to_ndjson(flag: Flag) -> bytes:
+    return to_json(flag_to_response(flag, datetime.now(tz=utc))) + b"\n"
+
 
 @flags_router.get(
     "/flags",
     tags=["Flags"],
     name="Get all flags",
-    response_model=list[FlagResponse] | None,
-    description="Retrieve all feature flags",
+    response_model=list[FlagResponse],
+    description="Retrieve all feature flags, one page at a time. When more flags are left "
+    "the `X-Next-Cursor` response header holds the `after` value of the next page. "
+    "Send back the `ETag` in `If-None-Match` to get a `304` while nothing changed",
 )
-async def flags(
-    flagbit: Annotated[FlagBitService, Depends(get_flag_bit_service)],
+async def flags(  # noqa: PLR0913, PLR0917
+    request: Request,
+    flagbit: Annotated[FlagBitService, Depends(get_read_only_flag_bit_service)],
     flag_name: str | None = None,
     flag_value: bool | None = None,  # noqa: FBT001
     expired: bool | None = None,  # noqa: FBT001
-) -> list[Flag] | None:
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    after: str | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    state_tag = flagbit.state_tag()
+    etag = make_etag(state_tag, request.url.query) if state_tag is not None else None
+    if etag is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+    # While the flags are known to be unchanged, the page encoded for the same `ETag` is reused.
+    pages: TTLCache[str, tuple[bytes, dict[str, str]]] | None = getattr(
+        request.app.state, "flags_pages_cache", None
+    )
+    if etag is not None and pages is not None and (page := pages.get(etag)) is not None:
+        body, headers = page
+        return Response(content=body, media_type="application/json", headers=headers)
     try:
-        return await flagbit.get_all_flags(
-            flag_name=flag_name, flag_value=flag_value, expired=expired
+        flags = await flagbit.get_all_flags(
+            flag_name=flag_name, flag_value=flag_value, expired=expired, limit=limit, after=after
         )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e)) from None
     except FlagPersistenceError:
         raise HTTPException(
             status_code=HTTPStatus.SERVICE_UNAVAILABLE,
             detail="Error retrieving flags due to persistence issue",
         ) from None
+    flags = flags or []
+    body = encode_flags(flags)
+    headers = {"ETag": etag or make_etag(body), **stale_headers(flagbit)}
+    if len(flags) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(flags[-1].cursor)
+    if etag is not None and pages is not None:
+        pages.set(etag, (body, headers))
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@flags_router.get(
+    "/flags/export",
+    tags=["Flags"],
+    name="Export all flags",
+    response_class=StreamingResponse,
+    description="Stream every feature flag as newline delimited JSON, one flag per line",
+)
+async def export_flags(
+    flagbit: Annotated[FlagBitService, Depends(get_flag_bit_service)],
+    batch_size: Annotated[int, Query(ge=1, le=10_000)] = 500,
+) -> StreamingResponse:
+    flags_iter = aiter(flagbit.export_flags(batch_size=batch_size))
+    try:
+        # Pull the first flag before answering, so connection errors still become a 503.
+        first_flag = await anext(flags_iter, None)
+    except FlagPersistenceError:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Error exporting flags due to persistence issue",
+        ) from None
+
+    async def ndjson_lines() -> AsyncIterator[bytes]:
+        if first_flag is None:
+            return
+        yield flag_to_ndjson(first_flag)
+        async for flag in flags_iter:
+            yield flag_to_ndjson(flag)
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+def flag_event_to_sse(event: FlagEvent) -> bytes:
+    if event.flag is not None:
+        data = to_json(flag_to_response(event.flag, datetime.now(tz=utc)))
+    else:
+        data = to_json({"id": event.flag_id})
+    return f"id: {event.id}\nevent: {event.kind}\ndata: ".encode() + data + b"\n\n"
+
+
+@flags_router.get(
+    "/flags/stream",
+    tags=["Flags"],
+    name="Stream flag changes",
+    response_class=StreamingResponse,
+    description="Server-Sent Events of every feature flag `created`, `updated`, `deleted` "
+    "or `expired` from now on, by any worker. Event ids are storage revisions: send the last one "
+    "back in `Last-Event-ID` to resume after a reconnect, a `reset` event means that too many "
+    "events were missed and every flag has to be reloaded",
+)
+async def stream_flags(
+    flagbit: Annotated[FlagBitService, Depends(get_flag_bit_service)],
+    last_event_id: Annotated[int | None, Header()] = None,
+) -> StreamingResponse:
+    try:
+        subscription = await flagbit.subscribe(last_event_id=last_event_id)
+    except FlagPersistenceError:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Error streaming flags due to persistence issue",
+        ) from None
+    if subscription is None:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE, detail="Flag events are not enabled"
+        )
+
+    async def sse_events() -> AsyncIterator[bytes]:
+        try:
+            # Flush the headers right away, so clients know they are subscribed.
+            yield SSE_HEARTBEAT
+            async for event in subscription:
+                yield SSE_HEARTBEAT if event is None else flag_event_to_sse(event)
+        finally:
+            flagbit.unsubscribe(subscription)
+
+    return StreamingResponse(
+        sse_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@flags_router.get(
+    "/flags/changes",
+    tags=["Flags"],
+    name="Get flag changes",
+    response_model=FlagChangesResponse,
+    description="Retrieve the feature flags changed or deleted after the `since` revision",
+)
+async def flag_changes(
+    flagbit: Annotated[FlagBitService, Depends(get_flag_bit_service)],
+    since: Annotated[int, Query(ge=0)] = 0,
+) -> FlagChanges:
+    try:
+        return await flagbit.get_changes(since=since)
+    except FlagPersistenceError:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Error retrieving flag changes due to persistence issue",
+        ) from None
 
 
 @flags_router.get(
     "/flags/{flag_name}/value",
     tags=["Flags"],
     name="Get flag value",
-    description="Retrieve the value of a feature flag by name",
+    response_model=bool,
+    description="Retrieve the value of a feature flag by name. A flag with a "
+    "`rollout_percentage` is `false` here, as no user is known to be in its rollout: "
+    "evaluate it for user ids instead",
 )
 async def get_flag_value(
-    flag_name: str, flagbit: Annotated[FlagBitService, Depends(get_flag_bit_service)]
-) -> bool:
+    flag_name: str,
+    flagbit: Annotated[FlagBitService, Depends(get_read_only_flag_bit_service)],
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    state_tag = flagbit.state_tag(name=flag_name)
+    etag = make_etag(state_tag, flag_name) if state_tag is not None else None
+    if etag is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
     try:
-        return await flagbit.is_enabled(name=flag_name)  # type: ignore[return-value]
+        value = await flagbit.is_enabled(name=flag_name)
     except FlagNotFoundError as e:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=str(e)) from e
     except FlagPersistenceError:
@@ -54,6 +262,62 @@ async def get_flag_value(
             status_code=HTTPStatus.SERVICE_UNAVAILABLE,
             detail="Error deleting flag due to persistence issue",
         ) from None
+    body = b"true" if value else b"false"
+    headers = {"ETag": etag or make_etag(flag_name, body), **stale_headers(flagbit)}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@flags_router.post(
+    "/flags/values",
+    tags=["Flags"],
+    name="Get many flag values",
+    description="Retrieve the values of many feature flags by name in one request, "
+    "unknown names are left out of the response and flags with a `rollout_percentage` "
+    "are `false`, as no user is known to be in their rollout",
+)
+async def get_flag_values(
+    request: FlagValuesRequest,
+    response: Response,
+    flagbit: Annotated[FlagBitService, Depends(get_read_only_flag_bit_service)],
+) -> dict[str, bool]:
+    try:
+        values = await flagbit.get_values(names=request.names)
+    except FlagPersistenceError:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Error retrieving flag values due to persistence issue",
+        ) from None
+    response.headers.update(stale_headers(flagbit))
+    return values
+
+
+@flags_router.post(
+    "/flags/{flag_name}/evaluate",
+    tags=["Flags"],
+    name="Evaluate a flag for many users",
+    description="Evaluate a feature flag for many user ids in one request. A flag with a "
+    "`rollout_percentage` is enabled for the same users every time, the response holds "
+    "one value per user id, in the same order",
+)
+async def evaluate_flag_for_users(
+    flag_name: str,
+    request: FlagEvaluationRequest,
+    flagbit: Annotated[FlagBitService, Depends(get_flag_bit_service)],
+) -> Response:
+    try:
+        values = await flagbit.evaluate_for_users(name=flag_name, user_ids=request.user_ids)
+    except FlagNotFoundError as e:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=str(e)) from e
+    except FlagPersistenceError:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Error evaluating flag due to persistence issue",
+        ) from None
+    # Encoded directly, validating hundreds of thousands of booleans would cost more than this.
+    body = to_json({"name": flag_name, "enabled": sum(values), "values": values})
+    return Response(content=body, media_type="application/json")
 
 
 @flags_router.get(
@@ -61,14 +325,15 @@ async def get_flag_value(
     tags=["Flags"],
     response_model=FlagResponse,
     name="Get a flag",
-    description="Retrieve a feature flag by ID",
+    description="Retrieve a feature flag by ID, its `ETag` holds the version of the flag",
 )
 async def get_flag_by_id(
     flag_id: str,
+    response: Response,
     flagbit: Annotated[FlagBitService, Depends(get_flag_bit_service)],
 ) -> Flag:
     try:
-        return await flagbit.get_flag(flag_id=flag_id)
+        flag = await flagbit.get_flag(flag_id=flag_id)
     except FlagNotFoundError:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Flag not found") from None
     except FlagPersistenceError:
@@ -76,6 +341,8 @@ async def get_flag_by_id(
             status_code=HTTPStatus.SERVICE_UNAVAILABLE,
             detail="Error deleting flag due to persistence issue",
         ) from None
+    response.headers["ETag"] = version_etag(flag.version)
+    return flag
 
 
 @flags_router.post(
@@ -90,7 +357,14 @@ async def new_flag(
     flagbit: Annotated[FlagBitService, Depends(get_flag_bit_service)],
 ) -> Flag:
     try:
-        return await flagbit.create_flag(name=flag.name, value=flag.value, desc=flag.desc)
+        return await flagbit.create_flag(
+            name=flag.name,
+            value=flag.value,
+            desc=flag.desc,
+            rollout_percentage=flag.rollout_percentage,
+        )
+    except FlagAlreadyExistsError as e:
+        raise HTTPException(status_code=HTTPStatus.CONFLICT, detail=str(e)) from None
     except FlagPersistenceError:
         raise HTTPException(
             status_code=HTTPStatus.SERVICE_UNAVAILABLE,
@@ -98,33 +372,94 @@ async def new_flag(
         ) from None
 
 
+@flags_router.post(
+    "/flags/batch",
+    tags=["Flags"],
+    name="Create many new flags",
+    description="Create many feature flags in one request. Every flag gets its own result; "
+    "the status code is `207` when some of them could not be created",
+    status_code=HTTPStatus.CREATED,
+)
+async def new_flags(
+    batch: FlagBatchRequest,
+    response: Response,
+    flagbit: Annotated[FlagBitService, Depends(get_flag_bit_service)],
+) -> FlagBatchResponse:
+    try:
+        results = await flagbit.create_flags(
+            new_flags=[
+                NewFlag(
+                    name=flag.name,
+                    value=flag.value,
+                    desc=flag.desc,
+                    rollout_percentage=flag.rollout_percentage,
+                )
+                for flag in batch.flags
+            ]
+        )
+    except FlagPersistenceError:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Error creating flags due to persistence issue",
+        ) from None
+    items = [
+        FlagBatchItemResult(
+            index=index,
+            name=result.flag.name,
+            id=result.flag.id if result.stored else None,
+            error=result.error,
+        )
+        for index, result in enumerate(results)
+    ]
+    failed = sum(1 for item in items if item.error is not None)
+    if failed:
+        response.status_code = HTTPStatus.MULTI_STATUS
+    return FlagBatchResponse(created=len(items) - failed, failed=failed, results=items)
+
+
 @flags_router.patch(
     "/flags/{flag_id}",
     tags=["Flags"],
     name="Update an existing flag",
-    description="Update an existing feature flag",
+    description="Update an existing feature flag. Send the `ETag` of the flag in `If-Match` "
+    "to only update it while nobody else did, a `412` means it changed in between",
     response_model=FlagResponse,
     status_code=HTTPStatus.OK,
 )
 async def update_flag(
     flag_id: str,
     updated_fields: FlagUpdateRequest,
+    response: Response,
     flagbit: Annotated[FlagBitService, Depends(get_flag_bit_service)],
+    if_match: Annotated[str | None, Header()] = None,
 ) -> Flag:
+    # `If-Match: *` only asks for the flag to exist, any other tag must be its version.
+    expected_version = version_from_etag(if_match) if if_match is not None else None
+    if if_match is not None and if_match.strip() != "*" and expected_version is None:
+        raise HTTPException(
+            status_code=HTTPStatus.PRECONDITION_FAILED, detail="Flag version does not match"
+        )
     try:
-        return await flagbit.update_flag(
+        flag = await flagbit.update_flag(
             flag_id=flag_id,
             updated_fields=cast(
                 "FlagAllowedUpdates", updated_fields.model_dump(exclude_unset=True)
             ),
+            expected_version=expected_version,
         )
     except FlagNotFoundError:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Flag not found")  # noqa: B904
+    except FlagVersionConflictError as e:
+        raise HTTPException(status_code=HTTPStatus.PRECONDITION_FAILED, detail=str(e)) from None
+    except FlagAlreadyExistsError as e:
+        raise HTTPException(status_code=HTTPStatus.CONFLICT, detail=str(e)) from None
     except FlagPersistenceError:
         raise HTTPException(
             status_code=HTTPStatus.SERVICE_UNAVAILABLE,
             detail="Error deleting flag due to persistence issue",
         ) from None
+    response.headers["ETag"] = version_etag(flag.version)
+    return flag
 
 
 @flags_router.delete(
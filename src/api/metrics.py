@@ -0,0 +1,79 @@
+"""
+Pure ASGI middleware recording the latency and status code of every request,
+and the scrape time collector of the app level caches, snapshot, event hub and circuit breaker.
+"""
+
+import time
+from collections.abc import Callable
+
+from starlette.datastructures import State
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.metrics import (
+    CACHE_ENTRIES,
+    CACHE_EVENTS,
+    CIRCUIT_BREAKER_STATE,
+    EVENT_SUBSCRIBERS,
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    SNAPSHOT_AGE,
+    SNAPSHOT_REVISION,
+)
+
+# Requests that matched no route share one label, so random paths cannot grow the series.
+UNMATCHED_ROUTE = "unmatched"
+CIRCUIT_OPEN_GAUGE = {"closed": 0.0, "half_open": 0.5, "open": 1.0}
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router leaves the matched route in the scope, its path is the route template.
+            route = scope.get("route")
+            path = getattr(route, "path", UNMATCHED_ROUTE)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], path)
+            HTTP_REQUESTS.inc(scope["method"], path, str(status))
+
+
+def app_state_collector(state: State) -> Callable[[], None]:
+    """
+    A collector refreshing the gauges of the caches, the snapshot, the event hub
+    and the circuit breaker kept on the app `state`, called on every scrape.
+    """
+
+    def collect() -> None:
+        for name in ("flags_cache", "flags_pages_cache"):
+            if (cache := getattr(state, name, None)) is not None:
+                stats = cache.stats
+                CACHE_ENTRIES.set(stats.size, name)
+                CACHE_EVENTS.follow(stats.hits, name, "hit")
+                CACHE_EVENTS.follow(stats.misses, name, "miss")
+                CACHE_EVENTS.follow(stats.evictions, name, "eviction")
+        manager = getattr(state, "flag_snapshot", None)
+        if manager is not None and (snapshot := manager.current) is not None:
+            SNAPSHOT_REVISION.set(snapshot.revision)
+            SNAPSHOT_AGE.set(time.monotonic() - snapshot.built_at)
+        if (events := getattr(state, "flag_events", None)) is not None:
+            EVENT_SUBSCRIBERS.set(len(events))
+        if (breaker := getattr(state, "circuit_breaker", None)) is not None:
+            CIRCUIT_BREAKER_STATE.set(CIRCUIT_OPEN_GAUGE[breaker.state])
+
+    return collect
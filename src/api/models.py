@@ -1,12 +1,39 @@
 from datetime import datetime
+from typing import Annotated
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from src.domain.rollout import MAX_ROLLOUT_USERS
+
+RolloutPercentage = Annotated[float, Field(ge=0, le=100)]
 
 
 class FlagRequest(BaseModel):
     name: str
     value: bool
     desc: str | None = None
+    rollout_percentage: RolloutPercentage | None = None
+
+
+class FlagBatchRequest(BaseModel):
+    flags: list[FlagRequest] = Field(min_length=1, max_length=1000)
+
+
+class FlagBatchItemResult(BaseModel):
+    index: int
+    name: str
+    id: str | None = None
+    error: str | None = None
+
+
+class FlagBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: list[FlagBatchItemResult]
+
+
+class FlagValuesRequest(BaseModel):
+    names: list[str] = Field(min_length=1, max_length=1000)
 
 
 class FlagResponse(BaseModel):
@@ -18,9 +45,25 @@ class FlagResponse(BaseModel):
     date_updated: datetime
     expiration_date: datetime | None = None
     date_created: datetime
+    revision: int
+    rollout_percentage: float | None = None
+    version: int
 
 
 class FlagUpdateRequest(BaseModel):
     name: str | None = None
     value: bool | None = None
     desc: str | None = None
+    rollout_percentage: RolloutPercentage | None = None
+
+
+class FlagEvaluationRequest(BaseModel):
+    user_ids: list[Annotated[str, Field(max_length=256)]] = Field(
+        min_length=1, max_length=MAX_ROLLOUT_USERS
+    )
+
+
+class FlagChangesResponse(BaseModel):
+    revision: int
+    flags: list[FlagResponse]
+    deleted: list[str]
@@ -30,22 +30,29 @@
 
  async function fetchFlags() {
      try {
-         const res = await fetch('/flags', {
-             method: 'GET',
-             headers: {
-                 'Accept': 'application/json'
-             },
-             credentials: 'same-origin'
-         });
-         if (!res.ok) {
-             const txt = await res.text().catch(() => '');
-             console.error('fetchFlags failed', res.status, res.statusText, txt);
-             showToast('Failed to load flags', 'danger');
-             return;
-         }
-         const data = await res.json();
+         const allFlags = [];
+         let after = null;
+         do {
+             const url = after ? `/flags?limit=1000&after=${encodeURIComponent(after)}` : '/flags?limit=1000';
+             const res = await fetch(url, {
+                 method: 'GET',
+                 headers: {
+                     'Accept': 'application/json'
+                 },
+                 credentials: 'same-origin'
+             });
+             if (!res.ok) {
+                 const txt = await res.text().catch(() => '');
+                 console.error('fetchFlags failed', res.status, res.statusText, txt);
+                 showToast('Failed to load flags', 'danger');
+                 return;
+             }
+             const data = await res.json();
+             if (Array.isArray(data)) allFlags.push(...data);
+             after = res.headers.get('X-Next-Cursor');
+         } while (after);
          flags.length = 0;
-         if (Array.isArray(data)) flags.push(...data);
+         flags.push(...allFlags);
          renderFlags();
      } catch (err) {
          console.error(err);
@@ -53,6 +60,31 @@
      }
  }
 
+ // Keep the flags in sync with the server through Server-Sent Events,
+ // the browser reconnects on its own and resumes after the last event id.
+ function subscribeToFlagEvents() {
+     const source = new EventSource('/flags/stream');
+     const upsertFlag = (e) => {
+         const flag = JSON.parse(e.data);
+         const index = flags.findIndex(f => f.id === flag.id);
+         if (index === -1) flags.push(flag);
+         else flags[index] = flag;
+         renderFlags();
+     };
+     source.addEventListener('created', upsertFlag);
+     source.addEventListener('updated', upsertFlag);
+     source.addEventListener('expired', upsertFlag);
+     source.addEventListener('deleted', (e) => {
+         const { id } = JSON.parse(e.data);
+         const index = flags.findIndex(f => f.id === id);
+         if (index !== -1) flags.splice(index, 1);
+         renderFlags();
+     });
+     // Some events were missed, reload every flag.
+     source.addEventListener('reset', () => fetchFlags());
+     return source;
+ }
+
  async function createFlagAPI(payload) {
      try {
          const res = await fetch('/flags', {
@@ -71,7 +103,6 @@
          }
          showToast(`Flag "${payload.name}" created`, 'primary');
          bootstrap.Collapse.getOrCreateInstance(document.getElementById('collapseCreate')).hide();
-         await fetchFlags();
          return true;
      } catch (err) {
          console.error(err);
@@ -97,7 +128,6 @@
              return false;
          }
          showToast('Flag updated', 'info');
-         await fetchFlags();
          return true;
      } catch (err) {
          console.error(err);
@@ -119,7 +149,6 @@
              return false;
          }
          showToast('Flag deleted', 'warning');
-         await fetchFlags();
          return true;
      } catch (err) {
          console.error(err);
@@ -148,7 +177,6 @@
              return false;
          }
          showToast(`Flag ${name} ${value ? 'ON' : 'OFF'}`, value ? 'success' : 'danger');
-         await fetchFlags();
          return true;
      } catch (err) {
          console.error(err);
@@ -331,5 +359,6 @@
 
  document.addEventListener('DOMContentLoaded', () => {
      document.querySelector('.btn-retro-filter[data-value="all"]').classList.add('active');
+     subscribeToFlagEvents();
      fetchFlags();
  });
\ No newline at end of file
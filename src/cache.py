@@ -0,0 +1,121 @@
+"""
+A small in-process `TTL` cache with `LRU` eviction.
+"""
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from pydantic_settings import BaseSettings
+
+
+class CacheConfig(BaseSettings):
+    enabled: bool = True
+    maxsize: int = 10_000
+    ttl_seconds: float = 30.0
+    # Encoded `GET /flags` pages, keyed by their `ETag`.
+    pages_maxsize: int = 256
+
+    class Config:
+        env_prefix = "FLAGBIT_CACHE_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+    maxsize: int = 0
+
+
+class TTLCache[K, V]:
+    """
+    Bounded mapping where every entry lives for at most `ttl_seconds`.
+    When the cache is full, the least recently used entry is evicted.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10_000,
+        ttl_seconds: float = 30.0,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if maxsize <= 0:
+            msg = "Cache `maxsize` must be a positive integer."
+            raise ValueError(msg)
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._timer = timer
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @classmethod
+    def from_config(cls, config: CacheConfig | None = None) -> "TTLCache[K, V]":
+        config = config or CacheConfig()
+        return cls(maxsize=config.maxsize, ttl_seconds=config.ttl_seconds)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > self._timer()
+
+    def get(self, key: K) -> V | None:
+        """
+        Return the cached value for `key`, or `None` if it is missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self._timer():
+            del self._entries[key]
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return value
+
+    def set(self, key: K, value: V, ttl_seconds: float | None = None) -> None:
+        """
+        Insert or refresh `key` for `ttl_seconds`, the cache TTL by default,
+        evicting the least recently used entry if the cache is full.
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (self._timer() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def invalidate(self, key: K) -> None:
+        self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[K, V], bool]) -> None:
+        """
+        Drop every entry for which `predicate(key, value)` is true.
+        """
+        for key in [key for key, (_, value) in self._entries.items() if predicate(key, value)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            size=len(self._entries),
+            maxsize=self.maxsize,
+        )
@@ -0,0 +1,362 @@
+"""
+Load test the flagbit API and write throughput and latency percentiles as JSON.
+
+The app is driven in-process through its ASGI interface, or over HTTP through a
+local uvicorn server, backed by the `FakeInMemoryRepo`, by MongoDB (point `URI` and `DB`
+at a throwaway database, e.g. the one from `make up`) or by a SQL database
+(`FLAGBIT_SQL_URL`, a local SQLite file by default). Against MongoDB every scenario also
+reports the commands, each one a round trip to the server, it takes per request.
+
+    python -m src.cli.benchmark --backend memory --transport asgi --concurrency 32
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator, Callable
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Literal
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from loguru import logger
+from pymongo import monitoring
+
+from src.api.app import app, lifespan
+from src.api.dependencies import get_flags_repo, get_read_only_flags_repo
+from src.repo.fake_repo import FakeInMemoryRepo
+
+BACKEND_T = Literal["memory", "mongo", "sql"]
+TRANSPORT_T = Literal["asgi", "uvicorn"]
+
+SEED_BATCH_SIZE = 1000
+
+# A request is a method, a url and an optional JSON body.
+type BenchRequest = tuple[str, str, dict[str, Any] | None]
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int
+    errors: int
+    duration_seconds: float
+    throughput_rps: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+    # MongoDB commands sent per request, each one a round trip, background polls included.
+    mongo_commands_per_request: float | None = None
+
+
+@dataclass
+class BenchDataset:
+    names: list[str]
+    ids: list[str]
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+    Count the commands sent to MongoDB by every client created after it is registered.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:  # noqa: ARG002
+        self.count += 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def scenarios(dataset: BenchDataset, run_id: str) -> dict[str, Callable[[int], BenchRequest]]:
+    """
+    Every scenario maps the request number to the request to send.
+    """
+    return {
+        "get_value": lambda _: ("GET", f"/flags/{random.choice(dataset.names)}/value", None),  # noqa: S311
+        "get_flags": lambda _: ("GET", "/flags?limit=100", None),
+        "create_flag": lambda i: ("POST", "/flags", {"name": f"{run_id}-new-{i}", "value": True}),
+        "update_flag": lambda i: (
+            "PATCH",
+            f"/flags/{random.choice(dataset.ids)}",  # noqa: S311
+            {"value": bool(i % 2)},
+        ),
+    }
+
+
+async def run_scenario(  # noqa: PLR0913
+    client: httpx.AsyncClient,
+    name: str,
+    make_request: Callable[[int], BenchRequest],
+    requests: int,
+    concurrency: int,
+    *,
+    commands: CommandCounter | None = None,
+) -> ScenarioResult:
+    """
+    Send `requests` requests from `concurrency` workers as fast as the app answers them,
+    counting the MongoDB `commands` they take when given.
+    """
+    commands_before = commands.count if commands is not None else 0
+    counter = itertools.count()
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        while (i := next(counter)) < requests:
+            method, url, body = make_request(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, json=body)
+                failed = response.is_error
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    return ScenarioResult(
+        name=name,
+        requests=requests,
+        errors=errors,
+        duration_seconds=round(duration, 4),
+        throughput_rps=round(requests / duration, 2) if duration else 0.0,
+        p50_ms=round(statistics.median(latencies_ms), 3) if latencies_ms else 0.0,
+        p90_ms=round(percentile(latencies_ms, 90), 3),
+        p99_ms=round(percentile(latencies_ms, 99), 3),
+        max_ms=round(latencies_ms[-1], 3) if latencies_ms else 0.0,
+        mongo_commands_per_request=(
+            round((commands.count - commands_before) / requests, 2)
+            if commands is not None
+            else None
+        ),
+    )
+
+
+async def seed(client: httpx.AsyncClient, run_id: str, dataset_size: int) -> BenchDataset:
+    dataset = BenchDataset(names=[], ids=[])
+    for start in range(0, dataset_size, SEED_BATCH_SIZE):
+        batch = [
+            {"name": f"{run_id}-{i}", "value": bool(i % 2)}
+            for i in range(start, min(start + SEED_BATCH_SIZE, dataset_size))
+        ]
+        response = await client.post("/flags/batch", json={"flags": batch})
+        response.raise_for_status()
+        for item in response.json()["results"]:
+            if item["id"] is not None:
+                dataset.names.append(item["name"])
+                dataset.ids.append(item["id"])
+    return dataset
+
+
+async def cleanup(client: httpx.AsyncClient, run_id: str, concurrency: int) -> None:
+    """
+    Delete every flag created by this run, so a shared database is left as it was.
+    """
+    ids: list[str] = []
+    after: str | None = None
+    while True:
+        params = {"limit": 1000} | ({"after": after} if after else {})
+        response = await client.get("/flags", params=params)
+        ids.extend(flag["id"] for flag in response.json() if flag["name"].startswith(run_id))
+        if (after := response.headers.get("X-Next-Cursor")) is None:
+            break
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def delete(flag_id: str) -> None:
+        async with semaphore:
+            await client.delete(f"/flags/{flag_id}")
+
+    await asyncio.gather(*(delete(flag_id) for flag_id in ids))
+
+
+@contextlib.asynccontextmanager
+async def bench_app(backend: BACKEND_T, transport: TRANSPORT_T) -> AsyncIterator[FastAPI]:
+    """
+    The real app, with its repo swapped for a `FakeInMemoryRepo` or started against the
+    storage `backend`. Behind uvicorn, the server runs the lifespan on its own event loop.
+    """
+    if backend != "memory":
+        os.environ["FLAGBIT_STORAGE_BACKEND"] = backend
+    if backend == "memory":
+        repo = FakeInMemoryRepo()
+        app.dependency_overrides[get_flags_repo] = lambda: repo
+        app.dependency_overrides[get_read_only_flags_repo] = lambda: repo
+        try:
+            yield app
+        finally:
+            app.dependency_overrides.clear()
+    elif transport == "uvicorn":
+        yield app
+    else:
+        async with lifespan(app):
+            yield app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+@contextlib.asynccontextmanager
+async def bench_client(
+    target: FastAPI, backend: BACKEND_T, transport: TRANSPORT_T, concurrency: int
+) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    A client for `target`, in-process or through a uvicorn server running in its own thread,
+    so the load generator and the app do not share an event loop.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if transport == "asgi":
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=target), base_url="http://bench", limits=limits
+        ) as client:
+            yield client
+        return
+
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(
+            target,
+            host="127.0.0.1",
+            port=port,
+            lifespan="off" if backend == "memory" else "on",
+            log_level="warning",
+        )
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    # `started` is set from the server thread, there is no event to wait on.
+    while not server.started:  # noqa: ASYNC110
+        await asyncio.sleep(0.01)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30
+        ) as client:
+            yield client
+    finally:
+        server.should_exit = True
+        await asyncio.to_thread(thread.join)
+
+
+def git_commit() -> str | None:
+    with contextlib.suppress(OSError, subprocess.CalledProcessError):
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],  # noqa: S607
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    return None
+
+
+async def run_benchmark(  # noqa: PLR0913
+    *,
+    backend: BACKEND_T,
+    transport: TRANSPORT_T,
+    concurrency: int,
+    dataset_size: int,
+    requests: int,
+    only: list[str] | None = None,
+) -> dict[str, Any]:
+    run_id = f"bench-{uuid.uuid4().hex[:8]}"
+    results: list[ScenarioResult] = []
+    commands = None
+    if backend == "mongo":
+        # Registered before the app creates its client, so it is listened to.
+        commands = CommandCounter()
+        monitoring.register(commands)
+    async with (
+        bench_app(backend, transport) as target,
+        bench_client(target, backend, transport, concurrency) as client,
+    ):
+        dataset = await seed(client, run_id, dataset_size)
+        try:
+            for name, make_request in scenarios(dataset, run_id).items():
+                if only and name not in only:
+                    continue
+                result = await run_scenario(
+                    client, name, make_request, requests, concurrency, commands=commands
+                )
+                logger.info(
+                    f"{name}: {result.throughput_rps} req/s, p50 {result.p50_ms} ms, "
+                    f"p99 {result.p99_ms} ms, {result.errors} errors"
+                )
+                results.append(result)
+        finally:
+            if backend != "memory":
+                await cleanup(client, run_id, concurrency)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "backend": backend,
+            "transport": transport,
+            "concurrency": concurrency,
+            "dataset_size": dataset_size,
+            "requests": requests,
+            "timestamp": datetime.now(tz=UTC).isoformat(),
+        },
+        "scenarios": {result.name: asdict(result) for result in results},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", choices=["memory", "mongo", "sql"], default="memory")
+    parser.add_argument("--transport", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--dataset-size", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--scenario", action="append", help="Only run these scenarios")
+    parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        run_benchmark(
+            backend=args.backend,
+            transport=args.transport,
+            concurrency=args.concurrency,
+            dataset_size=args.dataset_size,
+            requests=args.requests,
+            only=args.scenario,
+        )
+    )
+    args.output.write_text(json.dumps(report, indent=2) + "\n")
+    logger.info(f"Benchmark results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
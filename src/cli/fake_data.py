@@ -20,7 +20,7 @@ def create_fake_flags(num_flags: int = 10) -> list[Flag]:
     flags = []
     for _ in range(num_flags):
         flag = Flag(
-            name=fake.word(),
+            name=fake.unique.word(),
             desc=fake.sentence(),
             value=fake.boolean(),
             date_created=fake.date_time(),
@@ -41,8 +41,9 @@ def store_fake_flags(flags: list[Flag]) -> None:
         mongo_client = MongoDBAsyncClient()
         await mongo_client.connect()
         store = DocStoreRepo(client=mongo_client)
-        for flag in flags:
-            await store.store(flag)
+        for result in await store.store_many(flags):
+            if not result.stored:
+                logger.warning(f"Skipped flag `{result.flag.name}`: {result.error}")
 
     asyncio.run(_store())
     logger.info("Finished storing fake flags.")
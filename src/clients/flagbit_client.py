@@ -0,0 +1,161 @@
+"""
+Async Python SDK for the flagbit API.
+
+Flags are fetched once at startup and kept in sync in the background through
+`GET /flags/changes`, so `is_enabled` is a local, in-memory lookup.
+
+    async with FlagBitClient() as flagbit:
+        if flagbit.is_enabled("new_checkout"):
+            ...
+"""
+
+import asyncio
+import contextlib
+from datetime import datetime
+from types import TracebackType
+from typing import Any, Self
+
+import httpx
+from loguru import logger
+from pydantic_settings import BaseSettings
+from pytz import utc
+
+from src.domain.rollout import in_rollout
+
+
+class FlagBitClientConfig(BaseSettings):
+    base_url: str = "http://localhost:8000"
+    refresh_interval_seconds: float = 10.0
+    timeout_seconds: float = 5.0
+    max_connections: int = 10
+
+    class Config:
+        env_prefix = "FLAGBIT_CLIENT_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+class FlagBitClient:
+    def __init__(
+        self,
+        config: FlagBitClientConfig | None = None,
+        http_client: httpx.AsyncClient | None = None,
+    ) -> None:
+        self.config = config or FlagBitClientConfig()
+        self._owns_http_client = http_client is None
+        self._http = http_client or httpx.AsyncClient(
+            base_url=self.config.base_url,
+            timeout=self.config.timeout_seconds,
+            limits=httpx.Limits(max_connections=self.config.max_connections),
+        )
+        self.revision = 0
+        # name -> (value, expiration date, id, rollout percentage),
+        # replaced as a whole on every change.
+        self._values: dict[str, tuple[bool, datetime | None, str, float | None]] = {}
+        self._names: dict[str, str] = {}
+        self._task: asyncio.Task[None] | None = None
+
+    async def __aenter__(self) -> Self:
+        await self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        """
+        Fetch every flag and start refreshing them in the background.
+        raises: `httpx.HTTPError` if the initial fetch fails.
+        """
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._owns_http_client:
+            await self._http.aclose()
+
+    def is_enabled(
+        self,
+        name: str,
+        default: bool = False,  # noqa: FBT001, FBT002
+        user_id: str | None = None,
+    ) -> bool:
+        """
+        Evaluate a flag locally, with the same expiry semantics as `Flag.expired`.
+        A flag with a rollout percentage is only enabled for the users in its rollout,
+        the same ones as `POST /flags/{name}/evaluate`, and disabled without a `user_id`
+        like on the server. Unknown flags evaluate to `default`.
+        """
+        if (entry := self._values.get(name)) is None:
+            return default
+        value, expiration_date, flag_id, rollout_percentage = entry
+        if expiration_date is not None and expiration_date <= datetime.now(tz=utc):
+            return False
+        if value and rollout_percentage is not None:
+            return user_id is not None and in_rollout(flag_id, user_id, rollout_percentage)
+        return value
+
+    async def refresh(self) -> None:
+        """
+        Apply everything that changed on the server since the last known revision.
+        raises: `httpx.HTTPError` if the server cannot be reached or answers with an error.
+        """
+        response = await self._http.get("/flags/changes", params={"since": self.revision})
+        response.raise_for_status()
+        self._apply_changes(response.json())
+
+    def _apply_changes(self, changes: dict[str, Any]) -> None:
+        """
+        A name only leaves `_values` with the flag holding it, as another flag may have been
+        given the name of a renamed or deleted one in the same changes.
+        """
+        if changes["flags"] or changes["deleted"]:
+            values = dict(self._values)
+            for flag_id in changes["deleted"]:
+                if (name := self._names.pop(flag_id, None)) is not None:
+                    _pop_flag_value(values, name, flag_id)
+            for flag in changes["flags"]:
+                if (old_name := self._names.get(flag["id"])) is not None:
+                    _pop_flag_value(values, old_name, flag["id"])
+                values[flag["name"]] = (
+                    flag["value"],
+                    _parse_date(flag.get("expiration_date")),
+                    flag["id"],
+                    flag.get("rollout_percentage"),
+                )
+                self._names[flag["id"]] = flag["name"]
+            self._values = values
+        self.revision = changes["revision"]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.refresh_interval_seconds)
+            try:
+                await self.refresh()
+            except httpx.HTTPError as error:
+                logger.warning(f"Flag refresh failed, keeping the last known flags: `{error}`")
+
+
+def _pop_flag_value(
+    values: dict[str, tuple[bool, datetime | None, str, float | None]], name: str, flag_id: str
+) -> None:
+    if (entry := values.get(name)) is not None and entry[2] == flag_id:
+        del values[name]
+
+
+def _parse_date(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=utc)
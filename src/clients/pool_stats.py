@@ -0,0 +1,26 @@
+"""
+Connection pool counters, kept apart from the MongoDB client so the API can
+describe them without importing the driver.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass
+class PoolStats:
+    """
+    Connection pool counters over all the pools of a worker, one pool per server.
+    """
+
+    pools: int = 0
+    max_pool_size: int = 0
+    open: int = 0
+    checked_out: int = 0
+    peak_checked_out: int = 0
+    checkouts: int = 0
+    checkout_failures: int = 0
+    # Mean time waited for a connection, pools are too small when it grows.
+    mean_checkout_seconds: float = 0.0
+    cleared: int = 0
+    # Checked out connections over the most the pools may open, from 0 to 1.
+    utilization: float = 0.0
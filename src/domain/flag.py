@@ -1,11 +1,22 @@
+import time
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 from uuid import uuid4
 
 from pytz import utc
 
+EPOCH = datetime(1970, 1, 1, tzinfo=utc)
 
-@dataclass
+
+def to_epoch_ms(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def now_epoch_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+@dataclass(slots=True)
 class Flag:
     name: str
     value: bool
@@ -15,7 +26,103 @@ class Flag:
     date_updated: datetime = field(default_factory=lambda: datetime.now(tz=utc))
 
     id: str = field(default_factory=lambda: str(uuid4()))
+    revision: int = 0
+    # Share of the users, from 0 to 100, the flag is enabled for, `None` for every user.
+    rollout_percentage: float | None = None
+    # Bumped on every update of this flag, for compare-and-set updates.
+    version: int = 1
+
+    @property
+    def cursor(self) -> tuple[datetime, str]:
+        """
+        Position of this `Flag` in the `(date_created, id)` order used for pagination.
+        """
+        return self.date_created, self.id
 
     @property
     def expired(self) -> bool:
-        return bool(self.expiration_date and self.expiration_date <= datetime.now(tz=utc))
+        return self.is_expired()
+
+    def is_expired(self, now: datetime | None = None) -> bool:
+        """
+        Whether this `Flag` has expired at `now`, pass it in when checking many `Flags` at once.
+        """
+        if self.expiration_date is None:
+            return False
+        return self.expiration_date <= (now if now is not None else datetime.now(tz=utc))
+
+    def evaluate(self, now: datetime | None = None) -> bool:
+        """
+        The value of this `Flag` at `now` without a user id, see `FlagRecord.evaluate`.
+        """
+        return self.value and not self.is_expired(now) and self.rollout_percentage is None
+
+
+@dataclass(frozen=True, slots=True)
+class FlagRecord:
+    """
+    Compact, read-only view of a `Flag` for holding and scanning many of them in memory,
+    with every timestamp as integer epoch milliseconds.
+    """
+
+    id: str
+    name: str
+    value: bool
+    expires_at: int | None
+    created_at: int
+    revision: int
+    rollout_percentage: float | None = None
+
+    @classmethod
+    def from_flag(cls, flag: Flag) -> "FlagRecord":
+        return cls(
+            id=flag.id,
+            name=flag.name,
+            value=flag.value,
+            expires_at=to_epoch_ms(flag.expiration_date) if flag.expiration_date else None,
+            created_at=to_epoch_ms(flag.date_created),
+            revision=flag.revision,
+            rollout_percentage=flag.rollout_percentage,
+        )
+
+    def is_expired(self, now: int) -> bool:
+        return self.expires_at is not None and self.expires_at <= now
+
+    def is_active(self, now: int) -> bool:
+        """
+        Whether the flag is enabled and not expired at `now`, for at least some users.
+        """
+        return self.value and not self.is_expired(now)
+
+    def evaluate(self, now: int) -> bool:
+        """
+        The value of the flag at `now` without a user id, expired flags are disabled.
+        A flag rolled out to a share of the users is disabled too, no user is known to be in it.
+        """
+        return self.is_active(now) and self.rollout_percentage is None
+
+
+@dataclass
+class FlagChanges:
+    """
+    Everything that changed after some collection `revision`:
+    the `flags` created or updated and the ids of the `deleted` ones.
+    """
+
+    revision: int
+    flags: list[Flag] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+
+
+@dataclass
+class FlagStoreResult:
+    """
+    Outcome of storing one `Flag` of a batch, `error` is `None` when it was stored.
+    """
+
+    flag: Flag
+    error: str | None = None
+
+    @property
+    def stored(self) -> bool:
+        return self.error is None
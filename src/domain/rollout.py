@@ -0,0 +1,106 @@
+"""
+Percentage rollouts: a user is in the rollout of a flag when the 32-bit FNV-1a hash of
+`{salt}:{user_id}` falls in the first `percentage` of `BUCKETS` buckets.
+The salt is the flag id, so a user keeps its bucket when the flag is renamed,
+and a flag rolled out to more users keeps every user it already had.
+
+Batches are hashed with NumPy when it is installed, one byte column at a time over
+every user id of the same length at once, and one user id at a time otherwise.
+NumPy is imported on the first batch, not with the module, as it is slow to import.
+"""
+
+from collections.abc import Sequence
+from typing import Any
+
+# NumPy once `_numpy` imported it, `None` when it is not installed.
+np: Any = ...
+
+BUCKETS = 10_000
+# Most user ids evaluated in one batch.
+MAX_ROLLOUT_USERS = 500_000
+
+FNV_OFFSET = 0x811C9DC5
+FNV_PRIME = 0x01000193
+FNV_MASK = 0xFFFFFFFF
+
+
+def fnv1a(data: bytes, state: int = FNV_OFFSET) -> int:
+    for byte in data:
+        state = ((state ^ byte) * FNV_PRIME) & FNV_MASK
+    return state
+
+
+def rollout_threshold(percentage: float) -> int:
+    """
+    How many of the `BUCKETS` buckets are in a rollout of `percentage`, from 0 to 100.
+    """
+    return round(min(max(percentage, 0.0), 100.0) * BUCKETS / 100)
+
+
+def rollout_bucket(salt: str, user_id: str) -> int:
+    return fnv1a(user_id.encode(), fnv1a(f"{salt}:".encode())) % BUCKETS
+
+
+def in_rollout(salt: str, user_id: str, percentage: float) -> bool:
+    return rollout_bucket(salt, user_id) < rollout_threshold(percentage)
+
+
+def in_rollout_batch(salt: str, user_ids: Sequence[str], percentage: float) -> list[bool]:
+    """
+    Whether each of the `user_ids` is in the rollout, in the same order.
+    """
+    threshold = rollout_threshold(percentage)
+    if threshold in {0, BUCKETS} or not user_ids:
+        return [threshold == BUCKETS] * len(user_ids)
+    if _numpy() is None:
+        salted = fnv1a(f"{salt}:".encode())
+        return [fnv1a(user_id.encode(), salted) % BUCKETS < threshold for user_id in user_ids]
+    return _in_rollout_vectorized(salt, user_ids, threshold)
+
+
+def _numpy() -> Any:  # noqa: ANN401
+    global np  # noqa: PLW0603
+    if np is ...:
+        try:
+            import numpy as np  # noqa: PLC0415
+        except ImportError:  # pragma: no cover - exercised when NumPy is not installed
+            np = None
+    return np
+
+
+def _in_rollout_vectorized(salt: str, user_ids: Sequence[str], threshold: int) -> list[bool]:
+    joined = "".join(user_ids)
+    if joined.isascii():
+        # One character is one byte, the whole batch is encoded at once.
+        data = np.frombuffer(joined.encode(), dtype=np.uint8)
+        lengths = np.fromiter(map(len, user_ids), dtype=np.int64, count=len(user_ids))
+    else:
+        encoded = [user_id.encode() for user_id in user_ids]
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+
+    # The user ids are hashed in groups of the same length, one byte column at a time,
+    # so every step is a single operation over the whole group.
+    # Rows of every group, as a slice or an index array, and their bytes, one row per user id.
+    groups: list[tuple[Any, Any]]
+    if lengths.min() == lengths.max():
+        groups = [(slice(None), data.reshape(len(lengths), int(lengths[0])))]
+    else:
+        starts = np.cumsum(lengths) - lengths
+        groups = []
+        for length in np.unique(lengths).tolist():
+            rows = np.flatnonzero(lengths == length)
+            groups.append((rows, data[starts[rows, None] + np.arange(length)]))
+
+    salted = fnv1a(f"{salt}:".encode())
+    prime = np.uint32(FNV_PRIME)
+    hashes = np.empty(len(lengths), dtype=np.uint32)
+    for rows, block in groups:
+        group_hashes = np.full(block.shape[0], salted, dtype=np.uint32)
+        for column in np.ascontiguousarray(block.T):
+            # uint32 arithmetic wraps around, like the `& FNV_MASK` of `fnv1a`.
+            group_hashes ^= column
+            group_hashes *= prime
+        hashes[rows] = group_hashes
+    in_rollout: list[bool] = (hashes % BUCKETS < threshold).tolist()
+    return in_rollout
@@ -10,10 +10,30 @@ class RepositoryConnectionError(Exception):
     pass
 
 
+class CircuitOpenError(RepositoryConnectionError):
+    pass
+
+
 class RepositoryNotFoundError(Exception):
     pass
 
 
+class RepositoryDuplicateError(Exception):
+    pass
+
+
+class RepositoryVersionConflictError(Exception):
+    pass
+
+
+class IndexDriftError(Exception):
+    pass
+
+
+class RepositoryLockedError(Exception):
+    pass
+
+
 # ####################################################
 # ### Service custom exceptions ######################
 # ####################################################
@@ -25,3 +45,15 @@ class FlagNotFoundError(Exception):
 
 class FlagPersistenceError(Exception):
     pass
+
+
+class FlagAlreadyExistsError(Exception):
+    pass
+
+
+class FlagVersionConflictError(Exception):
+    pass
+
+
+class InvalidCursorError(Exception):
+    pass
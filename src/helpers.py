@@ -1,6 +1,9 @@
+import base64
+import binascii
+import json
 from datetime import datetime, timedelta
 
-from src._types import EXP_UNIT_T
+from src._types import EXP_UNIT_T, FLAG_CURSOR_T
 
 
 def new_expiration_date(current_datetime: datetime, unit: EXP_UNIT_T, value: int) -> datetime:
@@ -16,3 +19,31 @@ def new_expiration_date(current_datetime: datetime, unit: EXP_UNIT_T, value: int
         case _:
             msg = f"Invalid time unit: {unit}"
             raise ValueError(msg)
+
+
+def encode_cursor(cursor: FLAG_CURSOR_T) -> str:
+    """
+    Encode a keyset pagination position into an opaque, url-safe string.
+    """
+    date_created, flag_id = cursor
+    raw = json.dumps([date_created.isoformat(), flag_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> FLAG_CURSOR_T:
+    """
+    Decode a string produced by `encode_cursor`.
+    raises: `ValueError` if the cursor is malformed, or its date has no timezone,
+    as it could not be compared with the aware creation dates of the flags.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date_created, flag_id = json.loads(raw)
+        position = datetime.fromisoformat(date_created), str(flag_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        msg = f"Invalid cursor: {cursor}"
+        raise ValueError(msg) from None
+    if position[0].tzinfo is None:
+        msg = f"Invalid cursor: {cursor}, its date has no timezone"
+        raise ValueError(msg)
+    return position
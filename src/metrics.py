@@ -0,0 +1,291 @@
+"""
+Minimal in-process metrics rendered in the Prometheus text exposition format.
+Recording is a dict lookup and a few additions, so it is cheap enough for every request.
+"""
+
+import bisect
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from functools import wraps
+from typing import Any
+
+type LABELS_T = tuple[str, ...]
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+
+def _format_labels(names: LABELS_T, values: LABELS_T, extra: str = "") -> str:
+    pairs = [
+        f'{name}="{value.replace("\\", "\\\\").replace('"', '\\"')}"'
+        for name, value in zip(names, values, strict=True)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: LABELS_T = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.description}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(f"{sample}\n" for sample in self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: LABELS_T = ()) -> None:
+        super().__init__(name, description, labels)
+        self._values: dict[LABELS_T, float] = {}
+        self._followed: dict[LABELS_T, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def follow(self, total: float, *label_values: str) -> None:
+        """
+        Follow a count kept elsewhere, e.g. read by a collector, adding what it grew by since
+        the last call. A lower `total` means the count started over, it is added in full.
+        """
+        last = self._followed.get(label_values, 0)
+        self.inc(*label_values, amount=total - last if total >= last else total)
+        self._followed[label_values] = total
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: LABELS_T = ()) -> None:
+        super().__init__(name, description, labels)
+        self._values: dict[LABELS_T, float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: LABELS_T = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+        # Per series: the count of every bucket (not cumulative, `+Inf` last), then the sum.
+        self._series: dict[LABELS_T, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        if (series := self._series.get(label_values)) is None:
+            series = self._series[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> Iterable[str]:
+        for label_values, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts, strict=True):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {total[0]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    Every registered metric, plus collectors called at scrape time to refresh gauges
+    whose value lives somewhere else, like the size of a cache.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def register[M: Metric](self, metric: M) -> M:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], None]) -> None:
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        return "".join(metric.render() for metric in self._metrics.values())
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.register(
+    Counter(
+        "flagbit_http_requests_total",
+        "HTTP requests by route and status code.",
+        ("method", "route", "status"),
+    )
+)
+HTTP_REQUEST_DURATION = REGISTRY.register(
+    Histogram(
+        "flagbit_http_request_duration_seconds",
+        "HTTP request latency by route.",
+        ("method", "route"),
+    )
+)
+REPO_CALL_DURATION = REGISTRY.register(
+    Histogram(
+        "flagbit_repo_call_duration_seconds",
+        "Repository call latency by repository and method.",
+        ("repo", "method"),
+    )
+)
+REPO_CALL_ERRORS = REGISTRY.register(
+    Counter(
+        "flagbit_repo_call_errors_total",
+        "Repository calls that raised, by repository, method and error.",
+        ("repo", "method", "error"),
+    )
+)
+CACHE_ENTRIES = REGISTRY.register(
+    Gauge("flagbit_cache_entries", "Entries held by each cache.", ("cache",))
+)
+CACHE_EVENTS = REGISTRY.register(
+    Counter("flagbit_cache_events_total", "Cache hits, misses and evictions.", ("cache", "event"))
+)
+SNAPSHOT_REVISION = REGISTRY.register(
+    Gauge("flagbit_snapshot_revision", "Revision of the served flag snapshot.")
+)
+SNAPSHOT_AGE = REGISTRY.register(
+    Gauge("flagbit_snapshot_age_seconds", "Seconds since the flag snapshot was built.")
+)
+EVENT_SUBSCRIBERS = REGISTRY.register(
+    Gauge("flagbit_event_subscribers", "Clients subscribed to the flag events stream.")
+)
+MONGO_POOL_CONNECTIONS = REGISTRY.register(
+    Gauge(
+        "flagbit_mongo_pool_connections",
+        "MongoDB connections, open, checked out, at most checked out and allowed, over all pools.",
+        ("state",),
+    )
+)
+MONGO_POOL_CHECKOUT_DURATION = REGISTRY.register(
+    Histogram(
+        "flagbit_mongo_pool_checkout_duration_seconds",
+        "Time spent waiting for a connection from the MongoDB pools.",
+    )
+)
+MONGO_POOL_CHECKOUT_FAILURES = REGISTRY.register(
+    Counter(
+        "flagbit_mongo_pool_checkout_failures_total",
+        "Failed MongoDB connection checkouts by reason.",
+        ("reason",),
+    )
+)
+MONGO_POOL_CLEARED = REGISTRY.register(
+    Counter("flagbit_mongo_pool_cleared_total", "Times a MongoDB pool was cleared.")
+)
+CIRCUIT_BREAKER_STATE = REGISTRY.register(
+    Gauge(
+        "flagbit_circuit_breaker_open",
+        "Whether the circuit to the database is open, 1, half open, 0.5, or closed, 0.",
+    )
+)
+CIRCUIT_BREAKER_REJECTED = REGISTRY.register(
+    Counter(
+        "flagbit_circuit_breaker_rejected_total",
+        "Repository calls failed fast while the circuit to the database was open.",
+    )
+)
+STALE_RESPONSES = REGISTRY.register(
+    Counter(
+        "flagbit_stale_responses_total",
+        "Flag lookups served from the last known good flags while the database was unreachable.",
+    )
+)
+SINGLE_FLIGHT_CALLS = REGISTRY.register(
+    Counter(
+        "flagbit_single_flight_calls_total",
+        "Flag lookups by kind, run by a `leader` or `coalesced` into a lookup already in flight.",
+        ("kind", "role"),
+    )
+)
+STARTUP_DURATION = REGISTRY.register(
+    Gauge(
+        "flagbit_startup_seconds",
+        "Seconds the worker took to start serving, in the `fast` or the `checked` start mode.",
+        ("mode",),
+    )
+)
+
+
+def timed_repo_call[F: Callable[..., Awaitable[Any]]](repo: str) -> Callable[[F], F]:
+    """
+    Async decorator recording the latency of a repository method, and its errors by type.
+    """
+
+    def decorator(fn: F) -> F:
+        method = fn.__name__
+
+        @wraps(fn)
+        async def inner(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as error:
+                REPO_CALL_ERRORS.inc(repo, method, type(error).__name__)
+                raise
+            finally:
+                REPO_CALL_DURATION.observe(time.perf_counter() - started, repo, method)
+
+        return inner  # type: ignore[return-value]
+
+    return decorator
@@ -1,13 +1,38 @@
-from typing import Protocol, runtime_checkable
+from collections.abc import AsyncIterator
+from typing import Literal, Protocol, runtime_checkable
 
-from src.domain.flag import Flag
+from pydantic_settings import BaseSettings
+
+from src._types import FLAG_CURSOR_T, FLAG_UPDATES_T
+from src.domain.flag import Flag, FlagChanges, FlagStoreResult
+
+
+class StorageConfig(BaseSettings):
+    # `mongo` keeps the flags in MongoDB, `embedded` in local files through the `EmbeddedRepo`
+    # and `sql` in any async SQL database, SQLite by default, through the `SQLStoreRepo`.
+    backend: Literal["mongo", "embedded", "sql"] = "mongo"
+
+    class Config:
+        env_prefix = "FLAGBIT_STORAGE_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
 
 
 @runtime_checkable
 class FlagsShipRepo(Protocol):
     async def store(self, flag: Flag) -> None:
         """
-        Store a new Flag in the repository.
+        Store a new Flag in the repository, bumping the collection revision.
+        raises: `RepositoryDuplicateError` if a Flag with the same name already exists.
+        raises: `ServerSelectionTimeoutError` if the database server is unreachable.
+        """
+        raise NotImplementedError
+
+    async def store_many(self, flags: list[Flag]) -> list[FlagStoreResult]:
+        """
+        Store many new Flags at once, a Flag that fails does not stop the others.
+        Returns one result per Flag, in the same order.
         raises: `ServerSelectionTimeoutError` if the database server is unreachable.
         """
         raise NotImplementedError
@@ -28,33 +53,80 @@ class FlagsShipRepo(Protocol):
         """
         raise NotImplementedError
 
+    async def get_many_by_name(self, names: list[str]) -> list[Flag]:
+        """
+        Retrieve the Flags matching any of the given names in a single query.
+        Names without a matching Flag are skipped.
+        raises: `ServerSelectionTimeoutError` if the database server is unreachable.
+        """
+        raise NotImplementedError
+
     async def get_all(
         self,
         flag_name: str | None = None,
         flag_value: bool | None = None,  # noqa: FBT001
+        expired: bool | None = None,  # noqa: FBT001
         limit: int = 100,
+        after: FLAG_CURSOR_T | None = None,
     ) -> list[Flag]:
         """
-        Retrieve all Flags from the repository, up to the specified limit.
+        Retrieve all Flags from the repository ordered by `(date_created, id)`, up to the
+        specified limit, starting right after the `after` position when given.
         raises: `ServerSelectionTimeoutError` if the database server is unreachable.
         """
         raise NotImplementedError
 
+    def iter_all(self, batch_size: int = 500) -> AsyncIterator[Flag]:
+        """
+        Stream every Flag in `(date_created, id)` order, fetching `batch_size` Flags at a time.
+        raises: `RepositoryConnectionError` while iterating if the database server is unreachable.
+        """
+        raise NotImplementedError
+
     async def update(self, flag: Flag) -> Flag:
         """
-        Update an existing Flag in the repository.
+        Update an existing Flag in the repository, bumping the collection revision.
+        raises: `RepositoryDuplicateError` if another Flag already has the same name.
         raises: `ServerSelectionTimeoutError` if the database server is unreachable.
         """
         raise NotImplementedError
 
+    async def update_fields(
+        self, _id: str, fields: FLAG_UPDATES_T, expected_version: int | None = None
+    ) -> Flag:
+        """
+        Atomically set some `fields` of an existing Flag, bumping its version and the collection
+        revision, and return the updated Flag. With an `expected_version` the update only
+        applies while the Flag is still at that version.
+        raises: `RepositoryNotFoundError` if the Flag with the given ID does not exist.
+        raises: `RepositoryVersionConflictError` if the Flag is no longer at `expected_version`.
+        raises: `RepositoryDuplicateError` if another Flag already has the new name.
+        raises: `RepositoryConnectionError` if the database server is unreachable.
+        """
+        raise NotImplementedError
+
     async def delete(self, _id: str) -> None:
         """
-        Delete a Flag by its ID from the repository.
+        Delete a Flag by its ID from the repository, leaving a tombstone behind.
         raises: `RepositoryNotFoundError` if the Flag with the given ID does not exist.
         raises: `ServerSelectionTimeoutError` if the database server is unreachable.
         """
         raise NotImplementedError
 
+    async def get_revision(self) -> int:
+        """
+        Retrieve the current collection-wide revision, `0` if nothing was ever written.
+        raises: `ServerSelectionTimeoutError` if the database server is unreachable.
+        """
+        raise NotImplementedError
+
+    async def get_changes(self, since: int) -> FlagChanges:
+        """
+        Retrieve the Flags stored/updated and the ids of the Flags deleted after revision `since`.
+        raises: `ServerSelectionTimeoutError` if the database server is unreachable.
+        """
+        raise NotImplementedError
+
     async def delete_all(self) -> None:
         """
         Delete all Flags from the repository.
@@ -0,0 +1,149 @@
+"""
+Read-through cache that can sit in front of any `FlagsShipRepo`.
+"""
+
+from collections.abc import AsyncIterator
+
+from src._types import FLAG_CURSOR_T, FLAG_UPDATES_T
+from src.cache import TTLCache
+from src.domain.flag import Flag, FlagChanges, FlagStoreResult
+from src.repo.base import FlagsShipRepo
+
+
+class CachedRepo:
+    """
+    Serve `get_by_name` lookups from an in-process `TTLCache`,
+    every write goes to the wrapped repo and invalidates the affected entries.
+    """
+
+    def __init__(self, repo: FlagsShipRepo, cache: TTLCache[str, Flag]) -> None:
+        self.repo = repo
+        self.cache = cache
+
+    def _invalidate_flag(self, flag_id: str) -> None:
+        self.cache.invalidate_where(lambda _, flag: flag.id == flag_id)
+
+    async def store(self, flag: Flag) -> None:
+        """
+        Store a new Flag in the wrapped repository.
+        """
+        await self.repo.store(flag=flag)
+        self.cache.invalidate(flag.name)
+
+    async def store_many(self, flags: list[Flag]) -> list[FlagStoreResult]:
+        """
+        Store many new Flags in the wrapped repository.
+        """
+        try:
+            return await self.repo.store_many(flags=flags)
+        finally:
+            for flag in flags:
+                self.cache.invalidate(flag.name)
+
+    async def get_by_id(self, _id: str) -> Flag:
+        """
+        Retrieve a Flag by its ID from the wrapped repository.
+        """
+        return await self.repo.get_by_id(_id=_id)
+
+    async def get_by_name(self, name: str) -> Flag:
+        """
+        Retrieve a Flag by its name, hitting the wrapped repository only on a cache miss.
+        """
+        if (flag := self.cache.get(name)) is not None:
+            return flag
+        flag = await self.repo.get_by_name(name=name)
+        self.cache.set(name, flag)
+        return flag
+
+    async def get_many_by_name(self, names: list[str]) -> list[Flag]:
+        """
+        Retrieve the Flags matching the given names, sending only the cache misses
+        to the wrapped repository in a single batch.
+        """
+        flags: list[Flag] = []
+        misses: list[str] = []
+        for name in dict.fromkeys(names):
+            if (flag := self.cache.get(name)) is not None:
+                flags.append(flag)
+            else:
+                misses.append(name)
+        if misses:
+            for flag in await self.repo.get_many_by_name(names=misses):
+                self.cache.set(flag.name, flag)
+                flags.append(flag)
+        return flags
+
+    async def get_all(
+        self,
+        flag_name: str | None = None,
+        flag_value: bool | None = None,  # noqa: FBT001
+        expired: bool | None = None,  # noqa: FBT001
+        limit: int = 100,
+        after: FLAG_CURSOR_T | None = None,
+    ) -> list[Flag]:
+        """
+        Retrieve a page of Flags from the wrapped repository.
+        """
+        return await self.repo.get_all(
+            flag_name=flag_name, flag_value=flag_value, expired=expired, limit=limit, after=after
+        )
+
+    def iter_all(self, batch_size: int = 500) -> AsyncIterator[Flag]:
+        """
+        Stream every Flag from the wrapped repository.
+        """
+        return self.repo.iter_all(batch_size=batch_size)
+
+    async def update(self, flag: Flag) -> Flag:
+        """
+        Update an existing Flag, dropping any entry cached under its old or new name.
+        """
+        try:
+            return await self.repo.update(flag)
+        finally:
+            self._invalidate_flag(flag.id)
+            self.cache.invalidate(flag.name)
+
+    async def update_fields(
+        self, _id: str, fields: FLAG_UPDATES_T, expected_version: int | None = None
+    ) -> Flag:
+        """
+        Update some fields of an existing Flag, dropping any entry cached under its old name.
+        """
+        try:
+            return await self.repo.update_fields(
+                _id=_id, fields=fields, expected_version=expected_version
+            )
+        finally:
+            self._invalidate_flag(_id)
+
+    async def delete(self, _id: str) -> None:
+        """
+        Delete a Flag by its ID and drop it from the cache.
+        """
+        try:
+            await self.repo.delete(_id=_id)
+        finally:
+            self._invalidate_flag(_id)
+
+    async def get_revision(self) -> int:
+        """
+        Retrieve the current collection-wide revision from the wrapped repository.
+        """
+        return await self.repo.get_revision()
+
+    async def get_changes(self, since: int) -> FlagChanges:
+        """
+        Retrieve the changes after revision `since` from the wrapped repository.
+        """
+        return await self.repo.get_changes(since=since)
+
+    async def delete_all(self) -> None:
+        """
+        Delete all Flags and empty the cache.
+        """
+        try:
+            await self.repo.delete_all()
+        finally:
+            self.cache.clear()
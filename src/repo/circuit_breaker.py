@@ -0,0 +1,243 @@
+"""
+Circuit breaker that can sit in front of any `FlagsShipRepo`.
+
+After `failure_threshold` failures in a row the circuit opens and every call
+fails right away with `CircuitOpenError`, instead of waiting out the database timeout.
+Once `reset_timeout_seconds` have passed, up to `half_open_max_calls` calls are let through
+to probe the database: a success closes the circuit again, a failure opens it again.
+"""
+
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any, Literal
+
+from pydantic_settings import BaseSettings
+
+from src._types import FLAG_CURSOR_T, FLAG_UPDATES_T
+from src.domain.flag import Flag, FlagChanges, FlagStoreResult
+from src.exceptions import (
+    CircuitOpenError,
+    RepositoryDuplicateError,
+    RepositoryNotFoundError,
+    RepositoryVersionConflictError,
+)
+from src.metrics import CIRCUIT_BREAKER_REJECTED
+from src.repo.base import FlagsShipRepo
+
+CIRCUIT_STATE_T = Literal["closed", "open", "half_open"]
+
+# Answers of a healthy database, every other error counts as a failure.
+DOMAIN_ERRORS = (RepositoryNotFoundError, RepositoryDuplicateError, RepositoryVersionConflictError)
+
+
+class CircuitBreakerConfig(BaseSettings):
+    enabled: bool = True
+    # Failures in a row, any error but the `DOMAIN_ERRORS`, that open the circuit.
+    failure_threshold: int = 5
+    # How long the circuit stays open before probing the database again.
+    reset_timeout_seconds: float = 5.0
+    # Calls let through at once to probe the database while half open.
+    half_open_max_calls: int = 1
+    # Last known good flags served while the database is unreachable, and for how long.
+    stale_maxsize: int = 10_000
+    stale_max_age_seconds: float = 3600.0
+
+    class Config:
+        env_prefix = "FLAGBIT_CIRCUIT_BREAKER_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+class CircuitBreaker:
+    """
+    The state of the circuit, shared by every request of a worker.
+    """
+
+    def __init__(
+        self,
+        config: CircuitBreakerConfig | None = None,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.config = config or CircuitBreakerConfig()
+        self._timer = timer
+        self._state: CIRCUIT_STATE_T = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def state(self) -> CIRCUIT_STATE_T:
+        if self._state == "open" and self._timer() - self._opened_at >= (
+            self.config.reset_timeout_seconds
+        ):
+            self._state = "half_open"
+            self._probes = 0
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        raises: `CircuitOpenError` while the circuit is open, or half open with enough probes.
+        """
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and self._probes < self.config.half_open_max_calls:
+            self._probes += 1
+            return
+        CIRCUIT_BREAKER_REJECTED.inc()
+        msg = "The circuit to the database is open, failing fast."
+        raise CircuitOpenError(msg)
+
+    def on_success(self) -> None:
+        self._state = "closed"
+        self._failures = 0
+        self._probes = 0
+
+    def on_failure(self) -> None:
+        self._failures += 1
+        if self._state == "half_open" or self._failures >= self.config.failure_threshold:
+            self._state = "open"
+            self._opened_at = self._timer()
+            self._probes = 0
+
+    def on_abandoned(self) -> None:
+        """
+        A call let through was cancelled before the database answered, free its probe.
+        """
+        if self._state == "half_open":
+            self._probes = max(0, self._probes - 1)
+
+    async def call[T](self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:  # noqa: ANN401
+        self.before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except DOMAIN_ERRORS:
+            # The database answered, e.g. with a missing or duplicate flag.
+            self.on_success()
+            raise
+        except Exception:
+            self.on_failure()
+            raise
+        except BaseException:
+            self.on_abandoned()
+            raise
+        self.on_success()
+        return result
+
+
+class CircuitBreakerRepo:
+    """
+    Guard every call to the wrapped repo with a `CircuitBreaker`.
+    """
+
+    def __init__(self, repo: FlagsShipRepo, breaker: CircuitBreaker) -> None:
+        self.repo = repo
+        self.breaker = breaker
+
+    async def store(self, flag: Flag) -> None:
+        """
+        Store a new Flag in the wrapped repository.
+        """
+        await self.breaker.call(self.repo.store, flag=flag)
+
+    async def store_many(self, flags: list[Flag]) -> list[FlagStoreResult]:
+        """
+        Store many new Flags in the wrapped repository.
+        """
+        return await self.breaker.call(self.repo.store_many, flags=flags)
+
+    async def get_by_id(self, _id: str) -> Flag:
+        """
+        Retrieve a Flag by its ID from the wrapped repository.
+        """
+        return await self.breaker.call(self.repo.get_by_id, _id=_id)
+
+    async def get_by_name(self, name: str) -> Flag:
+        """
+        Retrieve a Flag by its name from the wrapped repository.
+        """
+        return await self.breaker.call(self.repo.get_by_name, name=name)
+
+    async def get_many_by_name(self, names: list[str]) -> list[Flag]:
+        """
+        Retrieve the Flags with any of the given names from the wrapped repository.
+        """
+        return await self.breaker.call(self.repo.get_many_by_name, names=names)
+
+    async def get_all(
+        self,
+        flag_name: str | None = None,
+        flag_value: bool | None = None,  # noqa: FBT001
+        expired: bool | None = None,  # noqa: FBT001
+        limit: int = 100,
+        after: FLAG_CURSOR_T | None = None,
+    ) -> list[Flag]:
+        """
+        Retrieve a page of Flags from the wrapped repository.
+        """
+        return await self.breaker.call(
+            self.repo.get_all,
+            flag_name=flag_name,
+            flag_value=flag_value,
+            expired=expired,
+            limit=limit,
+            after=after,
+        )
+
+    async def iter_all(self, batch_size: int = 500) -> AsyncIterator[Flag]:
+        """
+        Stream every Flag from the wrapped repository, as a single guarded call.
+        """
+        self.breaker.before_call()
+        try:
+            async for flag in self.repo.iter_all(batch_size=batch_size):
+                yield flag
+        except Exception:
+            self.breaker.on_failure()
+            raise
+        except BaseException:
+            # Also when the stream is closed before its end.
+            self.breaker.on_abandoned()
+            raise
+        self.breaker.on_success()
+
+    async def update(self, flag: Flag) -> Flag:
+        """
+        Update an existing Flag in the wrapped repository.
+        """
+        return await self.breaker.call(self.repo.update, flag)
+
+    async def update_fields(
+        self, _id: str, fields: FLAG_UPDATES_T, expected_version: int | None = None
+    ) -> Flag:
+        """
+        Update some fields of an existing Flag in the wrapped repository.
+        """
+        return await self.breaker.call(
+            self.repo.update_fields, _id=_id, fields=fields, expected_version=expected_version
+        )
+
+    async def delete(self, _id: str) -> None:
+        """
+        Delete a Flag by its ID from the wrapped repository.
+        """
+        await self.breaker.call(self.repo.delete, _id=_id)
+
+    async def get_revision(self) -> int:
+        """
+        Retrieve the current collection-wide revision from the wrapped repository.
+        """
+        return await self.breaker.call(self.repo.get_revision)
+
+    async def get_changes(self, since: int) -> FlagChanges:
+        """
+        Retrieve the Flags changed after revision `since` from the wrapped repository.
+        """
+        return await self.breaker.call(self.repo.get_changes, since=since)
+
+    async def delete_all(self) -> None:
+        """
+        Delete every Flag from the wrapped repository.
+        """
+        await self.breaker.call(self.repo.delete_all)
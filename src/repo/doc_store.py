@@ -2,63 +2,168 @@
 Implements a document storage repo for MongoDB.
 """
 
-from collections.abc import Awaitable, Callable
-from dataclasses import asdict
-from functools import wraps
+from collections.abc import AsyncIterator, Awaitable, Callable
+from datetime import datetime
+from functools import partial, wraps
 from typing import TYPE_CHECKING, Any, TypeVar
 
 from loguru import logger
-from pymongo.errors import ServerSelectionTimeoutError
+from pymongo import ASCENDING, InsertOne, ReturnDocument
+from pymongo.errors import (
+    BulkWriteError,
+    ConnectionFailure,
+    DuplicateKeyError,
+    ExecutionTimeout,
+    OperationFailure,
+)
+from pytz import utc
 
-from src.exceptions import RepositoryConnectionError, RepositoryNotFoundError
+from src._types import FLAG_CURSOR_T, FLAG_UPDATES_T
+from src.exceptions import (
+    RepositoryConnectionError,
+    RepositoryDuplicateError,
+    RepositoryNotFoundError,
+    RepositoryVersionConflictError,
+)
+from src.metrics import timed_repo_call
 
 if TYPE_CHECKING:
+    from pymongo.asynchronous.client_session import AsyncClientSession
     from pymongo.results import DeleteResult
 
 from src.clients.mongo_db_client import MongoDBAsyncClient
-from src.domain.flag import Flag
+from src.domain.flag import Flag, FlagChanges, FlagStoreResult
 
 type MongoDBDocument = dict[str, Any]
 
 F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
 
+REVISION_COUNTER_ID = "flags_revision"
+DUPLICATE_KEY_ERROR_CODE = 11000
+# Refused transactions, "Transaction numbers are only allowed on a replica set member or mongos".
+ILLEGAL_OPERATION_ERROR_CODE = 20
+# An unreachable, slow or overloaded server: server selection, network and pool wait queue
+# timeouts, lost connections, and operations running past their time limit.
+CONNECTION_ERRORS = (ConnectionFailure, ExecutionTimeout)
+
 
 def flag_to_document(flag: Flag) -> MongoDBDocument:
     """
     Convert a Flag instance to a dictionary suitable for MongoDB storage.
     """
-    doc = asdict(flag)
-    doc["_id"] = doc.pop("id")
-    return doc
+    return {
+        "_id": flag.id,
+        "name": flag.name,
+        "value": flag.value,
+        "desc": flag.desc,
+        "expiration_date": flag.expiration_date,
+        "date_created": flag.date_created,
+        "date_updated": flag.date_updated,
+        "revision": flag.revision,
+        "rollout_percentage": flag.rollout_percentage,
+        "version": flag.version,
+    }
 
 
 def document_to_flag(doc: MongoDBDocument) -> Flag:
     """
     Convert a MongoDB document to a Flag instance.
     """
-    return Flag(id=str(doc["_id"]), **{k: v for k, v in doc.items() if k != "_id"})
+    return Flag(
+        id=str(doc["_id"]),
+        name=doc["name"],
+        value=doc["value"],
+        desc=doc.get("desc"),
+        expiration_date=doc.get("expiration_date"),
+        date_created=doc["date_created"],
+        date_updated=doc["date_updated"],
+        revision=doc.get("revision", 0),
+        rollout_percentage=doc.get("rollout_percentage"),
+        version=doc.get("version", 1),
+    )
 
 
 def handle_conn_error(fn: Callable[..., Awaitable[Any]]) -> Callable:  # type: ignore
     """
-    Async decorator to handle MongoDB connection errors.
+    Async decorator to handle MongoDB connection errors, the `CONNECTION_ERRORS`,
+    recording the latency and errors of every call.
     """
 
     @wraps(fn)
     async def inner(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
         try:
             return await fn(*args, **kwargs)
-        except ServerSelectionTimeoutError as error:
+        except CONNECTION_ERRORS as error:
             logger.error(f"Failed to connect to MongoDB server: `{error}`")
             err_msg = f"Cannot connect to MongoDB server during `{fn.__name__}`."
             raise RepositoryConnectionError(err_msg) from None
 
-    return inner  # type ignore
+    return timed_repo_call("mongo")(inner)
+
+
+def write_error_message(flag: Flag, write_error: MongoDBDocument) -> str:
+    """
+    The error reported for a `flag` rejected by a `bulk_write` with `write_error`.
+    """
+    if write_error.get("code") == DUPLICATE_KEY_ERROR_CODE:
+        return f"Flag with name: `{flag.name}` already exists."
+    return str(write_error.get("errmsg"))
 
 
 class DocStoreRepo:
-    def __init__(self, client: MongoDBAsyncClient | None = None) -> None:
+    def __init__(
+        self, client: MongoDBAsyncClient | None = None, *, read_only: bool = False
+    ) -> None:
+        """
+        A `read_only` repo serves the read only routes, its lookups use the read preference
+        configured for them and may be served by secondaries. Writes always go to the primary.
+        """
         self._client = client or MongoDBAsyncClient()
+        self.read_only = read_only
+
+    @property
+    def reads_from_secondaries(self) -> bool:
+        """
+        Whether the lookups may be served by a secondary, lagging behind the latest writes.
+        """
+        return self.read_only and self._client.reads_from_secondaries
+
+    async def _in_transaction[T](
+        self, fn: Callable[["AsyncClientSession | None"], Awaitable[T]]
+    ) -> T:
+        """
+        Run `fn` in a transaction, retried by the driver on write conflicts.
+        Every write bumps the revision counter in the same transaction as the write itself,
+        so concurrent writers take the counter one after the other and commit in revision
+        order: once the counter reads N, every write up to revision N is visible.
+        A standalone server refuses transactions, there `fn` runs without a session.
+        """
+        if not self._client.supports_transactions:
+            return await fn(None)
+        try:
+            async with self._client.start_session() as session:
+                return await session.with_transaction(fn)
+        except OperationFailure as error:
+            if error.code != ILLEGAL_OPERATION_ERROR_CODE:
+                raise
+        # Refused before anything was written, by a server `check` did not get to ask.
+        self._client.disable_transactions()
+        return await fn(None)
+
+    async def _next_revision(self, session: "AsyncClientSession | None", increment: int = 1) -> int:
+        """
+        Bump and return the collection-wide revision counter, within the `session` transaction.
+        Bumping by `increment` reserves all the revisions up to the returned one.
+        """
+        counters = self._client.get_counters_collection()
+        counter = await counters.find_one_and_update(
+            {"_id": REVISION_COUNTER_ID},
+            {"$inc": {"seq": increment}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        return int(counter["seq"])  # type: ignore[index]  # upsert always returns a document
 
     @handle_conn_error
     async def store(self, flag: Flag) -> None:
@@ -66,14 +171,80 @@ class DocStoreRepo:
         Store a new Flag document in the MongoDB collection.
         """
         coll = self._client.get_flags_collection()
-        await coll.insert_one(flag_to_document(flag=flag))
+
+        async def insert(session: "AsyncClientSession | None") -> None:
+            flag.revision = await self._next_revision(session)
+            await coll.insert_one(flag_to_document(flag=flag), session=session)
+
+        try:
+            await self._in_transaction(insert)
+        except DuplicateKeyError:
+            msg = f"Flag with name: `{flag.name}` already exists."
+            raise RepositoryDuplicateError(msg) from None
+
+    @handle_conn_error
+    async def store_many(self, flags: list[Flag]) -> list[FlagStoreResult]:
+        """
+        Store many new Flag documents with a single unordered `bulk_write`, reporting the Flags
+        whose name is taken, found up front with a single `$in` query, instead of failing the
+        whole batch. A document still rejected, e.g. taken by a concurrent write, aborts the
+        transaction, so the batch is written again without the documents rejected so far.
+        raises: `BulkWriteError` if the server rejects the batch without rejecting a document.
+        """
+        if not flags:
+            return []
+        coll = self._client.get_flags_collection()
+        errors = await self._taken_names(flags)
+
+        async def insert(session: "AsyncClientSession | None", pending: list[Flag]) -> None:
+            last_revision = await self._next_revision(session, increment=len(pending))
+            for revision, flag in enumerate(pending, start=last_revision - len(pending) + 1):
+                flag.revision = revision
+            await coll.bulk_write(
+                [InsertOne(flag_to_document(flag=flag)) for flag in pending],
+                ordered=False,
+                session=session,
+            )
+
+        while pending_indexes := [index for index in range(len(flags)) if index not in errors]:
+            pending = [flags[index] for index in pending_indexes]
+            try:
+                await self._in_transaction(partial(insert, pending=pending))
+                break
+            except BulkWriteError as error:
+                if not (write_errors := error.details.get("writeErrors")):
+                    raise
+                for write_error in write_errors:
+                    index = pending_indexes[write_error["index"]]
+                    errors[index] = write_error_message(flags[index], write_error)
+                # Without a transaction the documents that were not rejected are written.
+                if not self._client.supports_transactions:
+                    break
+
+        return [FlagStoreResult(flag=flag, error=errors.get(i)) for i, flag in enumerate(flags)]
+
+    async def _taken_names(self, flags: list[Flag]) -> dict[int, str]:
+        """
+        The error of every Flag whose name is already stored, or taken by a previous Flag
+        of the same batch, by index, with a single `$in` query.
+        """
+        coll = self._client.get_flags_collection()
+        names = [flag.name for flag in flags]
+        documents = await coll.find({"name": {"$in": names}}, {"name": 1}).to_list(None)
+        taken = {document["name"] for document in documents}
+        errors = {}
+        for index, flag in enumerate(flags):
+            if flag.name in taken:
+                errors[index] = f"Flag with name: `{flag.name}` already exists."
+            taken.add(flag.name)
+        return errors
 
     @handle_conn_error
     async def get_by_id(self, _id: str) -> Flag:
         """
         Retrieve a Flag document by its ID from the MongoDB collection.
         """
-        coll = self._client.get_flags_collection()
+        coll = self._client.get_flags_collection(read_only=self.read_only)
         if document := await coll.find_one({"_id": _id}):
             return document_to_flag(doc=document)
         msg = f"Flag with id: `{_id}` not found."
@@ -84,57 +255,209 @@ class DocStoreRepo:
         """
         Retrieve a Flag document by its name from the MongoDB collection.
         """
-        coll = self._client.get_flags_collection()
+        coll = self._client.get_flags_collection(read_only=self.read_only)
         if document := await coll.find_one({"name": name}):
             return document_to_flag(doc=document)
         msg = f"Flag with name: `{name}` not found."
         raise RepositoryNotFoundError(msg)
 
+    @handle_conn_error
+    async def get_many_by_name(self, names: list[str]) -> list[Flag]:
+        """
+        Retrieve the Flag documents matching any of the given names with a single `$in` query.
+        """
+        coll = self._client.get_flags_collection(read_only=self.read_only)
+        documents = await coll.find({"name": {"$in": names}}).to_list(None)
+        return [document_to_flag(doc=document) for document in documents]
+
     @handle_conn_error
     async def get_all(
         self,
         flag_name: str | None = None,
         flag_value: bool | None = None,  # noqa: FBT001
+        expired: bool | None = None,  # noqa: FBT001
         limit: int = 100,
+        after: FLAG_CURSOR_T | None = None,
     ) -> list[Flag]:
         """
-        Retrieve all Flag documents from the MongoDB collection, up to the specified limit.
+        Retrieve all Flag documents from the MongoDB collection ordered by `(date_created, _id)`,
+        up to the specified limit, starting right after the `after` position when given.
         """
-        coll = self._client.get_flags_collection()
-        filters: dict[str, str | bool] = {}
+        coll = self._client.get_flags_collection(read_only=self.read_only)
+        filters: list[MongoDBDocument] = []
         if flag_name is not None:
-            filters["name"] = flag_name
+            filters.append({"name": flag_name})
         if flag_value is not None:
-            filters["value"] = flag_value
+            filters.append({"value": flag_value})
+        if expired is not None:
+            now = datetime.now(tz=utc)
+            if expired:
+                filters.append({"expiration_date": {"$lte": now}})
+            else:
+                filters.append(
+                    {"$or": [{"expiration_date": None}, {"expiration_date": {"$gt": now}}]}
+                )
+        if after is not None:
+            date_created, _id = after
+            filters.append(
+                {
+                    "$or": [
+                        {"date_created": {"$gt": date_created}},
+                        {"date_created": date_created, "_id": {"$gt": _id}},
+                    ]
+                }
+            )
+        query = {"$and": filters} if filters else {}
 
-        logger.debug(f"Filtering flags with: {filters}")
-        documents = await coll.find(filters).to_list(limit)
+        logger.debug(f"Filtering flags with: {query}")
+        documents = await coll.find(
+            query, sort=[("date_created", ASCENDING), ("_id", ASCENDING)], limit=limit
+        ).to_list(limit)
 
         return [document_to_flag(doc=document) for document in documents]
 
+    async def iter_all(self, batch_size: int = 500) -> AsyncIterator[Flag]:
+        """
+        Stream every Flag document from the MongoDB collection through the async cursor,
+        holding at most one batch of `batch_size` documents in memory.
+        """
+        coll = self._client.get_flags_collection(read_only=self.read_only)
+        cursor = coll.find(
+            {}, sort=[("date_created", ASCENDING), ("_id", ASCENDING)], batch_size=batch_size
+        )
+        try:
+            async for document in cursor:
+                yield document_to_flag(doc=document)
+        except CONNECTION_ERRORS as error:
+            logger.error(f"Failed to connect to MongoDB server: `{error}`")
+            err_msg = "Cannot connect to MongoDB server during `iter_all`."
+            raise RepositoryConnectionError(err_msg) from None
+        finally:
+            await cursor.close()
+
     @handle_conn_error
     async def update(self, flag: Flag) -> Flag:
         """
         Update an existing Flag document in the MongoDB collection.
         """
         collection = self._client.get_flags_collection()
-        result = await collection.replace_one({"_id": str(flag.id)}, flag_to_document(flag))
+        flag.version += 1
+
+        async def replace(session: "AsyncClientSession | None") -> Any:  # noqa: ANN401
+            flag.revision = await self._next_revision(session)
+            return await collection.replace_one(
+                {"_id": str(flag.id)}, flag_to_document(flag), session=session
+            )
+
+        try:
+            result = await self._in_transaction(replace)
+        except DuplicateKeyError:
+            msg = f"Flag with name: `{flag.name}` already exists."
+            raise RepositoryDuplicateError(msg) from None
         if result.matched_count == 0:
             err_msg = f"Flag with id: `{flag.id}` not found for update."
             raise RepositoryNotFoundError(err_msg)
 
         return flag
 
+    @handle_conn_error
+    async def update_fields(
+        self, _id: str, fields: FLAG_UPDATES_T, expected_version: int | None = None
+    ) -> Flag:
+        """
+        Set some fields of an existing Flag document and return the updated document,
+        matching on `expected_version` too when given, in a single `find_one_and_update`
+        in the same transaction as its revision, so a failed update takes no revision.
+        The update is a pipeline so documents stored before versioning start from version 1.
+        It takes three round trips, the counter bump, the update and the commit: an update
+        pipeline only reads the updated document, so it cannot take the revision itself.
+        """
+        collection = self._client.get_flags_collection()
+        query: MongoDBDocument = {"_id": _id}
+        if expected_version is not None:
+            # A missing `version` is read as version 1.
+            query["version"] = {"$in": [1, None]} if expected_version == 1 else expected_version
+        new_values = {key: {"$literal": value} for key, value in fields.items()}
+
+        async def update(session: "AsyncClientSession | None") -> Flag:
+            revision = await self._next_revision(session)
+            doc = await collection.find_one_and_update(
+                query,
+                [
+                    {
+                        "$set": new_values
+                        | {
+                            "revision": revision,
+                            "version": {"$add": [{"$ifNull": ["$version", 1]}, 1]},
+                        }
+                    }
+                ],
+                return_document=ReturnDocument.AFTER,
+                session=session,
+            )
+            if doc is not None:
+                return document_to_flag(doc)
+            # Only a failed update pays for a second query, to tell the two failures apart.
+            current = await collection.find_one({"_id": _id}, {"version": 1}, session=session)
+            if current is None:
+                err_msg = f"Flag with id: `{_id}` not found for update."
+                raise RepositoryNotFoundError(err_msg)
+            err_msg = (
+                f"Flag with id: `{_id}` is at version {current.get('version', 1)}, "
+                f"not {expected_version}."
+            )
+            raise RepositoryVersionConflictError(err_msg)
+
+        try:
+            return await self._in_transaction(update)
+        except DuplicateKeyError:
+            msg = f"Flag with name: `{fields.get('name')}` already exists."
+            raise RepositoryDuplicateError(msg) from None
+
     @handle_conn_error
     async def delete(self, _id: str) -> None:
         """
         Delete a Flag document by its ID from the MongoDB collection.
         """
         collection = self._client.get_flags_collection()
-        result: DeleteResult = await collection.delete_one({"_id": _id})
-        if result.deleted_count == 0:
-            err_msg = f"Flag with id `{_id}` not found for deletion."
-            raise RepositoryNotFoundError(err_msg)
+        tombstones = self._client.get_tombstones_collection()
+
+        async def remove(session: "AsyncClientSession | None") -> None:
+            result: DeleteResult = await collection.delete_one({"_id": _id}, session=session)
+            if result.deleted_count == 0:
+                err_msg = f"Flag with id `{_id}` not found for deletion."
+                raise RepositoryNotFoundError(err_msg)
+            revision = await self._next_revision(session)
+            await tombstones.insert_one({"_id": _id, "revision": revision}, session=session)
+
+        await self._in_transaction(remove)
+
+    @handle_conn_error
+    async def get_revision(self) -> int:
+        """
+        Retrieve the current collection-wide revision from the counters collection.
+        """
+        counters = self._client.get_counters_collection()
+        if counter := await counters.find_one({"_id": REVISION_COUNTER_ID}):
+            return int(counter["seq"])
+        return 0
+
+    @handle_conn_error
+    async def get_changes(self, since: int) -> FlagChanges:
+        """
+        Retrieve the Flag documents and tombstones with a revision greater than `since`.
+        The revision is read first, and writes commit in revision order, so a change racing
+        with this call is sent again on the next poll rather than skipped.
+        """
+        revision = await self.get_revision()
+        changed = {"revision": {"$gt": since}}
+        documents = await self._client.get_flags_collection().find(changed).to_list(None)
+        tombstones = await self._client.get_tombstones_collection().find(changed).to_list(None)
+        return FlagChanges(
+            revision=revision,
+            flags=[document_to_flag(doc=document) for document in documents],
+            deleted=[str(tombstone["_id"]) for tombstone in tombstones],
+        )
 
     @handle_conn_error
     async def delete_all(self) -> None:
@@ -142,6 +465,17 @@ class DocStoreRepo:
         Delete all Flag documents from the MongoDB collection.
         """
         collection = self._client.get_flags_collection()
-        result: DeleteResult = await collection.delete_many({})
-        if result.deleted_count == 0:
-            logger.warning("No documents found to delete.")
+        tombstones = self._client.get_tombstones_collection()
+
+        async def remove_all(session: "AsyncClientSession | None") -> None:
+            ids = await collection.distinct("_id", session=session)
+            result: DeleteResult = await collection.delete_many({}, session=session)
+            if result.deleted_count == 0:
+                logger.warning("No documents found to delete.")
+                return
+            revision = await self._next_revision(session)
+            await tombstones.insert_many(
+                [{"_id": _id, "revision": revision} for _id in ids], session=session
+            )
+
+        await self._in_transaction(remove_all)
@@ -0,0 +1,515 @@
+"""
+Implements an embedded, persistent repo for small deployments and edge nodes.
+
+Flags live in memory with secondary indexes, every write is appended to a log file
+and the log is compacted into a snapshot file every `compact_every` writes.
+On start the snapshot is loaded and the log replayed on top of it.
+A single process can open a data directory: it holds a lock on it until closed.
+"""
+
+import bisect
+import copy
+import dataclasses
+import fcntl
+import json
+import os
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, TextIO
+
+from loguru import logger
+from pydantic_settings import BaseSettings
+from pytz import utc
+
+from src._types import FLAG_CURSOR_T, FLAG_UPDATES_T
+from src.domain.flag import Flag, FlagChanges, FlagStoreResult
+from src.exceptions import (
+    RepositoryDuplicateError,
+    RepositoryLockedError,
+    RepositoryNotFoundError,
+    RepositoryVersionConflictError,
+)
+from src.metrics import timed_repo_call
+
+LOCK_FILE = "flags.lock"
+LOG_FILE = "flags.log"
+SNAPSHOT_FILE = "flags.snapshot.json"
+
+# Sorts after every flag id, so `(now, MAX_ID)` is right after every expiration at `now`.
+MAX_ID = "\U0010ffff"
+
+
+class EmbeddedRepoConfig(BaseSettings):
+    data_dir: Path = Path("data")
+    # Compact the log into a new snapshot after this many writes.
+    compact_every: int = 1000
+    # `fsync` every log write, trading write latency for durability on power loss.
+    fsync: bool = False
+
+    class Config:
+        env_prefix = "FLAGBIT_EMBEDDED_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+def flag_to_record(flag: Flag) -> dict[str, Any]:
+    """
+    Convert a Flag instance to a JSON serializable dictionary for the log and snapshot files.
+    """
+    return {
+        "id": flag.id,
+        "name": flag.name,
+        "value": flag.value,
+        "desc": flag.desc,
+        "expiration_date": flag.expiration_date.isoformat() if flag.expiration_date else None,
+        "date_created": flag.date_created.isoformat(),
+        "date_updated": flag.date_updated.isoformat(),
+        "revision": flag.revision,
+        "rollout_percentage": flag.rollout_percentage,
+        "version": flag.version,
+    }
+
+
+def record_to_flag(record: dict[str, Any]) -> Flag:
+    """
+    Convert a dictionary written by `flag_to_record` back to a Flag instance.
+    """
+    expiration_date = record["expiration_date"]
+    return Flag(
+        id=record["id"],
+        name=record["name"],
+        value=record["value"],
+        desc=record["desc"],
+        expiration_date=datetime.fromisoformat(expiration_date) if expiration_date else None,
+        date_created=datetime.fromisoformat(record["date_created"]),
+        date_updated=datetime.fromisoformat(record["date_updated"]),
+        revision=record["revision"],
+        rollout_percentage=record.get("rollout_percentage"),
+        version=record.get("version", 1),
+    )
+
+
+class EmbeddedRepo:
+    """
+    Flags by id, with a name index, the `(date_created, id)` order of all flags and of
+    each value, and the flags ordered by expiration. Lookups by id or name are O(1),
+    positioning a page is O(log n); keeping the sorted indexes on writes costs a
+    binary search plus a list insert or removal.
+    Reads return copies, so callers never change the indexed flags behind the repo's back.
+    """
+
+    def __init__(self, config: EmbeddedRepoConfig | None = None) -> None:
+        self.config = config or EmbeddedRepoConfig()
+        self.revision = 0
+        self._flags: dict[str, Flag] = {}
+        self._ids_by_name: dict[str, str] = {}
+        self._order: list[FLAG_CURSOR_T] = []
+        self._order_by_value: dict[bool, list[FLAG_CURSOR_T]] = {True: [], False: []}
+        self._expirations: list[tuple[datetime, str]] = []
+        # Ids in increasing revision order, so the changes since a revision are a suffix.
+        self._revisions: OrderedDict[str, int] = OrderedDict()
+        self._tombstones: OrderedDict[str, int] = OrderedDict()
+        self._lock: IO[bytes] | None = None
+        self._log: TextIO | None = None
+        self._writes_since_compaction = 0
+        self._load()
+
+    # ####################################################
+    # #### Indexes #######################################
+    # ####################################################
+
+    def _index(self, flag: Flag) -> None:
+        self._flags[flag.id] = flag
+        self._ids_by_name[flag.name] = flag.id
+        bisect.insort(self._order, flag.cursor)
+        bisect.insort(self._order_by_value[flag.value], flag.cursor)
+        if flag.expiration_date is not None:
+            bisect.insort(self._expirations, (flag.expiration_date, flag.id))
+        self._revisions.pop(flag.id, None)
+        self._revisions[flag.id] = flag.revision
+
+    def _unindex(self, flag: Flag) -> None:
+        del self._flags[flag.id]
+        del self._ids_by_name[flag.name]
+        _remove_sorted(self._order, flag.cursor)
+        _remove_sorted(self._order_by_value[flag.value], flag.cursor)
+        if flag.expiration_date is not None:
+            _remove_sorted(self._expirations, (flag.expiration_date, flag.id))
+        del self._revisions[flag.id]
+
+    def _check_unique_name(self, flag: Flag) -> None:
+        existing_id = self._ids_by_name.get(flag.name)
+        if existing_id is not None and existing_id != flag.id:
+            error_msg = f"Flag with name: `{flag.name}` already exists."
+            raise RepositoryDuplicateError(error_msg)
+
+    def _put(self, flag: Flag) -> None:
+        if (existing := self._flags.get(flag.id)) is not None:
+            self._unindex(existing)
+        self._index(flag)
+        self.revision = max(self.revision, flag.revision)
+
+    def _remove(self, _id: str, revision: int) -> None:
+        if (existing := self._flags.get(_id)) is not None:
+            self._unindex(existing)
+        self._tombstones.pop(_id, None)
+        self._tombstones[_id] = revision
+        self.revision = max(self.revision, revision)
+
+    # ####################################################
+    # #### Persistence ###################################
+    # ####################################################
+
+    @property
+    def _log_path(self) -> Path:
+        return self.config.data_dir / LOG_FILE
+
+    @property
+    def _snapshot_path(self) -> Path:
+        return self.config.data_dir / SNAPSHOT_FILE
+
+    def _apply(self, entry: dict[str, Any]) -> None:
+        match entry["op"]:
+            case "put":
+                self._put(record_to_flag(entry["flag"]))
+            case "delete":
+                self._remove(entry["id"], entry["revision"])
+            case _:
+                msg = f"Unknown log operation: {entry['op']}"
+                raise ValueError(msg)
+
+    def _acquire_lock(self) -> None:
+        """
+        Lock the data directory, so no other process appends to the log or compacts it.
+        The lock is released by the OS if this process dies.
+        raises: `RepositoryLockedError` if another process holds it.
+        """
+        lock = (self.config.data_dir / LOCK_FILE).open("ab")
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            error_msg = (
+                f"The embedded data directory `{self.config.data_dir}` is used by another "
+                "process, it can only be opened by one: run a single worker per data directory."
+            )
+            raise RepositoryLockedError(error_msg) from None
+        self._lock = lock
+
+    def _load(self) -> None:
+        self.config.data_dir.mkdir(parents=True, exist_ok=True)
+        self._acquire_lock()
+        if self._snapshot_path.exists():
+            snapshot = json.loads(self._snapshot_path.read_text())
+            for record in snapshot["flags"]:
+                self._put(record_to_flag(record))
+            for _id, revision in snapshot["tombstones"]:
+                self._remove(_id, revision)
+            self.revision = max(self.revision, snapshot["revision"])
+        replayed = 0
+        if self._log_path.exists():
+            valid_size = 0
+            with self._log_path.open("rb") as log:
+                for line in log:
+                    try:
+                        entry = json.loads(line) if line.endswith(b"\n") else None
+                    except json.JSONDecodeError:
+                        entry = None
+                    if entry is None:
+                        break
+                    self._apply(entry)
+                    valid_size += len(line)
+                    replayed += 1
+            if valid_size < self._log_path.stat().st_size:
+                # Only the last write can be cut short, by a crash in the middle of it.
+                logger.warning(f"Dropped a partially written entry at the end of {self._log_path}.")
+                os.truncate(self._log_path, valid_size)
+        self._writes_since_compaction = replayed
+        self._log = self._log_path.open("a")
+        logger.info(
+            f"Loaded {len(self._flags)} flags at revision {self.revision} from "
+            f"{self.config.data_dir}, replaying {replayed} log entries."
+        )
+
+    def _append(self, *entries: dict[str, Any]) -> None:
+        if self._log is None:
+            msg = "The embedded repo is closed."
+            raise RuntimeError(msg)
+        self._log.write(
+            "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries)
+        )
+        self._log.flush()
+        if self.config.fsync:
+            os.fsync(self._log.fileno())
+        self._writes_since_compaction += len(entries)
+
+    def _maybe_compact(self) -> None:
+        """
+        Called once the appended entries are applied, so the snapshot includes them.
+        """
+        if self._writes_since_compaction >= self.config.compact_every:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Write every flag and tombstone to a new snapshot file and start an empty log.
+        The snapshot is written next to the old one and renamed over it, and replaying
+        entries that are already part of the snapshot is harmless, so a crash at any
+        point leaves a loadable repo behind.
+        """
+        snapshot = {
+            "revision": self.revision,
+            "flags": [
+                flag_to_record(flag)
+                for flag in sorted(self._flags.values(), key=lambda flag: flag.revision)
+            ],
+            "tombstones": list(self._tombstones.items()),
+        }
+        tmp_path = self._snapshot_path.with_suffix(".tmp")
+        with tmp_path.open("w") as tmp:
+            json.dump(snapshot, tmp, separators=(",", ":"))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        tmp_path.replace(self._snapshot_path)
+        if self._log is not None:
+            self._log.close()
+        self._log = self._log_path.open("w")
+        self._writes_since_compaction = 0
+        logger.debug(f"Compacted {len(self._flags)} flags into {self._snapshot_path}.")
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if self._lock is not None:
+            fcntl.flock(self._lock.fileno(), fcntl.LOCK_UN)
+            self._lock.close()
+            self._lock = None
+
+    # ####################################################
+    # #### FlagsShipRepo #################################
+    # ####################################################
+
+    @timed_repo_call("embedded")
+    async def store(self, flag: Flag) -> None:
+        """
+        Store a new Flag in the repository.
+        """
+        self._check_unique_name(flag)
+        flag.revision = self.revision + 1
+        stored = copy.copy(flag)
+        self._append({"op": "put", "flag": flag_to_record(stored)})
+        self._put(stored)
+        self._maybe_compact()
+
+    @timed_repo_call("embedded")
+    async def store_many(self, flags: list[Flag]) -> list[FlagStoreResult]:
+        """
+        Store many new Flags in the repository, with a single log write.
+        """
+        results = []
+        entries: list[dict[str, Any]] = []
+        batch_names: set[str] = set()
+        for flag in flags:
+            if flag.name in batch_names or self._ids_by_name.get(flag.name, flag.id) != flag.id:
+                error_msg = f"Flag with name: `{flag.name}` already exists."
+                results.append(FlagStoreResult(flag=flag, error=error_msg))
+                continue
+            batch_names.add(flag.name)
+            flag.revision = self.revision + len(entries) + 1
+            entries.append({"op": "put", "flag": flag_to_record(flag)})
+            results.append(FlagStoreResult(flag=flag))
+        if entries:
+            self._append(*entries)
+            for result in results:
+                if result.stored:
+                    self._put(copy.copy(result.flag))
+            self._maybe_compact()
+        return results
+
+    @timed_repo_call("embedded")
+    async def get_by_id(self, _id: str) -> Flag:
+        """
+        Retrieve a Flag by its ID from the repository.
+        """
+        if (flag := self._flags.get(_id)) is not None:
+            return copy.copy(flag)
+        error_msg = f"Flag with id: `{_id}` not found."
+        raise RepositoryNotFoundError(error_msg)
+
+    @timed_repo_call("embedded")
+    async def get_by_name(self, name: str) -> Flag:
+        """
+        Retrieve a Flag by its name from the repository.
+        """
+        if (_id := self._ids_by_name.get(name)) is not None:
+            return copy.copy(self._flags[_id])
+        error_msg = f"Flag with name: `{name}` not found."
+        raise RepositoryNotFoundError(error_msg)
+
+    @timed_repo_call("embedded")
+    async def get_many_by_name(self, names: list[str]) -> list[Flag]:
+        """
+        Retrieve the Flags matching any of the given names from the repository.
+        """
+        return [
+            copy.copy(self._flags[self._ids_by_name[name]])
+            for name in dict.fromkeys(names)
+            if name in self._ids_by_name
+        ]
+
+    @timed_repo_call("embedded")
+    async def get_all(
+        self,
+        flag_name: str | None = None,
+        flag_value: bool | None = None,  # noqa: FBT001
+        expired: bool | None = None,  # noqa: FBT001
+        limit: int = 100,
+        after: FLAG_CURSOR_T | None = None,
+    ) -> list[Flag]:
+        """
+        Retrieve all Flags from the repository ordered by `(date_created, id)`, up to the
+        specified limit, starting right after the `after` position when given.
+        """
+        now = datetime.now(tz=utc)
+        if flag_name is not None:
+            _id = self._ids_by_name.get(flag_name)
+            cursors = [self._flags[_id].cursor] if _id is not None else []
+        elif expired:
+            # The expired flags are a prefix of the expirations, in some other order.
+            end = bisect.bisect_right(self._expirations, (now, MAX_ID))
+            cursors = sorted(self._flags[_id].cursor for _, _id in self._expirations[:end])
+        elif flag_value is not None:
+            cursors = self._order_by_value[flag_value]
+        else:
+            cursors = self._order
+
+        flags: list[Flag] = []
+        start = bisect.bisect_right(cursors, after) if after is not None else 0
+        for index in range(start, len(cursors)):
+            if len(flags) == limit:
+                break
+            flag = self._flags[cursors[index][1]]
+            if (flag_value is None or flag.value == flag_value) and (
+                expired is None or flag.is_expired(now) == expired
+            ):
+                flags.append(copy.copy(flag))
+        return flags
+
+    async def iter_all(self, batch_size: int = 500) -> AsyncIterator[Flag]:
+        """
+        Stream every Flag from the repository in `(date_created, id)` order.
+        """
+        after = None
+        while batch := await self.get_all(limit=batch_size, after=after):
+            for flag in batch:
+                yield flag
+            after = batch[-1].cursor
+
+    @timed_repo_call("embedded")
+    async def update(self, flag: Flag) -> Flag:
+        """
+        Update an existing Flag in the repository.
+        """
+        if flag.id not in self._flags:
+            error_msg = f"Flag with id: `{flag.id}` not found for update."
+            raise RepositoryNotFoundError(error_msg)
+        self._check_unique_name(flag)
+        flag.revision = self.revision + 1
+        flag.version += 1
+        stored = copy.copy(flag)
+        self._append({"op": "put", "flag": flag_to_record(stored)})
+        self._put(stored)
+        self._maybe_compact()
+        return flag
+
+    @timed_repo_call("embedded")
+    async def update_fields(
+        self, _id: str, fields: FLAG_UPDATES_T, expected_version: int | None = None
+    ) -> Flag:
+        """
+        Set some fields of an existing Flag, if it is still at `expected_version`.
+        """
+        if (existing := self._flags.get(_id)) is None:
+            error_msg = f"Flag with id: `{_id}` not found for update."
+            raise RepositoryNotFoundError(error_msg)
+        if expected_version is not None and existing.version != expected_version:
+            error_msg = (
+                f"Flag with id: `{_id}` is at version {existing.version}, not {expected_version}."
+            )
+            raise RepositoryVersionConflictError(error_msg)
+        stored = dataclasses.replace(
+            existing, **fields, revision=self.revision + 1, version=existing.version + 1
+        )
+        self._check_unique_name(stored)
+        self._append({"op": "put", "flag": flag_to_record(stored)})
+        self._put(stored)
+        self._maybe_compact()
+        return copy.copy(stored)
+
+    @timed_repo_call("embedded")
+    async def delete(self, _id: str) -> None:
+        """
+        Delete a Flag by its ID from the repository.
+        """
+        if _id not in self._flags:
+            error_msg = f"Flag with id `{_id}` not found for deletion."
+            raise RepositoryNotFoundError(error_msg)
+        revision = self.revision + 1
+        self._append({"op": "delete", "id": _id, "revision": revision})
+        self._remove(_id, revision)
+        self._maybe_compact()
+
+    @timed_repo_call("embedded")
+    async def get_revision(self) -> int:
+        """
+        Retrieve the current collection-wide revision.
+        """
+        return self.revision
+
+    @timed_repo_call("embedded")
+    async def get_changes(self, since: int) -> FlagChanges:
+        """
+        Retrieve the Flags and tombstones with a revision greater than `since`.
+        """
+        return FlagChanges(
+            revision=self.revision,
+            flags=[copy.copy(self._flags[_id]) for _id in _newer_than(self._revisions, since)],
+            deleted=list(_newer_than(self._tombstones, since)),
+        )
+
+    @timed_repo_call("embedded")
+    async def delete_all(self) -> None:
+        """
+        Delete all Flags from the repository.
+        """
+        if not self._flags:
+            return
+        revision = self.revision + 1
+        ids = list(self._flags)
+        self._append(*({"op": "delete", "id": _id, "revision": revision} for _id in ids))
+        for _id in ids:
+            self._remove(_id, revision)
+        self._maybe_compact()
+
+
+def _remove_sorted(items: list[Any], item: Any) -> None:  # noqa: ANN401
+    index = bisect.bisect_left(items, item)
+    if index < len(items) and items[index] == item:
+        del items[index]
+
+
+def _newer_than(revisions: OrderedDict[str, int], since: int) -> list[str]:
+    """
+    The ids with a revision greater than `since`, walking back from the newest one.
+    """
+    newer = []
+    for _id in reversed(revisions):
+        if revisions[_id] <= since:
+            break
+        newer.append(_id)
+    newer.reverse()
+    return newer
@@ -1,17 +1,59 @@
-from src.domain.flag import Flag
-from src.exceptions import RepositoryNotFoundError
+import dataclasses
+from collections.abc import AsyncIterator
+from datetime import datetime
+
+from pytz import utc
+
+from src._types import FLAG_CURSOR_T, FLAG_UPDATES_T
+from src.domain.flag import Flag, FlagChanges, FlagStoreResult
+from src.exceptions import (
+    RepositoryDuplicateError,
+    RepositoryNotFoundError,
+    RepositoryVersionConflictError,
+)
+from src.metrics import timed_repo_call
 
 
 class FakeInMemoryRepo:
     def __init__(self) -> None:
         self.mem_store: dict[str, Flag] = {}
+        self.tombstones: dict[str, int] = {}
+        self.revision = 0
+
+    def _next_revision(self) -> int:
+        self.revision += 1
+        return self.revision
 
+    def _check_unique_name(self, flag: Flag) -> None:
+        for existing_flag in self.mem_store.values():
+            if existing_flag.name == flag.name and existing_flag.id != flag.id:
+                error_msg = f"Flag with name: `{flag.name}` already exists."
+                raise RepositoryDuplicateError(error_msg)
+
+    @timed_repo_call("memory")
     async def store(self, flag: Flag) -> None:
         """
         Store a new Flag in the repository.
         """
+        self._check_unique_name(flag)
+        flag.revision = self._next_revision()
         self.mem_store[flag.id] = flag
 
+    @timed_repo_call("memory")
+    async def store_many(self, flags: list[Flag]) -> list[FlagStoreResult]:
+        """
+        Store many new Flags in the repository, one at a time.
+        """
+        results = []
+        for flag in flags:
+            try:
+                await self.store(flag)
+                results.append(FlagStoreResult(flag=flag))
+            except RepositoryDuplicateError as error:
+                results.append(FlagStoreResult(flag=flag, error=str(error)))
+        return results
+
+    @timed_repo_call("memory")
     async def get_by_id(self, _id: str) -> Flag:
         """
         Retrieve a Flag by its ID from the repository.
@@ -22,6 +64,7 @@ class FakeInMemoryRepo:
         error_msg = f"Flag with id: `{_id}` not found."
         raise RepositoryNotFoundError(error_msg) from None
 
+    @timed_repo_call("memory")
     async def get_by_name(self, name: str) -> Flag:
         """
         Retrieve a Flag by its name from the repository.
@@ -32,46 +75,117 @@ class FakeInMemoryRepo:
         error_msg = f"Flag with name: `{name}` not found."
         raise RepositoryNotFoundError(error_msg)
 
+    @timed_repo_call("memory")
+    async def get_many_by_name(self, names: list[str]) -> list[Flag]:
+        """
+        Retrieve the Flags matching any of the given names from the repository.
+        """
+        by_name = {flag.name: flag for flag in self.mem_store.values()}
+        return [by_name[name] for name in dict.fromkeys(names) if name in by_name]
+
+    @timed_repo_call("memory")
     async def get_all(
         self,
         flag_name: str | None = None,
         flag_value: bool | None = None,  # noqa: FBT001
+        expired: bool | None = None,  # noqa: FBT001
         limit: int = 100,
+        after: FLAG_CURSOR_T | None = None,
     ) -> list[Flag]:
         """
-        Retrieve all Flags from the repository, up to the specified limit.
+        Retrieve all Flags from the repository ordered by `(date_created, id)`, up to the
+        specified limit, starting right after the `after` position when given.
         """
-        existing_flags = list(self.mem_store.values())
+        existing_flags = sorted(self.mem_store.values(), key=lambda flag: flag.cursor)
         if flag_name is not None:
             existing_flags = [flag for flag in existing_flags if flag.name == flag_name]
         if flag_value is not None:
             existing_flags = [flag for flag in existing_flags if flag.value == flag_value]
-        if existing_flags:
-            return existing_flags[:limit]
-        return []
+        if expired is not None:
+            now = datetime.now(tz=utc)
+            existing_flags = [flag for flag in existing_flags if flag.is_expired(now) == expired]
+        if after is not None:
+            existing_flags = [flag for flag in existing_flags if flag.cursor > after]
+        return existing_flags[:limit]
+
+    async def iter_all(self, batch_size: int = 500) -> AsyncIterator[Flag]:  # noqa: ARG002
+        """
+        Stream every Flag from the repository in `(date_created, id)` order.
+        """
+        for flag in await self.get_all(limit=len(self.mem_store)):
+            yield flag
 
+    @timed_repo_call("memory")
     async def update(self, flag: Flag) -> Flag:
         """
         Update an existing Flag in the repository.
         """
         if flag.id in self.mem_store:
+            self._check_unique_name(flag)
+            flag.revision = self._next_revision()
+            flag.version += 1
             self.mem_store[flag.id] = flag
             return flag
         error_msg = f"Flag with id: `{flag.id}` not found for update."
         raise RepositoryNotFoundError(error_msg) from None
 
+    @timed_repo_call("memory")
+    async def update_fields(
+        self, _id: str, fields: FLAG_UPDATES_T, expected_version: int | None = None
+    ) -> Flag:
+        """
+        Set some fields of an existing Flag, if it is still at `expected_version`.
+        """
+        if (existing := self.mem_store.get(_id)) is None:
+            error_msg = f"Flag with id: `{_id}` not found for update."
+            raise RepositoryNotFoundError(error_msg)
+        if expected_version is not None and existing.version != expected_version:
+            error_msg = (
+                f"Flag with id: `{_id}` is at version {existing.version}, not {expected_version}."
+            )
+            raise RepositoryVersionConflictError(error_msg)
+        flag = dataclasses.replace(existing, **fields, version=existing.version + 1)
+        self._check_unique_name(flag)
+        flag.revision = self._next_revision()
+        self.mem_store[_id] = flag
+        return flag
+
+    @timed_repo_call("memory")
     async def delete(self, _id: str) -> None:
         """
         Delete a Flag by its ID from the repository.
         """
         if _id in self.mem_store:
             del self.mem_store[_id]
+            self.tombstones[_id] = self._next_revision()
             return
         error_msg = f"Flag with id `{_id}` not found for deletion."
         raise RepositoryNotFoundError(error_msg)
 
+    @timed_repo_call("memory")
+    async def get_revision(self) -> int:
+        """
+        Retrieve the current collection-wide revision.
+        """
+        return self.revision
+
+    @timed_repo_call("memory")
+    async def get_changes(self, since: int) -> FlagChanges:
+        """
+        Retrieve the Flags and tombstones with a revision greater than `since`.
+        """
+        return FlagChanges(
+            revision=self.revision,
+            flags=[flag for flag in self.mem_store.values() if flag.revision > since],
+            deleted=[_id for _id, revision in self.tombstones.items() if revision > since],
+        )
+
+    @timed_repo_call("memory")
     async def delete_all(self) -> None:
         """
         Delete all Flags from the repository.
         """
+        if self.mem_store:
+            revision = self._next_revision()
+            self.tombstones.update(dict.fromkeys(self.mem_store, revision))
         self.mem_store = {}
@@ -0,0 +1,482 @@
+"""
+Implements a repo over any async SQL database through SQLAlchemy Core.
+
+The statements are built once, with bind parameters for every value, so each one is
+compiled once per engine and then served from its compiled cache.
+"""
+
+from collections.abc import AsyncIterator, Awaitable, Callable
+from datetime import datetime
+from functools import lru_cache, wraps
+from typing import Any
+
+from loguru import logger
+from pytz import utc
+from sqlalchemy import (
+    ColumnElement,
+    Delete,
+    Insert,
+    Row,
+    Select,
+    Update,
+    and_,
+    bindparam,
+    delete,
+    insert,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src._types import FLAG_CURSOR_T, FLAG_UPDATES_T
+from src.clients.sql_client import (
+    COUNTERS_TABLE,
+    FLAGS_TABLE,
+    REVISION_COUNTER_ID,
+    TOMBSTONES_TABLE,
+    SQLAsyncClient,
+)
+from src.domain.flag import Flag, FlagChanges, FlagStoreResult
+from src.exceptions import (
+    RepositoryConnectionError,
+    RepositoryDuplicateError,
+    RepositoryNotFoundError,
+    RepositoryVersionConflictError,
+)
+from src.metrics import timed_repo_call
+
+FLAGS_ORDER = (FLAGS_TABLE.c.date_created, FLAGS_TABLE.c.id)
+
+BUMP_REVISION: Update = (
+    update(COUNTERS_TABLE)
+    .where(COUNTERS_TABLE.c.id == REVISION_COUNTER_ID)
+    .values(seq=COUNTERS_TABLE.c.seq + bindparam("increment"))
+    .returning(COUNTERS_TABLE.c.seq)
+)
+SELECT_REVISION: Select[Any] = select(COUNTERS_TABLE.c.seq).where(
+    COUNTERS_TABLE.c.id == REVISION_COUNTER_ID
+)
+INSERT_FLAG: Insert = insert(FLAGS_TABLE)
+UPDATE_FLAG: Update = (
+    update(FLAGS_TABLE)
+    .where(FLAGS_TABLE.c.id == bindparam("flag_id"))
+    .values(
+        name=bindparam("name"),
+        value=bindparam("value"),
+        desc=bindparam("desc"),
+        expiration_date=bindparam("expiration_date"),
+        date_updated=bindparam("date_updated"),
+        revision=bindparam("revision"),
+        rollout_percentage=bindparam("rollout_percentage"),
+        version=bindparam("version"),
+    )
+)
+DELETE_FLAG: Delete = delete(FLAGS_TABLE).where(FLAGS_TABLE.c.id == bindparam("flag_id"))
+SELECT_FLAG_BY_ID: Select[Any] = select(FLAGS_TABLE).where(FLAGS_TABLE.c.id == bindparam("flag_id"))
+SELECT_FLAG_BY_NAME: Select[Any] = select(FLAGS_TABLE).where(
+    FLAGS_TABLE.c.name == bindparam("name")
+)
+SELECT_FLAGS_BY_NAMES: Select[Any] = select(FLAGS_TABLE).where(
+    FLAGS_TABLE.c.name.in_(bindparam("names", expanding=True))
+)
+SELECT_NAMES_IN: Select[Any] = select(FLAGS_TABLE.c.name).where(
+    FLAGS_TABLE.c.name.in_(bindparam("names", expanding=True))
+)
+SELECT_ALL_FLAGS: Select[Any] = select(FLAGS_TABLE).order_by(*FLAGS_ORDER)
+SELECT_FLAGS_CHANGED: Select[Any] = select(FLAGS_TABLE).where(
+    FLAGS_TABLE.c.revision > bindparam("since")
+)
+SELECT_TOMBSTONES_CHANGED: Select[Any] = select(TOMBSTONES_TABLE.c.id).where(
+    TOMBSTONES_TABLE.c.revision > bindparam("since")
+)
+DELETE_TOMBSTONES: Delete = delete(TOMBSTONES_TABLE).where(
+    TOMBSTONES_TABLE.c.id.in_(bindparam("ids", expanding=True))
+)
+INSERT_TOMBSTONE: Insert = insert(TOMBSTONES_TABLE)
+
+
+def flag_to_row(flag: Flag) -> dict[str, Any]:
+    """
+    Convert a Flag instance to the column values of its `flags` row.
+    """
+    return {
+        "id": flag.id,
+        "name": flag.name,
+        "value": flag.value,
+        "desc": flag.desc,
+        "expiration_date": flag.expiration_date,
+        "date_created": flag.date_created,
+        "date_updated": flag.date_updated,
+        "revision": flag.revision,
+        "rollout_percentage": flag.rollout_percentage,
+        "version": flag.version,
+    }
+
+
+def row_to_flag(row: Row[Any]) -> Flag:
+    """
+    Convert a `flags` row to a Flag instance.
+    """
+    return Flag(
+        id=row.id,
+        name=row.name,
+        value=row.value,
+        desc=row.desc,
+        expiration_date=row.expiration_date,
+        date_created=row.date_created,
+        date_updated=row.date_updated,
+        revision=row.revision,
+        rollout_percentage=row.rollout_percentage,
+        version=row.version,
+    )
+
+
+@lru_cache(maxsize=64)
+def get_all_statement(
+    *,
+    by_name: bool,
+    by_value: bool,
+    expired: bool | None,
+    after: bool,
+) -> Select[Any]:
+    """
+    The `get_all` statement for one combination of filters, the filter values are bound
+    at execution time so there are only a few statement shapes to compile and cache.
+    """
+    filters: list[ColumnElement[bool]] = []
+    if by_name:
+        filters.append(FLAGS_TABLE.c.name == bindparam("name"))
+    if by_value:
+        filters.append(FLAGS_TABLE.c.value == bindparam("value"))
+    if expired is True:
+        filters.append(FLAGS_TABLE.c.expiration_date <= bindparam("now"))
+    elif expired is False:
+        filters.append(
+            or_(
+                FLAGS_TABLE.c.expiration_date.is_(None),
+                FLAGS_TABLE.c.expiration_date > bindparam("now"),
+            )
+        )
+    if after:
+        filters.append(
+            or_(
+                FLAGS_TABLE.c.date_created > bindparam("after_date_created"),
+                and_(
+                    FLAGS_TABLE.c.date_created == bindparam("after_date_created"),
+                    FLAGS_TABLE.c.id > bindparam("after_id"),
+                ),
+            )
+        )
+    return select(FLAGS_TABLE).where(*filters).order_by(*FLAGS_ORDER).limit(bindparam("limit"))
+
+
+@lru_cache(maxsize=64)
+def update_fields_statement(columns: tuple[str, ...], *, check_version: bool) -> Update:
+    """
+    The `update_fields` statement for one set of updated columns, returning the updated row.
+    """
+    filters = [FLAGS_TABLE.c.id == bindparam("flag_id")]
+    if check_version:
+        filters.append(FLAGS_TABLE.c.version == bindparam("expected_version"))
+    return (
+        update(FLAGS_TABLE)
+        .where(*filters)
+        .values(
+            {column: bindparam(column) for column in columns}
+            | {"revision": bindparam("revision"), "version": FLAGS_TABLE.c.version + 1}
+        )
+        .returning(FLAGS_TABLE)
+    )
+
+
+def handle_db_error(fn: Callable[..., Awaitable[Any]]) -> Callable:  # type: ignore
+    """
+    Async decorator to handle SQL database connection errors,
+    recording the latency and errors of every call.
+    """
+
+    @wraps(fn)
+    async def inner(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+        try:
+            return await fn(*args, **kwargs)
+        except (OperationalError, InterfaceError) as error:
+            logger.error(f"Failed to reach the SQL database: `{error}`")
+            err_msg = f"Cannot connect to the SQL database during `{fn.__name__}`."
+            raise RepositoryConnectionError(err_msg) from None
+
+    return timed_repo_call("sql")(inner)
+
+
+class SQLStoreRepo:
+    def __init__(self, client: SQLAsyncClient | None = None) -> None:
+        self._client = client or SQLAsyncClient()
+
+    @staticmethod
+    async def _next_revision(conn: AsyncConnection, increment: int = 1) -> int:
+        """
+        Bump and return the collection-wide revision counter inside the write's transaction,
+        so the revision is only used if the write commits.
+        Bumping by `increment` reserves all the revisions up to the returned one.
+        """
+        return int((await conn.execute(BUMP_REVISION, {"increment": increment})).scalar_one())
+
+    @handle_db_error
+    async def store(self, flag: Flag) -> None:
+        """
+        Store a new Flag row in the `flags` table.
+        """
+        try:
+            async with self._client.engine.begin() as conn:
+                flag.revision = await self._next_revision(conn)
+                await conn.execute(INSERT_FLAG, flag_to_row(flag))
+        except IntegrityError:
+            msg = f"Flag with name: `{flag.name}` already exists."
+            raise RepositoryDuplicateError(msg) from None
+
+    @handle_db_error
+    async def store_many(self, flags: list[Flag]) -> list[FlagStoreResult]:
+        """
+        Store many new Flag rows with a single multi-row insert, reporting the Flags whose name
+        is taken instead of failing the whole batch. If a concurrent write still makes the insert
+        fail, the Flags are stored one by one.
+        """
+        if not flags:
+            return []
+        errors: dict[int, str] = {}
+        conflicted = False
+        async with self._client.engine.begin() as conn:
+            taken = set(
+                (await conn.execute(SELECT_NAMES_IN, {"names": [f.name for f in flags]})).scalars()
+            )
+            for index, flag in enumerate(flags):
+                if flag.name in taken:
+                    errors[index] = f"Flag with name: `{flag.name}` already exists."
+                taken.add(flag.name)
+            to_store = [flag for index, flag in enumerate(flags) if index not in errors]
+            if to_store:
+                try:
+                    async with conn.begin_nested():
+                        last_revision = await self._next_revision(conn, increment=len(to_store))
+                        first_revision = last_revision - len(to_store) + 1
+                        for revision, flag in enumerate(to_store, start=first_revision):
+                            flag.revision = revision
+                        await conn.execute(INSERT_FLAG, [flag_to_row(flag) for flag in to_store])
+                except IntegrityError:
+                    conflicted = True
+
+        if conflicted:
+            return await self._store_one_by_one(flags)
+        return [FlagStoreResult(flag=flag, error=errors.get(i)) for i, flag in enumerate(flags)]
+
+    async def _store_one_by_one(self, flags: list[Flag]) -> list[FlagStoreResult]:
+        results = []
+        for flag in flags:
+            try:
+                await self.store(flag)
+                results.append(FlagStoreResult(flag=flag))
+            except RepositoryDuplicateError as error:
+                results.append(FlagStoreResult(flag=flag, error=str(error)))
+        return results
+
+    @handle_db_error
+    async def get_by_id(self, _id: str) -> Flag:
+        """
+        Retrieve a Flag row by its ID from the `flags` table.
+        """
+        async with self._client.engine.connect() as conn:
+            row = (await conn.execute(SELECT_FLAG_BY_ID, {"flag_id": _id})).first()
+        if row is not None:
+            return row_to_flag(row)
+        msg = f"Flag with id: `{_id}` not found."
+        raise RepositoryNotFoundError(msg)
+
+    @handle_db_error
+    async def get_by_name(self, name: str) -> Flag:
+        """
+        Retrieve a Flag row by its name from the `flags` table.
+        """
+        async with self._client.engine.connect() as conn:
+            row = (await conn.execute(SELECT_FLAG_BY_NAME, {"name": name})).first()
+        if row is not None:
+            return row_to_flag(row)
+        msg = f"Flag with name: `{name}` not found."
+        raise RepositoryNotFoundError(msg)
+
+    @handle_db_error
+    async def get_many_by_name(self, names: list[str]) -> list[Flag]:
+        """
+        Retrieve the Flag rows matching any of the given names with a single `IN` query.
+        """
+        if not names:
+            return []
+        async with self._client.engine.connect() as conn:
+            rows = (await conn.execute(SELECT_FLAGS_BY_NAMES, {"names": names})).all()
+        return [row_to_flag(row) for row in rows]
+
+    @handle_db_error
+    async def get_all(
+        self,
+        flag_name: str | None = None,
+        flag_value: bool | None = None,  # noqa: FBT001
+        expired: bool | None = None,  # noqa: FBT001
+        limit: int = 100,
+        after: FLAG_CURSOR_T | None = None,
+    ) -> list[Flag]:
+        """
+        Retrieve all Flag rows from the `flags` table ordered by `(date_created, id)`,
+        up to the specified limit, starting right after the `after` position when given.
+        The whole page is fetched in one round trip.
+        """
+        statement = get_all_statement(
+            by_name=flag_name is not None,
+            by_value=flag_value is not None,
+            expired=expired,
+            after=after is not None,
+        )
+        params: dict[str, Any] = {"name": flag_name, "value": flag_value, "limit": limit}
+        if expired is not None:
+            params["now"] = datetime.now(tz=utc)
+        if after is not None:
+            params["after_date_created"], params["after_id"] = after
+        async with self._client.engine.connect() as conn:
+            rows = (await conn.execute(statement, params)).all()
+        return [row_to_flag(row) for row in rows]
+
+    async def iter_all(self, batch_size: int = 500) -> AsyncIterator[Flag]:
+        """
+        Stream every Flag row from the `flags` table through a server side cursor,
+        holding at most one batch of `batch_size` rows in memory.
+        """
+        try:
+            async with self._client.engine.connect() as conn:
+                result = await conn.stream(SELECT_ALL_FLAGS.execution_options(yield_per=batch_size))
+                async for rows in result.partitions():
+                    for row in rows:
+                        yield row_to_flag(row)
+        except (OperationalError, InterfaceError) as error:
+            logger.error(f"Failed to reach the SQL database: `{error}`")
+            err_msg = "Cannot connect to the SQL database during `iter_all`."
+            raise RepositoryConnectionError(err_msg) from None
+
+    @handle_db_error
+    async def update(self, flag: Flag) -> Flag:
+        """
+        Update an existing Flag row in the `flags` table.
+        """
+        try:
+            async with self._client.engine.begin() as conn:
+                revision = await self._next_revision(conn)
+                result = await conn.execute(
+                    UPDATE_FLAG,
+                    {
+                        "flag_id": flag.id,
+                        "name": flag.name,
+                        "value": flag.value,
+                        "desc": flag.desc,
+                        "expiration_date": flag.expiration_date,
+                        "date_updated": flag.date_updated,
+                        "revision": revision,
+                        "rollout_percentage": flag.rollout_percentage,
+                        "version": flag.version + 1,
+                    },
+                )
+                if result.rowcount == 0:
+                    err_msg = f"Flag with id: `{flag.id}` not found for update."
+                    raise RepositoryNotFoundError(err_msg)
+        except IntegrityError:
+            msg = f"Flag with name: `{flag.name}` already exists."
+            raise RepositoryDuplicateError(msg) from None
+        flag.revision = revision
+        flag.version += 1
+        return flag
+
+    @handle_db_error
+    async def update_fields(
+        self, _id: str, fields: FLAG_UPDATES_T, expected_version: int | None = None
+    ) -> Flag:
+        """
+        Set some columns of an existing Flag row with a single `UPDATE ... RETURNING`,
+        matching on `expected_version` too when given.
+        """
+        statement = update_fields_statement(
+            tuple(sorted(fields)), check_version=expected_version is not None
+        )
+        params = {**fields, "flag_id": _id, "expected_version": expected_version}
+        try:
+            async with self._client.engine.begin() as conn:
+                revision = await self._next_revision(conn)
+                result = await conn.execute(statement, params | {"revision": revision})
+                row = result.one_or_none()
+                if row is None:
+                    # Rolled back, so the revision is not used.
+                    current = (
+                        await conn.execute(SELECT_FLAG_BY_ID, {"flag_id": _id})
+                    ).one_or_none()
+                    if current is None:
+                        err_msg = f"Flag with id: `{_id}` not found for update."
+                        raise RepositoryNotFoundError(err_msg)
+                    err_msg = (
+                        f"Flag with id: `{_id}` is at version {current.version}, "
+                        f"not {expected_version}."
+                    )
+                    raise RepositoryVersionConflictError(err_msg)
+        except IntegrityError:
+            msg = f"Flag with name: `{fields.get('name')}` already exists."
+            raise RepositoryDuplicateError(msg) from None
+        return row_to_flag(row)
+
+    @handle_db_error
+    async def delete(self, _id: str) -> None:
+        """
+        Delete a Flag row by its ID from the `flags` table, leaving a tombstone behind.
+        """
+        async with self._client.engine.begin() as conn:
+            result = await conn.execute(DELETE_FLAG, {"flag_id": _id})
+            if result.rowcount == 0:
+                err_msg = f"Flag with id `{_id}` not found for deletion."
+                raise RepositoryNotFoundError(err_msg)
+            revision = await self._next_revision(conn)
+            await conn.execute(DELETE_TOMBSTONES, {"ids": [_id]})
+            await conn.execute(INSERT_TOMBSTONE, {"id": _id, "revision": revision})
+
+    @handle_db_error
+    async def get_revision(self) -> int:
+        """
+        Retrieve the current collection-wide revision from the `counters` table.
+        """
+        async with self._client.engine.connect() as conn:
+            return int(await conn.scalar(SELECT_REVISION) or 0)
+
+    @handle_db_error
+    async def get_changes(self, since: int) -> FlagChanges:
+        """
+        Retrieve the Flag rows and tombstones with a revision greater than `since`.
+        The revision is read first, so a change racing with this call is sent again
+        on the next poll rather than skipped.
+        """
+        async with self._client.engine.connect() as conn:
+            revision = int(await conn.scalar(SELECT_REVISION) or 0)
+            rows = (await conn.execute(SELECT_FLAGS_CHANGED, {"since": since})).all()
+            deleted = (await conn.execute(SELECT_TOMBSTONES_CHANGED, {"since": since})).scalars()
+            return FlagChanges(
+                revision=revision,
+                flags=[row_to_flag(row) for row in rows],
+                deleted=[str(_id) for _id in deleted],
+            )
+
+    @handle_db_error
+    async def delete_all(self) -> None:
+        """
+        Delete all Flag rows from the `flags` table.
+        """
+        async with self._client.engine.begin() as conn:
+            ids = list((await conn.execute(select(FLAGS_TABLE.c.id))).scalars())
+            if not ids:
+                logger.warning("No rows found to delete.")
+                return
+            await conn.execute(delete(FLAGS_TABLE))
+            revision = await self._next_revision(conn)
+            await conn.execute(DELETE_TOMBSTONES, {"ids": ids})
+            await conn.execute(INSERT_TOMBSTONE, [{"id": _id, "revision": revision} for _id in ids])
@@ -0,0 +1,315 @@
+"""
+Fan-out of the flag changes of the repo to every subscriber connected to this worker.
+"""
+
+import asyncio
+import contextlib
+import copy
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
+from typing import Literal
+
+from loguru import logger
+from pydantic_settings import BaseSettings
+
+from src.domain.flag import Flag, FlagChanges
+from src.exceptions import RepositoryConnectionError, RepositoryNotFoundError
+from src.repo.base import FlagsShipRepo
+
+# `expired` is sent when a flag reaches its expiration date,
+# `reset` tells a subscriber that events were lost and it has to reload every flag.
+FLAG_EVENT_KIND_T = Literal["created", "updated", "deleted", "expired", "reset"]
+
+
+class EventsConfig(BaseSettings):
+    queue_size: int = 256
+    heartbeat_seconds: float = 15.0
+    # How often the changes written by the other workers are read.
+    poll_interval_seconds: float = 1.0
+
+    class Config:
+        env_prefix = "FLAGBIT_EVENTS_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+@dataclass(frozen=True, slots=True)
+class FlagEvent:
+    # The repo revision of the change.
+    id: int
+    kind: FLAG_EVENT_KIND_T
+    flag_id: str | None = None
+    flag: Flag | None = None
+
+
+class FlagSubscription:
+    """
+    One subscriber of the `EventHub`, with its own bounded queue of pending events.
+    Iterating yields the next `FlagEvent`, or `None` when nothing happened for
+    `heartbeat_seconds`, and stops once the subscriber was dropped for falling behind.
+    """
+
+    def __init__(self, maxsize: int, heartbeat_seconds: float) -> None:
+        self.heartbeat_seconds = heartbeat_seconds
+        self.dropped = False
+        # Changes up to this revision were already sent.
+        self.after = 0
+        self._queue: asyncio.Queue[FlagEvent | None] = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, event: FlagEvent) -> bool:
+        """
+        Queue the event without waiting, `False` once the subscriber is full and dropped.
+        """
+        if self.dropped:
+            return False
+        if event.id <= self.after and event.kind in {"created", "updated", "deleted"}:
+            return True
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.close()
+            return False
+        return True
+
+    def close(self) -> None:
+        """
+        End the iteration, the subscriber resumes from its last event id when it comes back.
+        """
+        self.dropped = True
+        # Make room for the end of stream marker.
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    def __aiter__(self) -> AsyncIterator[FlagEvent | None]:
+        return self._events()
+
+    async def _events(self) -> AsyncIterator[FlagEvent | None]:
+        while True:
+            try:
+                event = await asyncio.wait_for(self._queue.get(), timeout=self.heartbeat_seconds)
+            except TimeoutError:
+                yield None
+                continue
+            if event is None:
+                return
+            yield event
+
+
+class EventHub:
+    """
+    Broadcast `FlagEvents` to every `FlagSubscription`, never waiting on a slow one.
+    Events are read from the repo changes, every `poll_interval_seconds` or as soon as this
+    worker wrote, so the writes of every worker reach every subscriber. Their id is the repo
+    revision, so a subscriber can resume after its last event id on any worker, even after a
+    restart. Changes of a `Flag` between two polls are sent as a single event.
+    Listeners following the hub are called with the same events as the subscribers.
+    Without subscribers or listeners the repo is not read at all.
+    """
+
+    def __init__(self, repo: FlagsShipRepo, config: EventsConfig | None = None) -> None:
+        self.repo = repo
+        self.config = config or EventsConfig()
+        # The repo revision the events were read up to, `None` until the first subscriber.
+        self.revision: int | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._subscribers: set[FlagSubscription] = set()
+        self._listeners: list[Callable[[FlagEvent], None]] = []
+        self._expiring: set[asyncio.Task[None]] = set()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    @property
+    def _following(self) -> bool:
+        return bool(self._subscribers or self._listeners)
+
+    def follow(self, listener: Callable[[FlagEvent], None], revision: int) -> None:
+        """
+        Call `listener` with the events of every change made after `revision`,
+        e.g. to keep what was loaded from the repo at `revision` up to date.
+        """
+        if not self._following or self.revision is None:
+            self.revision = revision
+        else:
+            # The subscribers skip the events they were already sent.
+            self.revision = min(self.revision, revision)
+        self._listeners.append(listener)
+
+    def notify(self) -> None:
+        """
+        Read the repo changes right away, this worker just wrote.
+        """
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        """
+        Keep broadcasting the repo changes in the background.
+        """
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        for task in list(self._expiring):
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self.close()
+
+    async def poll(self) -> None:
+        """
+        Broadcast every change of the repo since the last poll.
+        The repo is only read while there are subscribers or listeners.
+        """
+        if not self._following or self.revision is None:
+            return
+        changes = await self.repo.get_changes(since=self.revision)
+        self.revision = changes.revision
+        for event in changes_to_events(changes):
+            self._broadcast(event)
+            for listener in self._listeners:
+                try:
+                    listener(event)
+                except Exception:  # noqa: BLE001
+                    logger.exception(f"Flag events listener {listener!r} failed.")
+
+    async def _run(self) -> None:
+        while True:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=self.config.poll_interval_seconds
+                )
+            self._wakeup.clear()
+            try:
+                await self.poll()
+            except RepositoryConnectionError as error:
+                logger.warning(f"Flag events could not be read: `{error}`")
+
+    def publish_expired(self, flag: Flag) -> None:
+        """
+        Broadcast that the `flag` just expired, in the background.
+        """
+        task = asyncio.create_task(self._publish_expired(flag))
+        self._expiring.add(task)
+        task.add_done_callback(self._expiring.discard)
+
+    async def _publish_expired(self, flag: Flag) -> None:
+        """
+        Broadcast that the `flag` just expired once the repo tells it still exists and has
+        expired, another worker may have deleted, renamed or re-dated it since it was scheduled.
+        It is not a repo change, so it is only sent to the subscribers connected to this worker.
+        """
+        if not self._subscribers:
+            return
+        try:
+            current = await self.repo.get_by_id(flag.id)
+        except RepositoryNotFoundError:
+            return
+        except RepositoryConnectionError as error:
+            logger.warning(f"Flag `{flag.id}` expired but could not be read again: `{error}`")
+            return
+        if not current.is_expired():
+            return
+        self._broadcast(
+            FlagEvent(
+                id=self.revision or 0, kind="expired", flag_id=current.id, flag=copy.copy(current)
+            )
+        )
+
+    def _broadcast(self, event: FlagEvent) -> None:
+        for subscription in list(self._subscribers):
+            if not subscription.push(event):
+                self._subscribers.discard(subscription)
+                logger.warning(f"Dropped a slow flag events subscriber at event {event.id}.")
+
+    async def subscribe(self, last_event_id: int | None = None) -> FlagSubscription:
+        """
+        Subscribe to every change from now on, and with a `last_event_id` to the changes
+        made after it too, or to a `reset` event if there are more than `queue_size` of them
+        or if the repo is behind `last_event_id`, e.g. restored from a backup.
+        raises: `RepositoryConnectionError` if the repo cannot be read.
+        """
+        subscription = FlagSubscription(
+            maxsize=self.config.queue_size, heartbeat_seconds=self.config.heartbeat_seconds
+        )
+        if self._closed:
+            subscription.close()
+            return subscription
+        # Unfollowed, the revision of the hub is behind the repo one, it has to be read again,
+        # as when the subscriber comes from a worker which read the repo more recently.
+        revision = self.revision
+        if (
+            not self._following
+            or revision is None
+            or (last_event_id is not None and last_event_id > revision)
+        ):
+            revision = await self.repo.get_revision()
+        since = last_event_id if last_event_id is not None else revision
+        missed: list[FlagEvent] = []
+        if since > revision:
+            since = revision
+            missed = [FlagEvent(id=since, kind="reset")]
+        # Read up to the revision of the next broadcast, it may move while reading,
+        # unless the subscriber missed too many changes to be sent anything but a `reset`.
+        while since < revision and len(missed) <= self.config.queue_size:
+            changes = await self.repo.get_changes(since=since)
+            missed.extend(changes_to_events(changes))
+            since = changes.revision
+            if self._following and self.revision is not None:
+                revision = max(revision, self.revision)
+        if len(missed) > self.config.queue_size:
+            missed = [FlagEvent(id=since, kind="reset")]
+        for event in missed:
+            subscription.push(event)
+        # A poll running meanwhile may broadcast the changes already sent, or already seen on
+        # another worker ahead of this one.
+        subscription.after = since
+        if self._closed:
+            subscription.close()
+            return subscription
+        if not self._following:
+            self.revision = revision
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: FlagSubscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def close(self) -> None:
+        """
+        End every subscription, and the ones made from now on, so open streams finish on shutdown.
+        """
+        self._closed = True
+        for subscription in self._subscribers:
+            subscription.close()
+        self._subscribers.clear()
+
+
+def changes_to_events(changes: FlagChanges) -> list[FlagEvent]:
+    """
+    The events of the repo `changes`, in revision order: a `Flag` at its first version was
+    `created`, any other one `updated`. The revisions of the deletions are not kept,
+    they are all sent at the revision of the `changes`.
+    """
+    # Subscribers read the events later, so they must not follow further changes of the `Flags`.
+    events = [
+        FlagEvent(
+            id=flag.revision,
+            kind="created" if flag.version == 1 else "updated",
+            flag_id=flag.id,
+            flag=copy.copy(flag),
+        )
+        for flag in sorted(changes.flags, key=lambda flag: flag.revision)
+    ]
+    events.extend(
+        FlagEvent(id=changes.revision, kind="deleted", flag_id=flag_id)
+        for flag_id in changes.deleted
+    )
+    return events
@@ -0,0 +1,177 @@
+"""
+Background scheduler acting on `Flags` the moment they expire, and the coarse clock
+the hot path reads instead of asking the OS for the time on every evaluation.
+"""
+
+import asyncio
+import contextlib
+import copy
+import heapq
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING
+
+from loguru import logger
+from pydantic_settings import BaseSettings
+
+from src.domain.flag import Flag, now_epoch_ms, to_epoch_ms
+
+if TYPE_CHECKING:
+    from src.services.events import FlagEvent
+    from src.services.snapshot import FlagSnapshot
+
+# Rebuild the heap once it holds this many times more entries than scheduled flags.
+HEAP_COMPACT_RATIO = 2
+
+
+class ExpirationsConfig(BaseSettings):
+    enabled: bool = True
+    # How often the cached clock is advanced, expiry is evaluated this late at most.
+    clock_resolution_seconds: float = 0.05
+
+    class Config:
+        env_prefix = "FLAGBIT_EXPIRATIONS_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+class ExpirationScheduler:
+    """
+    Keep a min-heap of the upcoming expirations and call the listeners with every `Flag`
+    as soon as it expires. Rescheduled and unscheduled `Flags` leave stale heap entries
+    behind, they are skipped when popped and dropped when the heap is compacted.
+
+    `now_ms` is the cached clock, in epoch milliseconds, advanced every
+    `clock_resolution_seconds` and whenever an expiration fires.
+    """
+
+    def __init__(self, config: ExpirationsConfig | None = None) -> None:
+        self.config = config or ExpirationsConfig()
+        self.now_ms = now_epoch_ms()
+        self._heap: list[tuple[int, str]] = []
+        self._scheduled: dict[str, tuple[int, Flag]] = {}
+        self._listeners: list[Callable[[Flag], None]] = []
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task[None]] = []
+        self._snapshot_revision: int | None = None
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+    def add_listener(self, listener: Callable[[Flag], None]) -> None:
+        self._listeners.append(listener)
+
+    @property
+    def next_expiration(self) -> int | None:
+        """
+        When the next scheduled `Flag` expires, in epoch milliseconds.
+        """
+        while self._heap and self._is_stale(*self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def _is_stale(self, expires_at: int, flag_id: str) -> bool:
+        scheduled = self._scheduled.get(flag_id)
+        return scheduled is None or scheduled[0] != expires_at
+
+    def schedule(self, flag: Flag) -> None:
+        """
+        Schedule the expiration of a created or updated `Flag`, replacing the previous one.
+        A `Flag` without expiration, or already expired, is unscheduled.
+        """
+        if (
+            flag.expiration_date is None
+            or (expires_at := to_epoch_ms(flag.expiration_date)) <= now_epoch_ms()
+        ):
+            self.unschedule(flag.id)
+            return
+        next_expiration = self.next_expiration
+        self._scheduled[flag.id] = (expires_at, copy.copy(flag))
+        heapq.heappush(self._heap, (expires_at, flag.id))
+        if len(self._heap) > HEAP_COMPACT_RATIO * len(self._scheduled) + 64:
+            self._compact()
+        if next_expiration is None or expires_at < next_expiration:
+            self._wakeup.set()
+
+    def unschedule(self, flag_id: str) -> None:
+        self._scheduled.pop(flag_id, None)
+
+    def replace_all(self, flags: Iterable[Flag]) -> None:
+        """
+        Schedule exactly the given `Flags`, e.g. every `Flag` of a new snapshot.
+        """
+        now = now_epoch_ms()
+        self._scheduled = {
+            flag.id: (expires_at, flag)
+            for flag in flags
+            if flag.expiration_date is not None
+            and (expires_at := to_epoch_ms(flag.expiration_date)) > now
+        }
+        self._compact()
+        self._wakeup.set()
+
+    def follow_snapshot(self, snapshot: "FlagSnapshot") -> None:
+        """
+        Snapshot listener scheduling every `Flag` of each snapshot with a new revision.
+        """
+        if snapshot.revision == self._snapshot_revision:
+            return
+        self.replace_all(snapshot.flags)
+        self._snapshot_revision = snapshot.revision
+
+    def follow_event(self, event: "FlagEvent") -> None:
+        """
+        Flag events listener scheduling the `Flags` created or updated by any worker
+        and unscheduling the deleted ones.
+        """
+        if event.kind == "deleted" and event.flag_id is not None:
+            self.unschedule(event.flag_id)
+        elif event.kind in {"created", "updated"} and event.flag is not None:
+            self.schedule(event.flag)
+
+    def _compact(self) -> None:
+        self._heap = [(expires_at, flag_id) for flag_id, (expires_at, _) in self._scheduled.items()]
+        heapq.heapify(self._heap)
+
+    def fire_due(self, now: int) -> list[Flag]:
+        """
+        Unschedule every `Flag` expired at `now` and call the listeners with each of them.
+        """
+        self.now_ms = max(self.now_ms, now)
+        expired = []
+        while (next_expiration := self.next_expiration) is not None and next_expiration <= now:
+            _, flag_id = heapq.heappop(self._heap)
+            _, flag = self._scheduled.pop(flag_id)
+            expired.append(flag)
+        for flag in expired:
+            for listener in self._listeners:
+                try:
+                    listener(flag)
+                except Exception as error:  # noqa: BLE001
+                    logger.error(f"Expiration listener failed for flag `{flag.id}`: `{error}`")
+        return expired
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._tick())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+
+    async def _tick(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.clock_resolution_seconds)
+            self.now_ms = max(self.now_ms, now_epoch_ms())
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            self.fire_due(now_epoch_ms())
+            timeout = None
+            if (next_expiration := self.next_expiration) is not None:
+                timeout = max(0, next_expiration - now_epoch_ms()) / 1000
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
@@ -1,57 +1,219 @@
+from collections.abc import AsyncIterator, Sequence
 from datetime import datetime
-from typing import TypedDict
+from typing import NotRequired, TypedDict
 
 from pytz import utc
 
 from src._types import EXP_UNIT_T
-from src.domain.flag import Flag
+from src.domain.flag import Flag, FlagChanges, FlagRecord, FlagStoreResult, now_epoch_ms
+from src.domain.rollout import in_rollout_batch
 from src.exceptions import (
+    FlagAlreadyExistsError,
     FlagNotFoundError,
     FlagPersistenceError,
+    FlagVersionConflictError,
+    InvalidCursorError,
     RepositoryConnectionError,
+    RepositoryDuplicateError,
     RepositoryNotFoundError,
+    RepositoryVersionConflictError,
 )
-from src.helpers import new_expiration_date
+from src.helpers import decode_cursor, new_expiration_date
 from src.repo.base import FlagsShipRepo
+from src.services.events import EventHub, FlagSubscription
+from src.services.expirations import ExpirationScheduler
+from src.services.last_known import LastKnownFlags
+from src.services.shared_snapshot import MappedFlagSnapshot, SharedFlagSnapshot
+from src.services.single_flight import SingleFlight
+from src.services.snapshot import FlagSnapshot, FlagSnapshotManager
+
+
+class NewFlag(TypedDict):
+    name: str
+    value: bool
+    desc: NotRequired[str | None]
+    rollout_percentage: NotRequired[float | None]
 
 
 class FlagAllowedUpdates(TypedDict, total=False):
     name: str | None
     value: bool | None
     desc: str | None
+    rollout_percentage: float | None
+
+
+CLEARABLE_FIELDS = frozenset({"desc", "rollout_percentage"})
 
 
 class FlagBitService:
-    def __init__(self, repo: FlagsShipRepo) -> None:
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        repo: FlagsShipRepo,
+        snapshot: FlagSnapshotManager | None = None,
+        events: EventHub | None = None,
+        shared: SharedFlagSnapshot | None = None,
+        expirations: ExpirationScheduler | None = None,
+        last_known: LastKnownFlags | None = None,
+        single_flight: SingleFlight[Flag] | None = None,
+    ) -> None:
         self.repo = repo
+        self.snapshot = snapshot
+        self.events = events
+        self.shared = shared
+        self.expirations = expirations
+        self.last_known = last_known
+        self.single_flight = single_flight
+        # Age, in seconds, of the oldest last known good `Flag` served instead of failing.
+        self.stale_seconds: float | None = None
+
+    async def _get_by_name(self, name: str) -> Flag:
+        """
+        `get_by_name`, coalesced with the same lookups in flight when single flight is on.
+        """
+        if self.single_flight is None:
+            return await self.repo.get_by_name(name=name)
+        return await self.single_flight.do("name", name, lambda: self.repo.get_by_name(name=name))
+
+    async def _get_by_id(self, flag_id: str) -> Flag:
+        if self.single_flight is None:
+            return await self.repo.get_by_id(_id=flag_id)
+        return await self.single_flight.do("id", flag_id, lambda: self.repo.get_by_id(_id=flag_id))
 
-    async def create_flag(
+    def _served_stale(self, age: float) -> None:
+        self.stale_seconds = max(self.stale_seconds or 0.0, age)
+
+    def _now_ms(self) -> int:
+        """
+        The cached clock of the `ExpirationScheduler` when there is one, in epoch milliseconds.
+        """
+        return self.expirations.now_ms if self.expirations is not None else now_epoch_ms()
+
+    def _current_snapshot(self) -> FlagSnapshot | None:
+        return self.snapshot.current if self.snapshot is not None else None
+
+    def _values_snapshot(self) -> FlagSnapshot | MappedFlagSnapshot | None:
+        """
+        The snapshot to evaluate `Flags` from: the in-process one,
+        otherwise the one shared by the workers of the host.
+        """
+        if (snapshot := self._current_snapshot()) is not None:
+            return snapshot
+        return self.shared.current if self.shared is not None else None
+
+    def state_tag(self, name: str | None = None) -> str | None:
+        """
+        A tag that changes whenever the evaluated `Flags` may change, known without any
+        repo query while the `Flags` are served from the snapshot, otherwise `None`.
+        With a `name`, the tag is only given if the snapshot knows that `Flag`,
+        without one if the snapshot holds every `Flag`.
+        """
+        if (snapshot := self._current_snapshot()) is None:
+            return None
+        if name is not None and name not in snapshot.values:
+            return None
+        if name is None and not snapshot.complete:
+            return None
+        return f"{snapshot.revision}.{snapshot.expired_count()}"
+
+    def _flags_changed(self, flag_id: str, flag: Flag | None = None) -> None:
+        if self.snapshot is not None:
+            self.snapshot.request_refresh()
+        if self.single_flight is not None:
+            self.single_flight.clear()
+        if self.expirations is not None:
+            if flag is None:
+                self.expirations.unschedule(flag_id)
+            else:
+                self.expirations.schedule(flag)
+        if self.events is not None:
+            self.events.notify()
+
+    async def subscribe(self, last_event_id: int | None = None) -> FlagSubscription | None:
+        """
+        Subscribe to the `Flags` created, updated or deleted from now on, or after the
+        `last_event_id` revision, `None` when no `EventHub` is configured.
+        """
+        if self.events is None:
+            return None
+        try:
+            return await self.events.subscribe(last_event_id=last_event_id)
+        except RepositoryConnectionError:
+            raise FlagPersistenceError from None
+
+    def unsubscribe(self, subscription: FlagSubscription) -> None:
+        if self.events is not None:
+            self.events.unsubscribe(subscription)
+
+    async def create_flag(  # noqa: PLR0913, PLR0917
         self,
         name: str,
         value: bool,  # noqa: FBT001 Boolean-typed positional argument in function definition
         desc: str | None = None,
         exp_unit: EXP_UNIT_T = "w",
         exp_value: int = 4,
+        rollout_percentage: float | None = None,
     ) -> Flag:
         """
-        Create a new `Flag` with the provided `name`, `value`, `desc`, `exp_unit` and `exp_value`.
+        Create a new `Flag` with the provided `name`, `value`, `desc`, `exp_unit` and `exp_value`,
+        enabled for a `rollout_percentage` of the users only when given.
         """
         try:
             expiration_date = new_expiration_date(
                 current_datetime=datetime.now(tz=utc), unit=exp_unit, value=exp_value
             )
-            new_flag = Flag(name=name, value=value, desc=desc, expiration_date=expiration_date)
+            new_flag = Flag(
+                name=name,
+                value=value,
+                desc=desc,
+                expiration_date=expiration_date,
+                rollout_percentage=rollout_percentage,
+            )
             await self.repo.store(flag=new_flag)
+            self._flags_changed(new_flag.id, new_flag)
             return new_flag
+        except RepositoryDuplicateError as error:
+            raise FlagAlreadyExistsError(str(error)) from None
         except RepositoryConnectionError:
             raise FlagPersistenceError from None
 
+    async def create_flags(
+        self,
+        new_flags: list[NewFlag],
+        exp_unit: EXP_UNIT_T = "w",
+        exp_value: int = 4,
+    ) -> list[FlagStoreResult]:
+        """
+        Create many new `Flags` at once, all sharing the same expiration.
+        A `Flag` that cannot be stored is reported in its result instead of failing the batch.
+        """
+        expiration_date = new_expiration_date(
+            current_datetime=datetime.now(tz=utc), unit=exp_unit, value=exp_value
+        )
+        flags = [
+            Flag(
+                name=new_flag["name"],
+                value=new_flag["value"],
+                desc=new_flag.get("desc"),
+                expiration_date=expiration_date,
+                rollout_percentage=new_flag.get("rollout_percentage"),
+            )
+            for new_flag in new_flags
+        ]
+        try:
+            results = await self.repo.store_many(flags=flags)
+        except RepositoryConnectionError:
+            raise FlagPersistenceError from None
+        for result in results:
+            if result.stored:
+                self._flags_changed(result.flag.id, result.flag)
+        return results
+
     async def get_flag(self, flag_id: str) -> Flag:
         """
         Get `Flag` by it's id.
         """
         try:
-            return await self.repo.get_by_id(_id=flag_id)
+            return await self._get_by_id(flag_id)
         except RepositoryNotFoundError:
             raise FlagNotFoundError from None
         except RepositoryConnectionError:
@@ -59,49 +221,183 @@ class FlagBitService:
 
     async def is_enabled(self, name: str) -> bool | None:
         """
-        Try to find the `Flag` by `name` and return its `value`.
+        Try to find the `Flag` by `name` and return its `value`, the last known good one
+        while the repo is unreachable.
         raises: `RepositoryNotFoundError` and `RepositoryConnectionError`
         """
+        if (snapshot := self._values_snapshot()) is not None:
+            value = snapshot.value_of(name, self._now_ms())
+            if value is not None:
+                return value
         try:
-            if flag := await self.repo.get_by_name(name=name):
-                return False if flag.expired else flag.value
-
-            return None
+            flag = await self._get_by_name(name)
         except RepositoryNotFoundError:
+            if self.last_known is not None:
+                self.last_known.forget_flag(name)
             raise FlagNotFoundError from None
         except RepositoryConnectionError:
+            if self.last_known is None or (stale := self.last_known.recall_flag(name)) is None:
+                raise FlagPersistenceError from None
+            flag, age = stale
+            self._served_stale(age)
+        else:
+            if self.last_known is not None:
+                self.last_known.remember_flags([flag])
+        return flag.evaluate()
+
+    async def evaluate_for_users(self, name: str, user_ids: Sequence[str]) -> list[bool]:
+        """
+        Evaluate the `Flag` by `name` for each of the `user_ids` at once, in the same order.
+        A `Flag` with a `rollout_percentage` is enabled for the users hashed into its rollout,
+        expired or disabled `Flags` for none of them.
+        raises: `FlagNotFoundError` and `FlagPersistenceError`
+        """
+        snapshot = self._current_snapshot()
+        record = snapshot.values.get(name) if snapshot is not None else None
+        if record is None:
+            try:
+                record = FlagRecord.from_flag(await self._get_by_name(name))
+            except RepositoryNotFoundError:
+                raise FlagNotFoundError from None
+            except RepositoryConnectionError:
+                raise FlagPersistenceError from None
+        if not record.is_active(self._now_ms()):
+            return [False] * len(user_ids)
+        if record.rollout_percentage is None:
+            return [True] * len(user_ids)
+        return in_rollout_batch(record.id, user_ids, record.rollout_percentage)
+
+    async def get_values(self, names: list[str]) -> dict[str, bool]:
+        """
+        Resolve many `Flags` by `name` at once and return their values,
+        expired `Flags` are reported as disabled and unknown names are left out.
+        While the repo is unreachable the last known good `Flags` are used.
+        """
+        values: dict[str, bool] = {}
+        if (snapshot := self._values_snapshot()) is not None:
+            now_ms = self._now_ms()
+            for name in names:
+                if (value := snapshot.value_of(name, now_ms)) is not None:
+                    values[name] = value
+            names = [name for name in names if name not in values]
+            if not names:
+                return values
+        try:
+            flags = await self.repo.get_many_by_name(names=names)
+        except RepositoryConnectionError:
+            flags = self._recall_flags(names)
+        else:
+            if self.last_known is not None:
+                self.last_known.remember_flags(flags)
+        now = datetime.now(tz=utc)
+        values.update({flag.name: flag.evaluate(now) for flag in flags})
+        return values
+
+    def _recall_flags(self, names: list[str]) -> list[Flag]:
+        """
+        The last known good `Flags` with the given `names`, the unknown ones are left out.
+        raises: `FlagPersistenceError` when none of them is known.
+        """
+        recalled = [
+            stale
+            for name in names
+            if self.last_known is not None and (stale := self.last_known.recall_flag(name))
+        ]
+        if not recalled:
             raise FlagPersistenceError from None
+        self._served_stale(max(age for _, age in recalled))
+        return [flag for flag, _ in recalled]
 
-    async def update_flag(self, flag_id: str, updated_fields: FlagAllowedUpdates) -> Flag:  # type: ignore[return]
+    async def update_flag(
+        self, flag_id: str, updated_fields: FlagAllowedUpdates, expected_version: int | None = None
+    ) -> Flag:
         """
-        Users can `update` existing `Flags` in their `store` by `id`.
+        Users can `update` existing `Flags` in their `store` by `id`,
+        only while the `Flag` is still at `expected_version` when given.
         """
+        # Only the fields that have no value are cleared by `None`, the others are left as they are.
+        fields = {
+            key: value
+            for key, value in updated_fields.items()
+            if value is not None or key in CLEARABLE_FIELDS
+        }
+        fields["date_updated"] = datetime.now(tz=utc)
         try:
-            if existing_flag := await self.repo.get_by_id(_id=flag_id):
-                for key, value in updated_fields.items():
-                    if value is not None:
-                        setattr(existing_flag, key, value)
-                existing_flag.date_updated = datetime.now(tz=utc)
-                return await self.repo.update(existing_flag)
+            updated_flag = await self.repo.update_fields(
+                _id=flag_id, fields=fields, expected_version=expected_version
+            )
         except RepositoryNotFoundError:
             raise FlagNotFoundError from None
+        except RepositoryVersionConflictError as error:
+            raise FlagVersionConflictError(str(error)) from None
+        except RepositoryDuplicateError as error:
+            raise FlagAlreadyExistsError(str(error)) from None
         except RepositoryConnectionError:
             raise FlagPersistenceError from None
+        self._flags_changed(updated_flag.id, updated_flag)
+        return updated_flag
 
     async def get_all_flags(
         self,
         flag_name: str | None = None,
         flag_value: bool | None = None,  # noqa: FBT001
         expired: bool | None = None,  # noqa: FBT001
+        limit: int = 100,
+        after: str | None = None,
     ) -> list[Flag] | None:
+        """
+        Users can page through their `Flags`, `after` is the cursor of the last `Flag`
+        of the previous page as returned by `encode_cursor`.
+        While the repo is unreachable the last known good page is served.
+        raises: `InvalidCursorError` if `after` is not a valid cursor.
+        """
+        try:
+            position = decode_cursor(after) if after is not None else None
+        except ValueError as error:
+            raise InvalidCursorError(str(error)) from None
+        if (snapshot := self._current_snapshot()) is not None and snapshot.complete:
+            return snapshot.get_all(
+                flag_name=flag_name,
+                flag_value=flag_value,
+                expired=expired,
+                limit=limit,
+                after=position,
+            )
+        page_key = (flag_name, flag_value, expired, limit, position)
         try:
             flags = await self.repo.get_all(
                 flag_name=flag_name,
                 flag_value=flag_value,
+                expired=expired,
+                limit=limit,
+                after=position,
             )
-            if expired is not None:
-                flags = [flag for flag in flags if flag.expired == expired]
+        except RepositoryConnectionError:
+            if self.last_known is None or (stale := self.last_known.recall_page(page_key)) is None:
+                raise FlagPersistenceError from None
+            flags, age = stale
+            self._served_stale(age)
             return flags
+        if self.last_known is not None:
+            self.last_known.remember_page(page_key, flags)
+        return flags
+
+    async def export_flags(self, batch_size: int = 500) -> AsyncIterator[Flag]:
+        """
+        Users can `export` all their `Flags` as a stream, without loading them all in memory.
+        """
+        try:
+            async for flag in self.repo.iter_all(batch_size=batch_size):
+                yield flag
+        except RepositoryConnectionError:
+            raise FlagPersistenceError from None
+
+    async def get_changes(self, since: int = 0) -> FlagChanges:
+        """
+        Users can `sync` only the `Flags` created, updated or deleted after the `since` revision.
+        """
+        try:
+            return await self.repo.get_changes(since=since)
         except RepositoryConnectionError:
             raise FlagPersistenceError from None
 
@@ -111,6 +407,7 @@ class FlagBitService:
         """
         try:
             await self.repo.delete(_id=flag_id)
+            self._flags_changed(flag_id)
         except RepositoryNotFoundError:
             err_msg = f"Flag with id: `{flag_id}` not found for deletion."
             raise FlagNotFoundError(err_msg) from None
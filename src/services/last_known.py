@@ -0,0 +1,60 @@
+"""
+The last known good `Flags`, served while the repo is unreachable instead of failing.
+"""
+
+import time
+from collections.abc import Callable, Hashable
+
+from src.cache import TTLCache
+from src.domain.flag import Flag
+
+
+class LastKnownFlags:
+    """
+    Remember every `Flag` and page of `Flags` read from the repo, for `max_age_seconds`,
+    and recall them together with their age in seconds.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10_000,
+        max_age_seconds: float = 3600.0,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._timer = timer
+        self._flags: TTLCache[str, tuple[float, Flag]] = TTLCache(
+            maxsize=maxsize, ttl_seconds=max_age_seconds, timer=timer
+        )
+        self._pages: TTLCache[Hashable, tuple[float, list[Flag]]] = TTLCache(
+            maxsize=maxsize, ttl_seconds=max_age_seconds, timer=timer
+        )
+
+    def remember_flags(self, flags: list[Flag], remembered_at: float | None = None) -> None:
+        """
+        Remember the `flags` as read at `remembered_at`, on the timer clock, now by default.
+        """
+        now = self._timer()
+        if remembered_at is None:
+            remembered_at = now
+        if (ttl_seconds := self._flags.ttl_seconds - (now - remembered_at)) <= 0:
+            return
+        for flag in flags:
+            self._flags.set(flag.name, (remembered_at, flag), ttl_seconds=ttl_seconds)
+
+    def forget_flag(self, name: str) -> None:
+        self._flags.invalidate(name)
+
+    def recall_flag(self, name: str) -> tuple[Flag, float] | None:
+        if (entry := self._flags.get(name)) is None:
+            return None
+        remembered_at, flag = entry
+        return flag, self._timer() - remembered_at
+
+    def remember_page(self, key: Hashable, flags: list[Flag]) -> None:
+        self._pages.set(key, (self._timer(), flags))
+
+    def recall_page(self, key: Hashable) -> tuple[list[Flag], float] | None:
+        if (entry := self._pages.get(key)) is None:
+            return None
+        remembered_at, flags = entry
+        return flags, self._timer() - remembered_at
@@ -0,0 +1,289 @@
+"""
+Flag snapshot shared by every worker of a host through a memory-mapped file.
+
+One worker, the one holding the writer lock, refreshes the snapshot from the repo
+and writes it to the file, replacing the previous one with an atomic rename.
+A refresh finding the same revision only touches the file, its mtime tells it is still fresh.
+Every worker maps the file read-only and evaluates flags with a binary search over it,
+so the flags are held once per host whatever the number of workers.
+
+File layout, in the native byte order as the file never leaves the host,
+with the flags sorted by their UTF-8 encoded name:
+
+    header       magic, revision, built at (epoch ms), flag count, padding   32 bytes
+    expirations  int64 epoch ms per flag, `NEVER_EXPIRES` if it has none      8 * count
+    offsets      uint32 offset of every name in the names blob, plus its end  4 * (count + 1)
+    values       uint8 value per flag, 0 when rolled out to a share of users  count
+    names        the UTF-8 encoded names, back to back
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import mmap
+import os
+import struct
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import IO
+
+from loguru import logger
+from pydantic_settings import BaseSettings
+
+from src.domain.flag import FlagRecord, now_epoch_ms
+from src.services.snapshot import FlagSnapshot
+
+MAGIC = b"FLAGSNP1"
+HEADER = struct.Struct("=8sQqI4x")
+NEVER_EXPIRES = 2**63 - 1
+
+
+class SharedSnapshotConfig(BaseSettings):
+    enabled: bool = False
+    path: Path = Path("data/flags.snapshot")
+    # How often a worker checks whether the file was replaced by a newer snapshot.
+    check_interval_seconds: float = 1.0
+    # A snapshot older than this is not served, e.g. when its writer is gone.
+    max_staleness_seconds: float = 30.0
+    # How often the other workers try to take over the writer lock, e.g. once its writer is gone.
+    writer_retry_seconds: float = 5.0
+
+    class Config:
+        env_prefix = "FLAGBIT_SHARED_SNAPSHOT_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+def encode_snapshot(records: Iterable[FlagRecord], revision: int, built_at: int) -> bytes:
+    """
+    Encode the `records` in the snapshot file layout, `built_at` is in epoch milliseconds.
+    """
+    entries = sorted((record.name.encode(), record) for record in records)
+    count = len(entries)
+    offsets = [0]
+    for name, _ in entries:
+        offsets.append(offsets[-1] + len(name))
+    return b"".join(
+        (
+            HEADER.pack(MAGIC, revision, built_at, count),
+            struct.pack(
+                f"={count}q",
+                *(
+                    NEVER_EXPIRES if record.expires_at is None else record.expires_at
+                    for _, record in entries
+                ),
+            ),
+            struct.pack(f"={count + 1}I", *offsets),
+            bytes(record.value and record.rollout_percentage is None for _, record in entries),
+            *(name for name, _ in entries),
+        )
+    )
+
+
+def write_snapshot_file(path: Path, data: bytes) -> None:
+    """
+    Write `data` next to `path` and rename it over `path`, so a reader maps either the
+    previous snapshot or the new one, never a partially written file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("wb") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+    tmp_path.replace(path)
+
+
+def try_lock_file(lock_path: Path) -> IO[bytes] | None:
+    """
+    The open `lock_path` once locked by this process, `None` if another process holds it.
+    The lock is released by the OS if this process dies, so another one can take over.
+    """
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = lock_path.open("ab")
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def unlock_file(lock_file: IO[bytes]) -> None:
+    with contextlib.suppress(OSError):
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    lock_file.close()
+
+
+class MappedFlagSnapshot:
+    """
+    Read-only view of a snapshot file mapped in memory, the flags are read from the mapping
+    without being loaded, only the names compared by the binary search are copied.
+    """
+
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, revision, built_at, count = HEADER.unpack_from(self._mmap)
+        self.revision: int = revision
+        self.built_at: int = built_at
+        self.count: int = count
+        if magic != MAGIC:
+            self._mmap.close()
+            msg = f"`{path}` is not a flag snapshot file."
+            raise ValueError(msg)
+        view = memoryview(self._mmap)
+        start = HEADER.size
+        self._expirations = view[start : start + 8 * self.count].cast("q")
+        start += 8 * self.count
+        self._offsets = view[start : start + 4 * (self.count + 1)].cast("I")
+        start += 4 * (self.count + 1)
+        self._values = view[start : start + self.count]
+        self._names_start = start + self.count
+        view.release()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _name_at(self, index: int) -> bytes:
+        start = self._names_start
+        return self._mmap[start + self._offsets[index] : start + self._offsets[index + 1]]
+
+    def index_of(self, name: str) -> int | None:
+        encoded = name.encode()
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._name_at(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._name_at(low) == encoded:
+            return low
+        return None
+
+    def value_of(self, name: str, now: int | None = None) -> bool | None:
+        """
+        Evaluate a flag by name at `now`, in epoch milliseconds,
+        `None` if the snapshot does not know it.
+        """
+        if (index := self.index_of(name)) is None:
+            return None
+        now = now if now is not None else now_epoch_ms()
+        return bool(self._values[index]) and self._expirations[index] > now
+
+    def close(self) -> None:
+        for view in (self._expirations, self._offsets, self._values):
+            view.release()
+        self._mmap.close()
+
+
+class SharedFlagSnapshot:
+    """
+    The worker side of the shared snapshot: maps the latest snapshot file, and writes it
+    when this worker holds the writer lock.
+    """
+
+    def __init__(self, config: SharedSnapshotConfig | None = None) -> None:
+        self.config = config or SharedSnapshotConfig()
+        self._mapped: MappedFlagSnapshot | None = None
+        self._mapped_ino: int | None = None
+        # When the writer last found the mapped snapshot up to date, in epoch milliseconds.
+        self._touched_at = 0
+        self._published_revision: int | None = None
+        self._checked_at = float("-inf")
+        self._lock_file: IO[bytes] | None = None
+
+    @property
+    def is_writer(self) -> bool:
+        return self._lock_file is not None
+
+    def try_acquire_writer(self) -> bool:
+        """
+        Become the worker writing the snapshot if no other process on the host is.
+        The lock is released by the OS if this process dies, so a new worker can take over.
+        """
+        if self._lock_file is not None:
+            return True
+        lock_path = self.config.path.with_name(f"{self.config.path.name}.lock")
+        if (lock_file := try_lock_file(lock_path)) is None:
+            return False
+        self._lock_file = lock_file
+        logger.info(f"This worker writes the shared flag snapshot `{self.config.path}`.")
+        return True
+
+    async def acquire_writer(self) -> None:
+        """
+        Wait until this worker becomes the writer, trying every `writer_retry_seconds`.
+        """
+        # The lock is held by another process, only polling it tells when it is released.
+        while True:
+            if self.try_acquire_writer():
+                return
+            await asyncio.sleep(self.config.writer_retry_seconds)
+
+    def publish(self, snapshot: FlagSnapshot) -> None:
+        """
+        Write the `snapshot` for every worker, called by the writer after each refresh.
+        A `snapshot` at the revision written last only has the file touched.
+        """
+        if snapshot.revision == self._published_revision:
+            with contextlib.suppress(FileNotFoundError):
+                os.utime(self.config.path)
+                self._checked_at = float("-inf")
+                return
+        data = encode_snapshot(
+            snapshot.values.values(), revision=snapshot.revision, built_at=now_epoch_ms()
+        )
+        write_snapshot_file(self.config.path, data)
+        self._published_revision = snapshot.revision
+        self._checked_at = float("-inf")
+
+    @property
+    def current(self) -> MappedFlagSnapshot | None:
+        """
+        The latest snapshot file, remapped at most every `check_interval_seconds` when it was
+        replaced, or `None` if there is none or it is older than `max_staleness_seconds`.
+        """
+        if time.monotonic() - self._checked_at >= self.config.check_interval_seconds:
+            self._checked_at = time.monotonic()
+            self._remap_if_replaced()
+        mapped = self._mapped
+        if mapped is None:
+            return None
+        fresh_at = max(mapped.built_at, self._touched_at)
+        if now_epoch_ms() - fresh_at > self.config.max_staleness_seconds * 1000:
+            return None
+        return mapped
+
+    def _remap_if_replaced(self) -> None:
+        try:
+            stat = self.config.path.stat()
+        except FileNotFoundError:
+            return
+        if stat.st_ino == self._mapped_ino:
+            # The mapped file, maybe touched since: a new snapshot is renamed over it as a new
+            # inode, and the mapped one is not reused while it stays mapped.
+            self._touched_at = stat.st_mtime_ns // 1_000_000
+            return
+        try:
+            mapped = MappedFlagSnapshot(self.config.path)
+        except (OSError, ValueError, struct.error) as error:
+            logger.warning(f"Shared flag snapshot could not be mapped: `{error}`")
+            return
+        previous, self._mapped = self._mapped, mapped
+        self._mapped_ino = stat.st_ino
+        self._touched_at = stat.st_mtime_ns // 1_000_000
+        if previous is not None:
+            previous.close()
+
+    def close(self) -> None:
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+            self._mapped_ino = None
+        if self._lock_file is not None:
+            unlock_file(self._lock_file)
+            self._lock_file = None
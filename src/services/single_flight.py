@@ -0,0 +1,62 @@
+"""
+Request coalescing: concurrent identical lookups share one in-flight call to the repo.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+
+from pydantic_settings import BaseSettings
+
+from src.metrics import SINGLE_FLIGHT_CALLS
+
+
+class SingleFlightConfig(BaseSettings):
+    enabled: bool = True
+
+    class Config:
+        env_prefix = "FLAGBIT_SINGLE_FLIGHT_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+class SingleFlight[V]:
+    """
+    Run at most one call per `(kind, key)` at a time. Callers asking for a key already
+    in flight wait for the same call, and get its result or its exception.
+
+    The call runs as its own task, so a caller giving up, e.g. a client disconnecting,
+    does not cancel it for the other callers waiting on it.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: dict[tuple[str, str], asyncio.Task[V]] = {}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def do(self, kind: str, key: str, fn: Callable[[], Awaitable[V]]) -> V:
+        flight_key = (kind, key)
+        if (task := self._in_flight.get(flight_key)) is not None:
+            SINGLE_FLIGHT_CALLS.inc(kind, "coalesced")
+            return await asyncio.shield(task)
+        SINGLE_FLIGHT_CALLS.inc(kind, "leader")
+        task = asyncio.ensure_future(fn())
+        self._in_flight[flight_key] = task
+        task.add_done_callback(lambda done: self._landed(flight_key, done))
+        return await asyncio.shield(task)
+
+    def _landed(self, flight_key: tuple[str, str], task: asyncio.Task[V]) -> None:
+        if self._in_flight.get(flight_key) is task:
+            del self._in_flight[flight_key]
+        # Retrieve the exception, so it is not reported as never retrieved
+        # when every caller gave up before the call landed.
+        if not task.cancelled():
+            task.exception()
+
+    def clear(self) -> None:
+        """
+        Let the next lookups start their own calls, e.g. after a write, so they cannot
+        join a call started before it. The calls in flight still land for their callers.
+        """
+        self._in_flight.clear()
@@ -0,0 +1,231 @@
+"""
+Immutable in-memory snapshot of all flags, rebuilt in the background and published
+with a single reference swap so evaluations never touch the repository.
+"""
+
+import asyncio
+import bisect
+import contextlib
+import copy
+import dataclasses
+import itertools
+import time
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass
+from datetime import datetime
+from types import MappingProxyType
+
+from loguru import logger
+from pydantic_settings import BaseSettings
+from pytz import utc
+
+from src._types import FLAG_CURSOR_T
+from src.domain.flag import Flag, FlagRecord, now_epoch_ms
+from src.exceptions import RepositoryConnectionError
+from src.repo.base import FlagsShipRepo
+
+
+class SnapshotConfig(BaseSettings):
+    enabled: bool = False
+    refresh_interval_seconds: float = 5.0
+    max_staleness_seconds: float = 30.0
+    max_flags: int = 100_000
+
+    class Config:
+        env_prefix = "FLAGBIT_SNAPSHOT_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+@dataclass(frozen=True, slots=True)
+class FlagSnapshot:
+    """
+    Read-only view of every `Flag` at some collection `revision`.
+    `values` maps a flag name to its compact `FlagRecord`,
+    `flags` are kept in the `(date_created, id)` pagination order
+    and `expirations` holds every expiration as epoch milliseconds, sorted.
+    A snapshot cut at `max_flags` is not `complete`, only the repo lists every `Flag`.
+    """
+
+    revision: int
+    built_at: float
+    values: Mapping[str, FlagRecord]
+    flags: tuple[Flag, ...]
+    cursors: tuple[FLAG_CURSOR_T, ...]
+    expirations: tuple[int, ...]
+    complete: bool = True
+
+    @classmethod
+    def build(
+        cls, flags: Iterable[Flag], revision: int, built_at: float, *, complete: bool = True
+    ) -> "FlagSnapshot":
+        frozen = tuple(sorted((copy.copy(flag) for flag in flags), key=lambda flag: flag.cursor))
+        values = {flag.name: FlagRecord.from_flag(flag) for flag in frozen}
+        return cls(
+            revision=revision,
+            built_at=built_at,
+            complete=complete,
+            values=MappingProxyType(values),
+            flags=frozen,
+            cursors=tuple(flag.cursor for flag in frozen),
+            expirations=tuple(
+                sorted(
+                    record.expires_at for record in values.values() if record.expires_at is not None
+                )
+            ),
+        )
+
+    def expired_count(self, now: int | None = None) -> int:
+        """
+        How many flags of the snapshot have expired at `now`, in epoch milliseconds.
+        Together with the `revision` it identifies everything the snapshot evaluates to.
+        """
+        return bisect.bisect_right(self.expirations, now if now is not None else now_epoch_ms())
+
+    def value_of(self, name: str, now: int | None = None) -> bool | None:
+        """
+        Evaluate a flag by name at `now`, in epoch milliseconds,
+        `None` if the snapshot does not know it.
+        """
+        if (record := self.values.get(name)) is None:
+            return None
+        return record.evaluate(now if now is not None else now_epoch_ms())
+
+    def get_all(
+        self,
+        flag_name: str | None = None,
+        flag_value: bool | None = None,  # noqa: FBT001
+        expired: bool | None = None,  # noqa: FBT001
+        limit: int = 100,
+        after: FLAG_CURSOR_T | None = None,
+    ) -> list[Flag]:
+        """
+        Same filtering and ordering as `FlagsShipRepo.get_all`, served from memory.
+        """
+        start = bisect.bisect_right(self.cursors, after) if after is not None else 0
+        now = datetime.now(tz=utc)
+        flags: list[Flag] = []
+        for flag in itertools.islice(self.flags, start, None):
+            if len(flags) == limit:
+                break
+            if (
+                (flag_name is None or flag.name == flag_name)
+                and (flag_value is None or flag.value == flag_value)
+                and (expired is None or flag.is_expired(now) == expired)
+            ):
+                flags.append(flag)
+        return flags
+
+
+class FlagSnapshotManager:
+    """
+    Own the current `FlagSnapshot` and rebuild it from the repo every `refresh_interval_seconds`
+    or as soon as a refresh is requested after a write.
+    Listeners are called with every snapshot it publishes, including the current one
+    restamped by a refresh finding the same revision.
+    """
+
+    def __init__(self, repo: FlagsShipRepo, config: SnapshotConfig | None = None) -> None:
+        self.repo = repo
+        self.config = config or SnapshotConfig()
+        self._current: FlagSnapshot | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._listeners: list[Callable[[FlagSnapshot], None]] = []
+
+    def add_listener(self, listener: Callable[[FlagSnapshot], None]) -> None:
+        self._listeners.append(listener)
+
+    @property
+    def current(self) -> FlagSnapshot | None:
+        """
+        The latest snapshot, or `None` if it is older than `max_staleness_seconds`.
+        """
+        snapshot = self._current
+        if snapshot is None:
+            return None
+        if time.monotonic() - snapshot.built_at > self.config.max_staleness_seconds:
+            return None
+        return snapshot
+
+    async def refresh(self) -> FlagSnapshot:
+        """
+        Rebuild the snapshot from the repo and publish it.
+        The revision is read first, so the snapshot is never newer than it claims to be.
+        When nothing was written since the current snapshot, it is only restamped as built now.
+        """
+        revision = await self.repo.get_revision()
+        if (current := self._current) is not None and current.revision == revision:
+            snapshot = dataclasses.replace(current, built_at=time.monotonic())
+            self._publish(snapshot)
+            return snapshot
+        max_flags = self.config.max_flags
+        flags = await self.repo.get_all(limit=max_flags + 1)
+        if complete := len(flags) <= max_flags:
+            logger.debug(f"Flag snapshot rebuilt at revision {revision} with {len(flags)} flags.")
+        else:
+            flags = flags[:max_flags]
+            logger.warning(
+                f"Flag snapshot cut at {max_flags} flags, raise `max_flags` to hold them all, "
+                "the listings are served by the repo meanwhile."
+            )
+        snapshot = FlagSnapshot.build(
+            flags=flags, revision=revision, built_at=time.monotonic(), complete=complete
+        )
+        self._publish(snapshot)
+        return snapshot
+
+    def seed(self, snapshot: FlagSnapshot) -> None:
+        """
+        Publish a snapshot built elsewhere, e.g. loaded from disk, until the first refresh.
+        """
+        self._publish(snapshot)
+        logger.debug(f"Flag snapshot seeded at revision {snapshot.revision}.")
+
+    def _publish(self, snapshot: FlagSnapshot) -> None:
+        self._current = snapshot
+        for listener in self._listeners:
+            # A failing listener must neither keep the others from the snapshot nor stop refreshes.
+            try:
+                listener(snapshot)
+            except Exception:  # noqa: BLE001
+                logger.exception(f"Flag snapshot listener {listener!r} failed.")
+
+    def request_refresh(self) -> None:
+        self._wakeup.set()
+
+    async def start(self, *, wait: bool = True) -> None:
+        """
+        Build the first snapshot and keep refreshing it in the background.
+        Unless `wait`, the first one is built in the background too.
+        """
+        if not wait:
+            self._wakeup.set()
+        else:
+            try:
+                await self.refresh()
+            except RepositoryConnectionError as error:
+                logger.warning(f"Initial flag snapshot could not be built: `{error}`")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=self.config.refresh_interval_seconds
+                )
+            self._wakeup.clear()
+            try:
+                await self.refresh()
+            except RepositoryConnectionError as error:
+                logger.warning(f"Flag snapshot refresh failed, keeping the previous one: `{error}`")
+            except Exception:  # noqa: BLE001
+                logger.exception("Flag snapshot refresh failed, keeping the previous one.")
@@ -0,0 +1,136 @@
+"""
+Warm start: the last flag snapshot of a host, kept on its local disk, so a new worker
+serves the flags right away instead of waiting for the database on its first requests.
+
+The file holds the revision and every flag, as written by the snapshot refresher
+of one worker of the host, and is replaced with an atomic rename on every new revision.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import IO
+
+from loguru import logger
+from pydantic_settings import BaseSettings
+
+from src.repo.embedded import flag_to_record, record_to_flag
+from src.services.shared_snapshot import try_lock_file, unlock_file
+from src.services.snapshot import FlagSnapshot
+
+
+class FastStartConfig(BaseSettings):
+    # Start serving before the storage is checked, from the warm snapshot when there is one.
+    # Turns the in-process snapshot on, it serves the warm snapshot and writes it.
+    enabled: bool = False
+    snapshot_path: Path = Path("data/flags.warm.json")
+    # A warm snapshot older than this is not loaded, the flags it holds are too old to serve.
+    max_age_seconds: float = 86_400.0
+
+    class Config:
+        env_prefix = "FLAGBIT_FAST_START_"
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+def save_warm_snapshot(path: Path, snapshot: FlagSnapshot) -> None:
+    """
+    Write the `snapshot` next to the file and rename it over it, so a worker starting
+    meanwhile reads either the previous snapshot or this one, never a partial one.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "revision": snapshot.revision,
+        "flags": [flag_to_record(flag) for flag in snapshot.flags],
+    }
+    # A worker taking over from a writer still finishing its write uses another temporary file.
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(document, separators=(",", ":")))
+    tmp_path.replace(path)
+
+
+def load_warm_snapshot(path: Path, max_age_seconds: float) -> FlagSnapshot | None:
+    """
+    The warm snapshot at `path`, `None` when there is none, it is older than
+    `max_age_seconds` or it cannot be read.
+    It counts as built when the file was written, on the `time.monotonic` clock, so it is
+    only served while younger than `max_staleness_seconds`, and its `Flags` are as old.
+    """
+    try:
+        age_seconds = time.time() - path.stat().st_mtime
+        if age_seconds > max_age_seconds:
+            logger.info(f"Warm flag snapshot {path} is {age_seconds:.0f}s old, not loading it.")
+            return None
+        document = json.loads(path.read_text())
+        flags = [record_to_flag(record) for record in document["flags"]]
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        logger.warning(f"Warm flag snapshot {path} could not be loaded: `{error}`")
+        return None
+    logger.info(
+        f"Loaded {len(flags)} flags at revision {document['revision']} "
+        f"from the warm snapshot {path}, {age_seconds:.0f}s old."
+    )
+    return FlagSnapshot.build(
+        flags=flags, revision=document["revision"], built_at=time.monotonic() - age_seconds
+    )
+
+
+class WarmSnapshotWriter:
+    """
+    Snapshot listener writing every snapshot with a new revision to the warm snapshot file,
+    in a thread so the event loop keeps serving. Only the worker holding the lock next to
+    the file writes it, the others take over once it is gone.
+    A write in progress is followed by the latest snapshot only, the ones in between are skipped.
+    """
+
+    def __init__(self, path: Path, revision: int | None = None) -> None:
+        self.path = path
+        self.revision = revision
+        self._latest: FlagSnapshot | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._lock_file: IO[bytes] | None = None
+
+    def __call__(self, snapshot: FlagSnapshot) -> None:
+        if snapshot.revision == self.revision or not self._try_lock():
+            return
+        self._latest = snapshot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._write())
+
+    def _try_lock(self) -> bool:
+        if self._lock_file is None:
+            try:
+                self._lock_file = try_lock_file(self.path.with_name(f"{self.path.name}.lock"))
+            except OSError as error:
+                logger.warning(f"Warm flag snapshot {self.path} could not be locked: `{error}`")
+        return self._lock_file is not None
+
+    async def _write(self) -> None:
+        while (snapshot := self._latest) is not None:
+            self._latest = None
+            if snapshot.revision == self.revision:
+                continue
+            try:
+                await asyncio.to_thread(save_warm_snapshot, self.path, snapshot)
+            except OSError as error:
+                logger.warning(f"Warm flag snapshot {self.path} could not be written: `{error}`")
+                continue
+            self.revision = snapshot.revision
+
+    async def close(self) -> None:
+        """
+        Finish the write in progress, then let another worker take over.
+        """
+        if self._task is not None:
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._lock_file is not None:
+            unlock_file(self._lock_file)
+            self._lock_file = None
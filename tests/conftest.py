@@ -6,7 +6,7 @@ from faker import Faker
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
-from src.api.dependencies import get_flag_bit_service
+from src.api.dependencies import get_flag_bit_service, get_read_only_flag_bit_service
 from src.api.flags_router import flags_router
 from src.domain.flag import Flag
 from src.repo.fake_repo import FakeInMemoryRepo
@@ -38,6 +38,9 @@ def flagship_with_in_memory_repo():
 @pytest.fixture(scope="function", autouse=True)
 def override_get_flagship_service(test_app, flagship_with_in_memory_repo):
     test_app.dependency_overrides[get_flag_bit_service] = lambda: flagship_with_in_memory_repo
+    test_app.dependency_overrides[get_read_only_flag_bit_service] = (
+        lambda: flagship_with_in_memory_repo
+    )
     yield
     test_app.dependency_overrides.clear()
 
@@ -1,6 +1,20 @@
+import json
+from datetime import datetime, timedelta
 from http import HTTPStatus
 
 import pytest
+from pydantic import TypeAdapter
+from pytz import utc
+
+from src.api.dependencies import get_flag_bit_service, get_read_only_flag_bit_service
+from src.api.flags_router import encode_flags
+from src.api.models import FlagResponse
+from src.cache import TTLCache
+from src.domain.rollout import in_rollout
+from src.helpers import encode_cursor
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.services.flagbit import FlagBitService
+from src.services.snapshot import FlagSnapshotManager
 
 
 @pytest.mark.asyncio
@@ -107,6 +121,57 @@ async def test_user_can_update_an_existing_flag(client, fake_flags_fixture):
     assert expected_response["desc"] == updated_data["desc"], "Flag description should match"
 
 
+@pytest.mark.asyncio
+async def test_user_can_update_a_flag_only_at_the_version_it_read(client, fake_flags_fixture):
+    """
+    Given an existing `Flag` and the `ETag` of its version
+    When I call the `/flags/{flag_id}` endpoint with a PATCH request and that `If-Match` twice,
+    Then I'm expecting the first update to succeed with the next version as its `ETag`,
+         and the second one to get a `412` since the flag changed in between
+    """
+    # Given
+    flags = await fake_flags_fixture(1)
+    flag_id = flags[0].id
+    etag = client.get(f"/flags/{flag_id}").headers["ETag"]
+
+    # When
+    first = client.patch(f"/flags/{flag_id}", json={"value": False}, headers={"If-Match": etag})
+    second = client.patch(f"/flags/{flag_id}", json={"value": True}, headers={"If-Match": etag})
+
+    # Then
+    assert first.status_code == HTTPStatus.OK, "Expected status code 200"
+    assert first.json()["version"] == 2
+    assert first.headers["ETag"] == '"v2"'
+    assert second.status_code == HTTPStatus.PRECONDITION_FAILED, "Expected status code 412"
+    assert client.get(f"/flags/{flag_id}").json()["value"] is False
+
+
+@pytest.mark.asyncio
+async def test_user_can_clear_the_rollout_of_a_flag(client, flagship_with_in_memory_repo):
+    """
+    Given a `Flag` rolled out to 25% of the users
+    When I call the `/flags/{flag_id}` endpoint with a PATCH request setting the rollout to `null`,
+    Then I'm expecting the rollout to be cleared and the other fields to be kept,
+         and the flag to be disabled without a user id until then
+    """
+    # Given
+    flag = await flagship_with_in_memory_repo.create_flag(
+        name="rollout", value=True, desc="kept", rollout_percentage=25
+    )
+    value_during_rollout = client.get("/flags/rollout/value").json()
+
+    # When
+    response = client.patch(f"/flags/{flag.id}", json={"rollout_percentage": None})
+
+    # Then
+    assert response.status_code == HTTPStatus.OK, "Expected status code 200"
+    assert response.json()["rollout_percentage"] is None
+    assert (response.json()["name"], response.json()["desc"]) == ("rollout", "kept")
+    assert value_during_rollout is False, "No user is known to be in the rollout"
+    assert client.get("/flags/rollout/value").json() is True
+    assert client.post("/flags/values", json={"names": ["rollout"]}).json() == {"rollout": True}
+
+
 def test_user_cannot_update_a_non_existing_flag(client):
     """
     Given a non-existing `Flag` ID
@@ -165,3 +230,287 @@ def test_user_cannot_delete_a_non_existing_flag(client):
 
     # Then
     assert response.status_code == HTTPStatus.NOT_FOUND, "Expected status code 404"
+
+
+@pytest.mark.asyncio
+async def test_user_can_retrieve_only_the_flags_changed_since_a_revision(client, fake_flags_fixture):
+    """
+    Given some existing `Flags` and the revision returned by a previous sync
+    When I call the `/flags/changes` endpoint with that revision,
+    Then I'm expecting only the `Flags` created after it
+    """
+    # Given
+    await fake_flags_fixture(3)
+    revision = client.get("/flags/changes").json()["revision"]
+    new_flags = await fake_flags_fixture(1)
+
+    # When
+    response = client.get("/flags/changes", params={"since": revision})
+
+    # Then
+    assert response.status_code == HTTPStatus.OK, "Expected status code 200"
+    data = response.json()
+    assert [flag["id"] for flag in data["flags"]] == [new_flags[0].id]
+    assert data["deleted"] == []
+    assert data["revision"] == revision + 1
+
+
+@pytest.mark.asyncio
+async def test_user_can_retrieve_many_flag_values_in_one_request(client, fake_flags_fixture):
+    """
+    Given some existing `Flags`
+    When I call the `/flags/values` endpoint with a POST request and their names,
+    Then I'm expecting a `name` -> `value` mapping for all of them
+    """
+    # Given
+    flags = await fake_flags_fixture(3)
+
+    # When
+    response = client.post("/flags/values", json={"names": [flag.name for flag in flags]})
+
+    # Then
+    assert response.status_code == HTTPStatus.OK, "Expected status code 200"
+    assert response.json() == {flag.name: flag.value for flag in flags}
+
+
+def test_user_cannot_create_a_flag_with_an_existing_name(client):
+    """
+    Given an existing `Flag`
+    When I call the `/flags` endpoint with a POST request and the same name,
+    Then I'm expecting a `409` status code
+    """
+    # Given
+    client.post("/flags", json={"name": "existing_feature", "value": True})
+
+    # When
+    response = client.post("/flags", json={"name": "existing_feature", "value": False})
+
+    # Then
+    assert response.status_code == HTTPStatus.CONFLICT, "Expected status code 409"
+
+
+@pytest.mark.asyncio
+async def test_user_can_page_through_flags_with_the_next_cursor_header(client, fake_flags_fixture):
+    """
+    Given some existing `Flags`
+    When I call the `/flags` endpoint with a `limit` and follow the `X-Next-Cursor` header,
+    Then I'm expecting every `Flag` once and no cursor on the last page
+    """
+    # Given
+    await fake_flags_fixture(3)
+
+    # When
+    first_page = client.get("/flags", params={"limit": 2})
+    next_cursor = first_page.headers["X-Next-Cursor"]
+    last_page = client.get("/flags", params={"limit": 2, "after": next_cursor})
+
+    # Then
+    assert len(first_page.json()) == 2
+    assert len(last_page.json()) == 1
+    assert "X-Next-Cursor" not in last_page.headers, "The last page should not have a cursor"
+
+
+def test_user_cannot_page_with_an_invalid_cursor(client):
+    """
+    Given a malformed cursor
+    When I call the `/flags` endpoint with it,
+    Then I'm expecting a `400` status code
+    """
+    response = client.get("/flags", params={"after": "not-a-cursor"})
+    assert response.status_code == HTTPStatus.BAD_REQUEST, "Expected status code 400"
+
+
+@pytest.mark.asyncio
+async def test_user_cannot_page_with_a_cursor_date_without_timezone(client, fake_flags_fixture):
+    """
+    Given some existing `Flags` and a cursor whose date has no timezone
+    When I call the `/flags` endpoint with it,
+    Then I'm expecting a `400` status code instead of failing to compare it
+    """
+    cursor = encode_cursor((datetime(2024, 1, 1), "some-flag-id"))
+    response = client.get("/flags", params={"after": cursor})
+    assert response.status_code == HTTPStatus.BAD_REQUEST, "Expected status code 400"
+
+
+@pytest.mark.asyncio
+async def test_user_can_export_all_flags_as_ndjson(client, fake_flags_fixture):
+    """
+    Given some existing `Flags`
+    When I call the `/flags/export` endpoint,
+    Then I'm expecting one JSON document per line for every `Flag`
+    """
+    # Given
+    flags = await fake_flags_fixture(3)
+
+    # When
+    response = client.get("/flags/export", params={"batch_size": 2})
+
+    # Then
+    assert response.status_code == HTTPStatus.OK, "Expected status code 200"
+    assert response.headers["content-type"] == "application/x-ndjson"
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [flag["id"] for flag in exported] == [flag.id for flag in flags]
+
+
+def test_user_can_create_many_flags_with_partial_failures(client):
+    """
+    Given an existing `Flag`
+    When I call the `/flags/batch` endpoint with two new `Flags` and one with the existing name,
+    Then I'm expecting the new ones to be created, the other one to be reported
+         and the response status code to be `207`
+    """
+    # Given
+    client.post("/flags", json={"name": "existing_feature", "value": True})
+    batch = {
+        "flags": [
+            {"name": "first_feature", "value": True},
+            {"name": "existing_feature", "value": False},
+            {"name": "second_feature", "value": False, "desc": "second"},
+        ]
+    }
+
+    # When
+    response = client.post("/flags/batch", json=batch)
+
+    # Then
+    assert response.status_code == HTTPStatus.MULTI_STATUS, "Expected status code 207"
+    data = response.json()
+    assert (data["created"], data["failed"]) == (2, 1)
+    failed = [item for item in data["results"] if item["error"]]
+    assert [(item["index"], item["id"]) for item in failed] == [(1, None)]
+    assert client.post("/flags/values", json={"names": ["first_feature", "second_feature"]}).json() == {
+        "first_feature": True,
+        "second_feature": False,
+    }
+
+
+@pytest.mark.asyncio
+async def test_user_gets_not_modified_for_unchanged_flags(client, fake_flags_fixture):
+    """
+    Given some existing `Flags` and the `ETag` of a previous `/flags` response
+    When I call the `/flags` endpoint again with `If-None-Match`,
+    Then I'm expecting a `304` without a body until a `Flag` changes
+    """
+    # Given
+    flags = await fake_flags_fixture(2)
+    etag = client.get("/flags").headers["ETag"]
+
+    # When
+    not_modified = client.get("/flags", headers={"If-None-Match": etag})
+    client.patch(f"/flags/{flags[0].id}", json={"desc": "changed"})
+    modified = client.get("/flags", headers={"If-None-Match": etag})
+
+    # Then
+    assert not_modified.status_code == HTTPStatus.NOT_MODIFIED, "Expected status code 304"
+    assert not_modified.content == b""
+    assert modified.status_code == HTTPStatus.OK, "Expected status code 200 after a change"
+    assert modified.headers["ETag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_user_gets_not_modified_for_an_unchanged_flag_value(client, fake_flags_fixture):
+    """
+    Given an existing `Flag` and the `ETag` of its value
+    When I call the `/flags/{flag_name}/value` endpoint again with `If-None-Match`,
+    Then I'm expecting a `304`
+    """
+    # Given
+    flags = await fake_flags_fixture(1)
+    first = client.get(f"/flags/{flags[0].name}/value")
+
+    # When
+    response = client.get(
+        f"/flags/{flags[0].name}/value", headers={"If-None-Match": first.headers["ETag"]}
+    )
+
+    # Then
+    assert first.json() == flags[0].value
+    assert response.status_code == HTTPStatus.NOT_MODIFIED, "Expected status code 304"
+
+
+@pytest.mark.asyncio
+async def test_flags_are_encoded_exactly_like_the_response_model(fake_flags_fixture):
+    """
+    Given some existing `Flags`, one of them expired
+    When I encode them through the fast path,
+    Then I'm expecting the same bytes as through the `FlagResponse` model
+    """
+    # Given
+    flags = await fake_flags_fixture(3)
+    flags[0].expiration_date = datetime.now(tz=utc) - timedelta(days=1)
+    adapter = TypeAdapter(list[FlagResponse])
+
+    # When
+    body = encode_flags(flags)
+
+    # Then
+    assert body == adapter.dump_json(adapter.validate_python(flags, from_attributes=True))
+    assert json.loads(body)[0]["expired"] is True
+
+
+@pytest.mark.asyncio
+async def test_user_gets_the_cached_page_while_the_flags_are_unchanged(test_app, client):
+    """
+    Given a `FlagBitService` served from a snapshot and a page cache
+    When I call the `/flags` endpoint twice, then again after a `Flag` was created,
+    Then I'm expecting the second page from the cache and a fresh one after the change
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    manager = FlagSnapshotManager(repo=repo)
+    flagbit = FlagBitService(repo=repo, snapshot=manager)
+    test_app.dependency_overrides[get_flag_bit_service] = lambda: flagbit
+    test_app.dependency_overrides[get_read_only_flag_bit_service] = lambda: flagbit
+    test_app.state.flags_pages_cache = pages = TTLCache()
+    await flagbit.create_flag("first flag", value=True)
+    await manager.refresh()
+
+    # When
+    first = client.get("/flags")
+    second = client.get("/flags")
+    await flagbit.create_flag("second flag", value=True)
+    await manager.refresh()
+    third = client.get("/flags")
+    del test_app.state.flags_pages_cache
+
+    # Then
+    assert first.content == second.content and first.headers["ETag"] == second.headers["ETag"]
+    assert [flag["name"] for flag in third.json()] == ["first flag", "second flag"]
+    assert (pages.stats.hits, pages.stats.misses) == (1, 2)
+
+
+@pytest.mark.asyncio
+async def test_user_can_evaluate_a_rollout_flag_for_many_users(
+    client, flagship_with_in_memory_repo
+):
+    """
+    Given a `Flag` rolled out to 25% of the users, and an expired one
+    When I evaluate both for 1000 user ids,
+    Then I'm expecting one value per user id, about a quarter of them enabled for the first one,
+         matching the SDK, and none of them for the expired one
+    """
+    # Given
+    flag = await flagship_with_in_memory_repo.create_flag(
+        name="rollout", value=True, rollout_percentage=25
+    )
+    expired = await flagship_with_in_memory_repo.create_flag(
+        name="expired", value=True, rollout_percentage=100
+    )
+    expired.expiration_date = datetime.now(tz=utc) - timedelta(days=1)
+    user_ids = [f"user-{i}" for i in range(1000)]
+
+    # When
+    response = client.post("/flags/rollout/evaluate", json={"user_ids": user_ids})
+    expired_response = client.post("/flags/expired/evaluate", json={"user_ids": user_ids})
+
+    # Then
+    assert response.status_code == HTTPStatus.OK
+    body = response.json()
+    assert body["values"] == [in_rollout(flag.id, user_id, 25) for user_id in user_ids]
+    assert body["enabled"] == sum(body["values"])
+    assert 200 < body["enabled"] < 300
+    assert expired_response.json()["enabled"] == 0
+    assert (
+        client.post("/flags/unknown/evaluate", json={"user_ids": ["a"]}).status_code
+        == HTTPStatus.NOT_FOUND
+    )
@@ -0,0 +1,54 @@
+"""
+Test cases for `benchmark.py`.
+"""
+
+import httpx
+import pytest
+
+from src.cli.benchmark import CommandCounter, run_benchmark, run_scenario
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark_runs_every_scenario_against_the_memory_backend():
+    """
+    Given the app backed by a `FakeInMemoryRepo`
+    When I run a tiny benchmark through its ASGI interface
+    Then I'm expecting every scenario to be reported without errors
+    """
+    # When
+    report = await run_benchmark(
+        backend="memory", transport="asgi", concurrency=2, dataset_size=5, requests=10
+    )
+
+    # Then
+    assert report["meta"]["backend"] == "memory"
+    assert set(report["scenarios"]) == {"get_value", "get_flags", "create_flag", "update_flag"}
+    for name, result in report["scenarios"].items():
+        assert result["requests"] == 10, name
+        assert result["errors"] == 0, name
+        assert result["mongo_commands_per_request"] is None, name
+
+
+@pytest.mark.asyncio
+async def test_run_scenario_reports_the_mongo_commands_per_request():
+    """
+    Given an app sending 3 commands to MongoDB for every request
+    When I run a scenario against it while counting the commands
+    Then I'm expecting 3 commands per request to be reported
+    """
+    # Given
+    commands = CommandCounter()
+
+    def handle(_request):
+        commands.count += 3
+        return httpx.Response(200)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handle), base_url="http://bench")
+
+    # When
+    result = await run_scenario(
+        client, "update_flag", lambda _: ("PATCH", "/flags/id", {}), 10, 2, commands=commands
+    )
+
+    # Then
+    assert result.mongo_commands_per_request == 3
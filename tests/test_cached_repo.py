@@ -0,0 +1,168 @@
+"""
+Test cases for `cache.py` and `cached_repo.py`.
+"""
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from src.api.dependencies import get_flags_repo, get_read_only_flags_repo
+from src.cache import TTLCache
+from src.clients.mongo_db_client import MongoDBAsyncClient, MongoDBConfig
+from src.domain.flag import Flag
+from src.repo.cached_repo import CachedRepo
+from src.repo.doc_store import DocStoreRepo
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.services.flagbit import FlagAllowedUpdates, FlagBitService
+
+
+class FakeTimer:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache_entries_expire_after_their_ttl():
+    """
+    Given a `TTLCache` with a 10 seconds ttl and one entry
+    When the ttl elapses,
+    Then I'm expecting the entry to be gone and a miss to be recorded
+    """
+    # Given
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=2, ttl_seconds=10, timer=timer)
+    cache.set("flag", 1)
+
+    # When
+    first = cache.get("flag")
+    timer.now = 10
+    second = cache.get("flag")
+
+    # Then
+    assert first == 1, "Entry should be served before it expires"
+    assert second is None, "Entry should be gone after its ttl"
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_ttl_cache_evicts_the_least_recently_used_entry():
+    """
+    Given a full `TTLCache`
+    When I insert a new entry,
+    Then I'm expecting the least recently used entry to be evicted
+    """
+    # Given
+    cache = TTLCache(maxsize=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+
+    # When
+    cache.set("c", 3)
+
+    # Then
+    assert "b" not in cache, "The least recently used entry should be evicted"
+    assert "a" in cache and "c" in cache
+    assert cache.stats.evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_repo_serves_repeated_name_lookups_from_the_cache():
+    """
+    Given a `CachedRepo` in front of a repo with one `Flag`
+    When I call `get_by_name` twice,
+    Then I'm expecting the wrapped repo to be queried only once
+    """
+    # Given
+    inner = FakeInMemoryRepo()
+    flag = Flag(name="my flag", value=True)
+    await inner.store(flag)
+    inner.get_by_name = AsyncMock(wraps=inner.get_by_name)
+    repo = CachedRepo(repo=inner, cache=TTLCache(maxsize=10, ttl_seconds=60))
+
+    # When
+    first = await repo.get_by_name("my flag")
+    second = await repo.get_by_name("my flag")
+
+    # Then
+    assert first is second is flag
+    assert inner.get_by_name.call_count == 1, "Second lookup should be served from the cache"
+
+
+@pytest.mark.asyncio
+async def test_service_writes_invalidate_the_cached_flag():
+    """
+    Given a `FlagBitService` using a `CachedRepo` and a cached `Flag`
+    When I rename and then delete the `Flag`,
+    Then I'm expecting the cache to never serve the old entry
+    """
+    # Given
+    cache = TTLCache(maxsize=10, ttl_seconds=60)
+    flagbit = FlagBitService(repo=CachedRepo(repo=FakeInMemoryRepo(), cache=cache))
+    flag = await flagbit.create_flag("old name", value=True)
+    assert await flagbit.is_enabled("old name") is True
+
+    # When
+    await flagbit.update_flag(flag.id, FlagAllowedUpdates(name="new name", value=False))
+
+    # Then
+    assert "old name" not in cache, "Renaming should drop the entry under the old name"
+    assert await flagbit.is_enabled("new name") is False
+
+    # When
+    await flagbit.delete_flag(flag.id)
+
+    # Then
+    assert len(cache) == 0, "Deleting should drop the flag from the cache"
+
+
+@pytest.mark.asyncio
+async def test_cached_repo_batches_only_the_cache_misses():
+    """
+    Given a `CachedRepo` with one of two `Flags` already cached
+    When I call `get_many_by_name` with both names,
+    Then I'm expecting the wrapped repo to be asked only for the missing one
+    """
+    # Given
+    inner = FakeInMemoryRepo()
+    await inner.store(Flag(name="cached", value=True))
+    await inner.store(Flag(name="missing", value=False))
+    repo = CachedRepo(repo=inner, cache=TTLCache(maxsize=10, ttl_seconds=60))
+    await repo.get_by_name("cached")
+    inner.get_many_by_name = AsyncMock(wraps=inner.get_many_by_name)
+
+    # When
+    flags = await repo.get_many_by_name(["cached", "missing"])
+
+    # Then
+    assert {flag.name for flag in flags} == {"cached", "missing"}
+    assert inner.get_many_by_name.call_args.kwargs["names"] == ["missing"]
+
+
+def test_reads_from_secondaries_skip_the_flag_cache():
+    """
+    Given an app with a flag cache and MongoDB reads configured for `secondaryPreferred`
+    When I build the repos of the read only and of the other routes,
+    Then I'm expecting only the lookups that may be served by a secondary to skip the cache
+    """
+    # Given
+    request = SimpleNamespace(
+        app=SimpleNamespace(
+            state=SimpleNamespace(
+                circuit_breaker=None, flags_cache=TTLCache(maxsize=10, ttl_seconds=60)
+            )
+        )
+    )
+    client = MongoDBAsyncClient(config=MongoDBConfig(read_preference="secondaryPreferred"))
+
+    # When
+    read_only_repo = get_read_only_flags_repo(
+        request, repo=DocStoreRepo(client=client, read_only=True)
+    )
+    repo = get_flags_repo(request, repo=DocStoreRepo(client=client))
+
+    # Then
+    assert isinstance(read_only_repo, DocStoreRepo)
+    assert isinstance(repo, CachedRepo)
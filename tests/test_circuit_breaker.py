@@ -0,0 +1,215 @@
+"""
+Test cases for `circuit_breaker.py` and the stale-on-error serving of `FlagBitService`.
+"""
+
+from http import HTTPStatus
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from pymongo.errors import WaitQueueTimeoutError
+
+from src.api.dependencies import get_read_only_flag_bit_service
+from src.api.flags_router import STALE_HEADER
+from src.exceptions import (
+    CircuitOpenError,
+    FlagPersistenceError,
+    RepositoryConnectionError,
+    RepositoryNotFoundError,
+)
+from src.repo.circuit_breaker import CircuitBreaker, CircuitBreakerConfig, CircuitBreakerRepo
+from src.repo.doc_store import DocStoreRepo, MongoDBAsyncClient
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.services.flagbit import FlagBitService
+from src.services.last_known import LastKnownFlags
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FlakyRepo(FakeInMemoryRepo):
+    """
+    A `FakeInMemoryRepo` whose lookups fail like an unreachable database while `down`.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.down = False
+        self.calls = 0
+
+    def _check_connection(self) -> None:
+        self.calls += 1
+        if self.down:
+            msg = "Cannot connect to the database."
+            raise RepositoryConnectionError(msg)
+
+    async def get_by_name(self, name):
+        self._check_connection()
+        return await super().get_by_name(name)
+
+    async def get_many_by_name(self, names):
+        self._check_connection()
+        return await super().get_many_by_name(names)
+
+    async def get_all(self, *args, **kwargs):
+        self._check_connection()
+        return await super().get_all(*args, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_fails_fast_and_closes_after_a_successful_probe():
+    """
+    Given a `CircuitBreakerRepo` opening after 2 failures and probing again after 5 seconds
+    When the database goes down, the circuit opens and the database comes back,
+    Then I'm expecting the calls to fail fast while open and a single probe to close it again
+    """
+    # Given
+    clock = FakeClock()
+    repo = FlakyRepo()
+    breaker = CircuitBreaker(
+        config=CircuitBreakerConfig(failure_threshold=2, reset_timeout_seconds=5), timer=clock
+    )
+    guarded = CircuitBreakerRepo(repo=repo, breaker=breaker)
+    repo.down = True
+
+    # When
+    for _ in range(2):
+        with pytest.raises(RepositoryConnectionError):
+            await guarded.get_many_by_name(["my flag"])
+    with pytest.raises(CircuitOpenError):
+        await guarded.get_many_by_name(["my flag"])
+    calls_while_open = repo.calls
+    clock.now = 5.0
+    repo.down = False
+    probed = await guarded.get_many_by_name(["my flag"])
+
+    # Then
+    assert calls_while_open == 2
+    assert probed == []
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_a_failed_half_open_probe_opens_the_circuit_again():
+    """
+    Given an open `CircuitBreaker` whose reset timeout has passed
+    When its single probe fails,
+    Then I'm expecting the circuit to open again and reject the next call right away
+    """
+    # Given
+    clock = FakeClock()
+    repo = FlakyRepo()
+    repo.down = True
+    breaker = CircuitBreaker(
+        config=CircuitBreakerConfig(failure_threshold=1, reset_timeout_seconds=5), timer=clock
+    )
+    guarded = CircuitBreakerRepo(repo=repo, breaker=breaker)
+    with pytest.raises(RepositoryConnectionError):
+        await guarded.get_all()
+    clock.now = 5.0
+
+    # When
+    assert breaker.state == "half_open"
+    with pytest.raises(RepositoryConnectionError):
+        await guarded.get_all()
+
+    # Then
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        await guarded.get_all()
+    assert repo.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_an_overloaded_mongo_opens_the_circuit_but_a_missing_flag_does_not():
+    """
+    Given a `DocStoreRepo` whose connection pool is exhausted, behind a `CircuitBreaker`
+          opening after 2 failures
+    When a lookup of a missing flag is answered, and then two lookups time out
+         waiting for a pooled connection,
+    Then I'm expecting the timeouts as `RepositoryConnectionError` opening the circuit,
+         and the missing flag not to count as a failure
+    """
+    # Given
+    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    collection = mocked_client.get_flags_collection.return_value
+    collection.find_one = AsyncMock(
+        side_effect=[None, WaitQueueTimeoutError("pool"), WaitQueueTimeoutError("pool")]
+    )
+    breaker = CircuitBreaker(config=CircuitBreakerConfig(failure_threshold=2))
+    guarded = CircuitBreakerRepo(repo=DocStoreRepo(client=mocked_client), breaker=breaker)
+
+    # When
+    with pytest.raises(RepositoryNotFoundError):
+        await guarded.get_by_name("missing")
+    assert breaker.state == "closed"
+    for _ in range(2):
+        with pytest.raises(RepositoryConnectionError):
+            await guarded.get_by_name("my flag")
+
+    # Then
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        await guarded.get_by_name("my flag")
+
+
+@pytest.mark.asyncio
+async def test_service_serves_the_last_known_good_flags_while_the_repo_is_down():
+    """
+    Given a `FlagBitService` with `LastKnownFlags` that already read a `Flag` and a page
+    When the repo goes down 30 seconds later,
+    Then I'm expecting the same value, values and page, with their age as `stale_seconds`,
+         and unknown flags to still fail
+    """
+    # Given
+    clock = FakeClock()
+    repo = FlakyRepo()
+    last_known = LastKnownFlags(timer=clock)
+    await FlagBitService(repo=repo).create_flag("my flag", value=True)
+    flagbit = FlagBitService(repo=repo, last_known=last_known)
+    assert await flagbit.is_enabled("my flag") is True
+    page = await flagbit.get_all_flags()
+    assert flagbit.stale_seconds is None
+
+    # When
+    clock.now = 30.0
+    repo.down = True
+    stale = FlagBitService(repo=repo, last_known=last_known)
+
+    # Then
+    assert await stale.is_enabled("my flag") is True
+    assert await stale.get_values(["my flag", "unknown"]) == {"my flag": True}
+    assert await stale.get_all_flags() == page
+    assert stale.stale_seconds == 30.0
+    with pytest.raises(FlagPersistenceError):
+        await stale.is_enabled("unknown")
+
+
+@pytest.mark.asyncio
+async def test_user_gets_stale_flag_values_with_the_staleness_header(test_app, client):
+    """
+    Given a `Flag` whose value was read once, and a database that went down afterwards
+    When I call the `/flags/{flag_name}/value` endpoint,
+    Then I'm expecting the last known value with the staleness header
+    """
+    # Given
+    repo = FlakyRepo()
+    last_known = LastKnownFlags()
+    await FlagBitService(repo=repo).create_flag("my flag", value=True)
+    test_app.dependency_overrides[get_read_only_flag_bit_service] = lambda: FlagBitService(
+        repo=repo, last_known=last_known
+    )
+    assert STALE_HEADER not in client.get("/flags/my flag/value").headers
+
+    # When
+    repo.down = True
+    response = client.get("/flags/my flag/value")
+
+    # Then
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() is True
+    assert response.headers[STALE_HEADER] == "0"
@@ -2,15 +2,110 @@
 Test cases for `doc_store.py`.
 """
 
+import asyncio
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from pymongo.errors import BulkWriteError, OperationFailure
 
 from src.domain.flag import Flag
-from src.exceptions import RepositoryNotFoundError
+from src.exceptions import RepositoryNotFoundError, RepositoryVersionConflictError
 from src.repo.doc_store import DocStoreRepo, MongoDBAsyncClient, flag_to_document
 
 
+class FakeSession:
+    """
+    A client session running every transaction right away.
+    """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    async def with_transaction(self, callback):
+        return await callback(self)
+
+
+class FakeTransactionalMongo:
+    """
+    The server side of the revision counter: a transaction bumping the counter holds it until
+    it commits, the other transactions bumping it wait for that, as the driver retries their
+    write conflicts, and writes are visible once their transaction commits.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self.flags = {}
+        self.counter_lock = asyncio.Lock()
+        self.inserts_gates = {}
+
+    def client(self):
+        client = MagicMock(spec=MongoDBAsyncClient)
+        client.start_session.side_effect = lambda: FakeTransaction(self)
+        client.get_flags_collection.return_value.insert_one = self.insert_one
+        client.get_flags_collection.return_value.find = self.find_flags
+        client.get_tombstones_collection.return_value.find = self.find_tombstones
+        client.get_counters_collection.return_value.find_one_and_update = self.bump
+        client.get_counters_collection.return_value.find_one = self.read_counter
+        return client
+
+    async def bump(self, query, update, session, **kwargs):
+        if not session.holds_counter:
+            await self.counter_lock.acquire()
+            session.holds_counter = True
+        session.seq = self.seq + update["$inc"]["seq"]
+        return {"_id": query["_id"], "seq": session.seq}
+
+    async def read_counter(self, query):
+        return {"_id": query["_id"], "seq": self.seq}
+
+    async def insert_one(self, document, session):
+        if (gate := self.inserts_gates.get(document["name"])) is not None:
+            await gate.wait()
+        session.writes.append(document)
+
+    def find_flags(self, query):
+        since = query["revision"]["$gt"]
+        cursor = MagicMock()
+        cursor.to_list = AsyncMock(
+            return_value=[doc for doc in self.flags.values() if doc["revision"] > since]
+        )
+        return cursor
+
+    def find_tombstones(self, query):
+        cursor = MagicMock()
+        cursor.to_list = AsyncMock(return_value=[])
+        return cursor
+
+
+class FakeTransaction(FakeSession):
+    def __init__(self, mongo):
+        self.mongo = mongo
+        self.holds_counter = False
+        self.seq = None
+        self.writes = []
+
+    async def with_transaction(self, callback):
+        try:
+            result = await callback(self)
+            for document in self.writes:
+                self.mongo.flags[document["_id"]] = document
+            if self.seq is not None:
+                self.mongo.seq = self.seq
+            return result
+        finally:
+            if self.holds_counter:
+                self.mongo.counter_lock.release()
+
+
+def mocked_mongo_client():
+    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client.start_session.return_value = FakeSession()
+    return mocked_client
+
+
 @pytest.mark.asyncio
 async def test_doc_store_delete_all_method():
     """
@@ -19,7 +114,7 @@ async def test_doc_store_delete_all_method():
     Then I'm expecting the `delete_many` method of the collection to be called once with an empty filter.
     """
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     # Create a fake result for delete_many
     fake_result = MagicMock()
     fake_result.deleted_count = 1
@@ -27,7 +122,14 @@ async def test_doc_store_delete_all_method():
     fake_collection = MagicMock()
     # Wire up the delete_many method to be an AsyncMock
     fake_collection.delete_many = AsyncMock(return_value=fake_result)
+    fake_collection.distinct = AsyncMock(return_value=["flag_id"])
     mocked_client.get_flags_collection.return_value = fake_collection
+    # Wire up the revision counter and the tombstones collection
+    fake_counters = mocked_client.get_counters_collection.return_value
+    fake_counters.find_one_and_update = AsyncMock(return_value={"_id": "flags_revision", "seq": 1})
+    fake_tombstones = mocked_client.get_tombstones_collection.return_value
+    fake_tombstones.insert_one = AsyncMock()
+    fake_tombstones.insert_many = AsyncMock()
     doc_store = DocStoreRepo(client=mocked_client)
 
     # When
@@ -49,7 +151,7 @@ async def test_doc_store_delete_method_with_valid_id():
     Then I'm expecting the `delete_one` method of the collection to be called once with the correct filter.
     """
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     # Create a fake result for delete_one
     fake_result = MagicMock()
     fake_result.deleted_count = 1
@@ -58,6 +160,12 @@ async def test_doc_store_delete_method_with_valid_id():
     # Wire up the delete_one method to be an AsyncMock
     fake_collection.delete_one = AsyncMock(return_value=fake_result)
     mocked_client.get_flags_collection.return_value = fake_collection
+    # Wire up the revision counter and the tombstones collection
+    fake_counters = mocked_client.get_counters_collection.return_value
+    fake_counters.find_one_and_update = AsyncMock(return_value={"_id": "flags_revision", "seq": 1})
+    fake_tombstones = mocked_client.get_tombstones_collection.return_value
+    fake_tombstones.insert_one = AsyncMock()
+    fake_tombstones.insert_many = AsyncMock()
     doc_store = DocStoreRepo(client=mocked_client)
     valid_id = "valid_id"
 
@@ -70,6 +178,9 @@ async def test_doc_store_delete_method_with_valid_id():
         "delete_one was not called with the correct filter"
     )
     assert result is None, "delete should not raise an exception in good path"
+    assert fake_tombstones.insert_one.call_args[0][0] == {"_id": valid_id, "revision": 1}, (
+        "delete should leave a tombstone with the new revision"
+    )
 
 
 @pytest.mark.asyncio
@@ -81,7 +192,7 @@ async def test_doc_store_delete_method_with_invalid_id():
           and an `RepositoryNotFoundError` to be raised.
     """
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     # Create a fake result for delete_one
     fake_result = MagicMock()
     fake_result.deleted_count = 0
@@ -104,7 +215,6 @@ async def test_doc_store_delete_method_with_invalid_id():
     )
 
 
-
 @pytest.mark.asyncio
 async def test_doc_store_update_method_with_existing_flag():
     """
@@ -115,7 +225,7 @@ async def test_doc_store_update_method_with_existing_flag():
     """
 
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     # Create a fake result for replace_one
     fake_result = MagicMock()
     fake_result.modified_count = 1
@@ -124,6 +234,12 @@ async def test_doc_store_update_method_with_existing_flag():
     # Wire up the replace_one method to be an AsyncMock
     fake_collection.replace_one = AsyncMock(return_value=fake_result)
     mocked_client.get_flags_collection.return_value = fake_collection
+    # Wire up the revision counter and the tombstones collection
+    fake_counters = mocked_client.get_counters_collection.return_value
+    fake_counters.find_one_and_update = AsyncMock(return_value={"_id": "flags_revision", "seq": 1})
+    fake_tombstones = mocked_client.get_tombstones_collection.return_value
+    fake_tombstones.insert_one = AsyncMock()
+    fake_tombstones.insert_many = AsyncMock()
     doc_store = DocStoreRepo(client=mocked_client)
     existing_flag = Flag(name="test_flag", value=True)
 
@@ -149,12 +265,18 @@ async def test_doc_store_store_method():
     Then I'm expecting the `insert_one` method of the collection to be called once with the correct document
     """
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     # Create a fake collection with the `insert_one` method
     fake_collection = MagicMock()
     # Wire up the insert_one method to be an AsyncMock
     fake_collection.insert_one = AsyncMock()
     mocked_client.get_flags_collection.return_value = fake_collection
+    # Wire up the revision counter and the tombstones collection
+    fake_counters = mocked_client.get_counters_collection.return_value
+    fake_counters.find_one_and_update = AsyncMock(return_value={"_id": "flags_revision", "seq": 1})
+    fake_tombstones = mocked_client.get_tombstones_collection.return_value
+    fake_tombstones.insert_one = AsyncMock()
+    fake_tombstones.insert_many = AsyncMock()
     doc_store = DocStoreRepo(client=mocked_client)
     new_flag = Flag(name="new_flag", value=True)
 
@@ -177,7 +299,7 @@ async def test_doc_store_get_by_id_method_with_valid_id():
          filter and the corresponding Flag to be returned
     """
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     existing_flag = Flag(name="existing_flag", value=True)
     existing_flag_doc = flag_to_document(existing_flag)
     # Create a fake collection with the `find_one` method
@@ -207,7 +329,7 @@ async def test_doc_store_get_by_id_method_with_invalid_id():
          and an exception `RepositoryNotFoundError` to be raised
     """
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     # Create a fake collection with the `find_one` method
     fake_collection = MagicMock()
     # Wire up the find_one method to be an AsyncMock returning None
@@ -236,7 +358,7 @@ async def test_doc_store_get_by_name_method_with_valid_name():
          filter and the corresponding Flag to be returned
     """
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     existing_flag = Flag(name="existing_flag", value=True)
     existing_flag_doc = flag_to_document(existing_flag)
     # Create a fake collection with the `find_one` method
@@ -266,7 +388,7 @@ async def test_doc_store_get_by_name_method_with_invalid_name():
          and an exception `RepositoryNotFoundError` to be raised
     """
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     # Create a fake collection with the `find_one` method
     fake_collection = MagicMock()
     # Wire up the find_one method to be an AsyncMock returning None
@@ -293,7 +415,7 @@ async def test_doc_store_get_all_method_returns_all_flags_if_limit_existing_flag
     Then I'm expecting the `find` method of the collection to be called once and a list of Flags to be returned
     """
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     flag1 = Flag(name="flag1", value=True)
     flag2 = Flag(name="flag2", value=False)
     flag_docs = [flag_to_document(flag1), flag_to_document(flag2)]
@@ -321,7 +443,7 @@ async def test_doc_store_get_all_method_returns_empty_list_if_no_flags_exist():
     Then I'm expecting the `find` method of the collection to be called once and an empty list to be returned
     """
     # Given
-    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client = mocked_mongo_client()
     # Create a fake collection with the `find` method
     fake_collection = MagicMock()
     # Wire up the find method to be an AsyncMock returning an empty list
@@ -336,3 +458,319 @@ async def test_doc_store_get_all_method_returns_empty_list_if_no_flags_exist():
     # Then
     assert fake_collection.find.call_count == 1, "find was not called exactly once"
     assert result == [], "get_all did not return an empty list when no Flags exist"
+
+
+@pytest.mark.asyncio
+async def test_doc_store_get_changes_method_returns_flags_and_tombstones_after_revision():
+    """
+    Given a `DocStoreRepo` instance with its `MongoDBAsyncClient` mocked
+    When I call the `get_changes` method with some revision
+    Then I'm expecting both the flags and the tombstones collections to be filtered by that revision
+         and the current revision to be returned
+    """
+    # Given
+    mocked_client = mocked_mongo_client()
+    changed_flag = Flag(name="changed_flag", value=True, revision=4)
+    fake_collection = MagicMock()
+    fake_collection.find.return_value.to_list = AsyncMock(
+        return_value=[flag_to_document(changed_flag)]
+    )
+    mocked_client.get_flags_collection.return_value = fake_collection
+    fake_tombstones = mocked_client.get_tombstones_collection.return_value
+    fake_tombstones.find.return_value.to_list = AsyncMock(
+        return_value=[{"_id": "deleted_id", "revision": 5}]
+    )
+    fake_counters = mocked_client.get_counters_collection.return_value
+    fake_counters.find_one = AsyncMock(return_value={"_id": "flags_revision", "seq": 5})
+    doc_store = DocStoreRepo(client=mocked_client)
+
+    # When
+    changes = await doc_store.get_changes(since=3)
+
+    # Then
+    assert fake_collection.find.call_args[0][0] == {"revision": {"$gt": 3}}
+    assert fake_tombstones.find.call_args[0][0] == {"revision": {"$gt": 3}}
+    assert changes.revision == 5, "get_changes should return the current revision"
+    assert changes.flags == [changed_flag]
+    assert changes.deleted == ["deleted_id"]
+
+
+@pytest.mark.asyncio
+async def test_doc_store_get_many_by_name_method_uses_a_single_in_query():
+    """
+    Given a `DocStoreRepo` instance with its `MongoDBAsyncClient` mocked
+    When I call the `get_many_by_name` method with some names
+    Then I'm expecting a single `find` with an `$in` filter and the matching Flags to be returned
+    """
+    # Given
+    mocked_client = mocked_mongo_client()
+    flag1 = Flag(name="flag1", value=True)
+    fake_collection = MagicMock()
+    fake_collection.find.return_value.to_list = AsyncMock(return_value=[flag_to_document(flag1)])
+    mocked_client.get_flags_collection.return_value = fake_collection
+    doc_store = DocStoreRepo(client=mocked_client)
+
+    # When
+    result = await doc_store.get_many_by_name(names=["flag1", "missing"])
+
+    # Then
+    assert fake_collection.find.call_count == 1, "find was not called exactly once"
+    assert fake_collection.find.call_args[0][0] == {"name": {"$in": ["flag1", "missing"]}}
+    assert result == [flag1], "get_many_by_name did not return the expected Flags"
+
+
+@pytest.mark.asyncio
+async def test_doc_store_get_all_method_pushes_expired_filter_and_cursor_to_the_query():
+    """
+    Given a `DocStoreRepo` instance with its `MongoDBAsyncClient` mocked
+    When I call the `get_all` method with `expired=False`, a `limit` and an `after` position
+    Then I'm expecting a single sorted and limited `find` with both predicates in its filter
+    """
+    # Given
+    mocked_client = mocked_mongo_client()
+    fake_collection = MagicMock()
+    fake_collection.find.return_value.to_list = AsyncMock(return_value=[])
+    mocked_client.get_flags_collection.return_value = fake_collection
+    doc_store = DocStoreRepo(client=mocked_client)
+    last_flag = Flag(name="last_flag", value=True)
+
+    # When
+    await doc_store.get_all(expired=False, limit=10, after=last_flag.cursor)
+
+    # Then
+    query = fake_collection.find.call_args[0][0]
+    expiration_filter, cursor_filter = query["$and"]
+    assert expiration_filter["$or"][0] == {"expiration_date": None}
+    assert cursor_filter == {
+        "$or": [
+            {"date_created": {"$gt": last_flag.date_created}},
+            {"date_created": last_flag.date_created, "_id": {"$gt": last_flag.id}},
+        ]
+    }
+    assert fake_collection.find.call_args.kwargs["sort"] == [("date_created", 1), ("_id", 1)]
+    assert fake_collection.find.call_args.kwargs["limit"] == 10
+
+
+@pytest.mark.asyncio
+async def test_doc_store_iter_all_method_streams_flags_from_the_cursor():
+    """
+    Given a `DocStoreRepo` instance with its `MongoDBAsyncClient` mocked
+    When I iterate the `iter_all` method with some batch size
+    Then I'm expecting the cursor to be opened with that batch size, every Flag to be yielded
+         and the cursor to be closed
+    """
+    # Given
+    mocked_client = mocked_mongo_client()
+    flag1 = Flag(name="flag1", value=True)
+    flag2 = Flag(name="flag2", value=False)
+    fake_cursor = MagicMock()
+    fake_cursor.__aiter__.return_value = [flag_to_document(flag1), flag_to_document(flag2)]
+    fake_cursor.close = AsyncMock()
+    fake_collection = MagicMock()
+    fake_collection.find.return_value = fake_cursor
+    mocked_client.get_flags_collection.return_value = fake_collection
+    doc_store = DocStoreRepo(client=mocked_client)
+
+    # When
+    result = [flag async for flag in doc_store.iter_all(batch_size=2)]
+
+    # Then
+    assert fake_collection.find.call_args.kwargs["batch_size"] == 2
+    assert result == [flag1, flag2], "iter_all did not yield the expected Flags"
+    assert fake_cursor.close.await_count == 1, "The cursor should be closed"
+
+
+@pytest.mark.asyncio
+async def test_doc_store_store_many_method_reports_the_rejected_documents():
+    """
+    Given a `DocStoreRepo` instance with its `MongoDBAsyncClient` mocked
+          and a `bulk_write` rejecting the second document as a duplicate
+    When I call the `store_many` method with three new Flags
+    Then I'm expecting an unordered `bulk_write`, written again without the second Flag
+         as the rejection aborted the transaction, consecutive revisions
+         and only the second Flag to be reported as failed
+    """
+    # Given
+    mocked_client = mocked_mongo_client()
+    fake_collection = MagicMock()
+    fake_collection.find.return_value.to_list = AsyncMock(return_value=[])
+    fake_collection.bulk_write = AsyncMock(
+        side_effect=[
+            BulkWriteError(
+                {"writeErrors": [{"index": 1, "code": 11000, "errmsg": "E11000 duplicate key"}]}
+            ),
+            None,
+        ]
+    )
+    mocked_client.get_flags_collection.return_value = fake_collection
+    fake_counters = mocked_client.get_counters_collection.return_value
+    fake_counters.find_one_and_update = AsyncMock(
+        side_effect=[{"_id": "flags_revision", "seq": 7}, {"_id": "flags_revision", "seq": 9}]
+    )
+    doc_store = DocStoreRepo(client=mocked_client)
+    flags = [Flag(name=f"flag{i}", value=True) for i in range(3)]
+
+    # When
+    results = await doc_store.store_many(flags)
+
+    # Then
+    assert fake_collection.bulk_write.call_count == 2
+    assert fake_collection.bulk_write.call_args.kwargs["ordered"] is False
+    assert len(fake_collection.bulk_write.call_args[0][0]) == 2
+    increments = [call[0][1] for call in fake_counters.find_one_and_update.call_args_list]
+    assert increments == [{"$inc": {"seq": 3}}, {"$inc": {"seq": 2}}]
+    assert [flags[0].revision, flags[2].revision] == [8, 9]
+    assert [result.stored for result in results] == [True, False, True]
+
+
+@pytest.mark.asyncio
+async def test_doc_store_store_many_method_finds_the_taken_names_with_a_single_in_query():
+    """
+    Given a `DocStoreRepo` instance with its `MongoDBAsyncClient` mocked, holding a Flag named "taken"
+    When I call the `store_many` method with a Flag named "taken" and two Flags named "new"
+    Then I'm expecting a single `$in` query, a single `bulk_write` of the first "new" Flag,
+         and the two others reported as failed
+    """
+    # Given
+    mocked_client = mocked_mongo_client()
+    fake_collection = mocked_client.get_flags_collection.return_value
+    fake_collection.find.return_value.to_list = AsyncMock(return_value=[{"name": "taken"}])
+    fake_collection.bulk_write = AsyncMock()
+    fake_counters = mocked_client.get_counters_collection.return_value
+    fake_counters.find_one_and_update = AsyncMock(return_value={"_id": "flags_revision", "seq": 1})
+    doc_store = DocStoreRepo(client=mocked_client)
+    flags = [Flag(name=name, value=True) for name in ("taken", "new", "new")]
+
+    # When
+    results = await doc_store.store_many(flags)
+
+    # Then
+    assert fake_collection.find.call_args[0][0] == {"name": {"$in": ["taken", "new", "new"]}}
+    assert fake_collection.bulk_write.await_count == 1
+    assert len(fake_collection.bulk_write.call_args[0][0]) == 1
+    assert [result.stored for result in results] == [False, True, False]
+
+
+@pytest.mark.asyncio
+async def test_doc_store_store_many_method_raises_a_bulk_write_error_without_write_errors():
+    """
+    Given a `DocStoreRepo` instance with its `MongoDBAsyncClient` mocked
+          and a `bulk_write` failing without rejecting any document, e.g. on its write concern
+    When I call the `store_many` method
+    Then I'm expecting the `BulkWriteError` to be raised after a single attempt
+    """
+    # Given
+    mocked_client = mocked_mongo_client()
+    fake_collection = mocked_client.get_flags_collection.return_value
+    fake_collection.find.return_value.to_list = AsyncMock(return_value=[])
+    fake_collection.bulk_write = AsyncMock(
+        side_effect=BulkWriteError({"writeErrors": [], "writeConcernErrors": [{"code": 64}]})
+    )
+    fake_counters = mocked_client.get_counters_collection.return_value
+    fake_counters.find_one_and_update = AsyncMock(return_value={"_id": "flags_revision", "seq": 1})
+    doc_store = DocStoreRepo(client=mocked_client)
+
+    # When / Then
+    with pytest.raises(BulkWriteError):
+        await doc_store.store_many([Flag(name="flag", value=True)])
+    assert fake_collection.bulk_write.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_doc_store_update_fields_method_reports_a_version_conflict():
+    """
+    Given a `DocStoreRepo` instance with its `MongoDBAsyncClient` mocked, holding a `Flag` at version 3
+    When I call the `update_fields` method expecting version 2,
+    Then I'm expecting a single `find_one_and_update` matching on the version, in the same
+         transaction as its revision, and a `RepositoryVersionConflictError` since nothing matched
+    """
+    # Given
+    mocked_client = mocked_mongo_client()
+    fake_collection = MagicMock()
+    fake_collection.find_one_and_update = AsyncMock(return_value=None)
+    fake_collection.find_one = AsyncMock(return_value={"_id": "flag_id", "version": 3})
+    mocked_client.get_flags_collection.return_value = fake_collection
+    fake_counters = mocked_client.get_counters_collection.return_value
+    fake_counters.find_one_and_update = AsyncMock(return_value={"_id": "flags_revision", "seq": 1})
+    doc_store = DocStoreRepo(client=mocked_client)
+
+    # When
+    with pytest.raises(RepositoryVersionConflictError):
+        await doc_store.update_fields("flag_id", {"value": False}, expected_version=2)
+
+    # Then
+    assert fake_collection.find_one_and_update.call_count == 1
+    query, pipeline = fake_collection.find_one_and_update.call_args[0]
+    assert query == {"_id": "flag_id", "version": 2}
+    assert pipeline[0]["$set"]["value"] == {"$literal": False}
+    assert pipeline[0]["$set"]["revision"] == 1
+    assert mocked_client.start_session.call_count == 1
+    session = fake_collection.find_one_and_update.call_args.kwargs["session"]
+    assert fake_counters.find_one_and_update.call_args.kwargs["session"] is session
+
+
+@pytest.mark.asyncio
+async def test_doc_store_changes_are_not_skipped_when_two_writers_interleave():
+    """
+    Given two writers storing Flags at once, the first one taking its revision
+          and being slower to write its document than the second one
+    When a client syncs in the middle of both writes and again after them,
+    Then I'm expecting the client to get both Flags, none skipped below its revision
+    """
+    # Given
+    mongo = FakeTransactionalMongo()
+    doc_store = DocStoreRepo(client=mongo.client())
+    mongo.inserts_gates["slow"] = asyncio.Event()
+    slow_writer = asyncio.create_task(doc_store.store(Flag(name="slow", value=True)))
+    await asyncio.sleep(0)
+    fast_writer = asyncio.create_task(doc_store.store(Flag(name="fast", value=True)))
+    await asyncio.sleep(0)
+
+    # When
+    first_sync = await doc_store.get_changes(since=0)
+    mongo.inserts_gates["slow"].set()
+    await asyncio.gather(slow_writer, fast_writer)
+    second_sync = await doc_store.get_changes(since=first_sync.revision)
+
+    # Then
+    assert first_sync.flags == []
+    synced = {flag.name: flag.revision for flag in first_sync.flags + second_sync.flags}
+    assert synced == {"slow": 1, "fast": 2}
+    assert second_sync.revision == 2
+
+
+@pytest.mark.asyncio
+async def test_doc_store_writes_without_a_transaction_once_a_standalone_server_refuses_one():
+    """
+    Given a `DocumentStore` over a standalone server, which refuses transactions
+    When I store two flags
+    Then I'm expecting the first to be written without a session once its transaction is refused,
+         and the second not to try a transaction at all
+    """
+    # Given
+    mocked_client = MagicMock(spec=MongoDBAsyncClient)
+    mocked_client.supports_transactions = True
+    mocked_client.disable_transactions.side_effect = lambda: setattr(
+        mocked_client, "supports_transactions", False
+    )
+    session = MagicMock()
+    session.__aenter__ = AsyncMock(return_value=session)
+    session.__aexit__ = AsyncMock(return_value=None)
+    session.with_transaction = AsyncMock(
+        side_effect=OperationFailure("Transaction numbers are only allowed on a replica set", 20)
+    )
+    mocked_client.start_session.return_value = session
+    fake_counters = mocked_client.get_counters_collection.return_value
+    fake_counters.find_one_and_update = AsyncMock(return_value={"_id": "flags_revision", "seq": 1})
+    fake_collection = mocked_client.get_flags_collection.return_value
+    fake_collection.insert_one = AsyncMock()
+    doc_store = DocStoreRepo(client=mocked_client)
+
+    # When
+    await doc_store.store(Flag(name="first", value=True))
+    await doc_store.store(Flag(name="second", value=True))
+
+    # Then
+    assert mocked_client.start_session.call_count == 1
+    assert fake_collection.insert_one.await_count == 2
+    assert all(call.kwargs["session"] is None for call in fake_collection.insert_one.call_args_list)
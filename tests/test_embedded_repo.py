@@ -0,0 +1,181 @@
+"""
+Test cases for `embedded.py`.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from pytz import utc
+
+from src.domain.flag import Flag
+from src.exceptions import RepositoryDuplicateError, RepositoryLockedError, RepositoryNotFoundError
+from src.repo.embedded import LOG_FILE, SNAPSHOT_FILE, EmbeddedRepo, EmbeddedRepoConfig
+from src.repo.fake_repo import FakeInMemoryRepo
+
+
+@pytest.fixture
+def config(tmp_path):
+    return EmbeddedRepoConfig(data_dir=tmp_path)
+
+
+@pytest.mark.asyncio
+async def test_embedded_repo_keeps_its_name_index_in_sync(config):
+    """
+    Given an `EmbeddedRepo` with a stored `Flag`
+    When I rename it and store another `Flag` with its old name,
+    Then I'm expecting lookups by both names to follow, and a duplicate name to be rejected
+    """
+    # Given
+    repo = EmbeddedRepo(config=config)
+    flag = Flag(name="old name", value=True)
+    await repo.store(flag)
+
+    # When
+    renamed = await repo.get_by_id(flag.id)
+    renamed.name = "new name"
+    await repo.update(renamed)
+    await repo.store(Flag(name="old name", value=False))
+
+    # Then
+    assert (await repo.get_by_name("new name")).id == flag.id
+    assert (await repo.get_by_name("old name")).value is False
+    with pytest.raises(RepositoryDuplicateError):
+        await repo.store(Flag(name="new name", value=True))
+    await repo.delete(flag.id)
+    with pytest.raises(RepositoryNotFoundError):
+        await repo.get_by_name("new name")
+
+
+@pytest.mark.asyncio
+async def test_embedded_repo_returns_copies_of_the_indexed_flags(config):
+    """
+    Given an `EmbeddedRepo` with a stored `Flag`
+    When I change a `Flag` returned by the repo without updating it,
+    Then I'm expecting the repo to be left untouched
+    """
+    # Given
+    repo = EmbeddedRepo(config=config)
+    await repo.store(Flag(name="my flag", value=True))
+
+    # When
+    flag = await repo.get_by_name("my flag")
+    flag.name = "changed"
+    flag.value = False
+
+    # Then
+    assert (await repo.get_by_name("my flag")).value is True
+    assert await repo.get_all(flag_value=False) == []
+
+
+@pytest.mark.asyncio
+async def test_embedded_repo_pages_flags_like_the_in_memory_repo(config):
+    """
+    Given the same `Flags` in an `EmbeddedRepo` and a `FakeInMemoryRepo`, some of them expired
+    When I page through both with every filter,
+    Then I'm expecting the same pages
+    """
+    # Given
+    embedded, in_memory = EmbeddedRepo(config=config), FakeInMemoryRepo()
+    now = datetime.now(tz=utc)
+    for i in range(20):
+        expiration_date = now + timedelta(days=i % 3 - 1) if i % 4 else None
+        for repo in (embedded, in_memory):
+            await repo.store(
+                Flag(
+                    id=f"id-{i}",
+                    name=f"flag {i}",
+                    value=bool(i % 2),
+                    expiration_date=expiration_date,
+                    date_created=now + timedelta(seconds=i % 5),
+                )
+            )
+    after = (await in_memory.get_all(limit=3))[-1].cursor
+
+    # When / Then
+    for filters in (
+        {},
+        {"flag_value": True},
+        {"expired": True},
+        {"expired": False},
+        {"flag_value": False, "expired": True},
+        {"flag_name": "flag 7"},
+    ):
+        expected = await in_memory.get_all(limit=4, after=after, **filters)
+        actual = await embedded.get_all(limit=4, after=after, **filters)
+        assert [flag.id for flag in actual] == [flag.id for flag in expected], filters
+
+
+@pytest.mark.asyncio
+async def test_embedded_repo_survives_a_restart_and_compaction(config):
+    """
+    Given an `EmbeddedRepo` compacting its log every 3 writes
+    When I write 5 times and open the repo again from the same directory,
+    Then I'm expecting the same flags, tombstones and revision
+    """
+    # Given
+    config.compact_every = 3
+    repo = EmbeddedRepo(config=config)
+
+    # When
+    kept, deleted = Flag(name="kept", value=True), Flag(name="deleted", value=True)
+    await repo.store_many([kept, deleted])
+    await repo.delete(deleted.id)
+    kept.value = False
+    await repo.update(kept)
+    await repo.store(Flag(name="last", value=True))
+    repo.close()
+    reopened = EmbeddedRepo(config=config)
+
+    # Then
+    assert (config.data_dir / SNAPSHOT_FILE).exists()
+    assert await reopened.get_revision() == await repo.get_revision() == 5
+    assert (await reopened.get_by_name("kept")).value is False
+    changes = await reopened.get_changes(since=2)
+    assert [flag.name for flag in changes.flags] == ["kept", "last"]
+    assert changes.deleted == [deleted.id]
+
+
+@pytest.mark.asyncio
+async def test_embedded_repo_drops_a_partially_written_log_entry(config):
+    """
+    Given an `EmbeddedRepo` log whose last entry was cut short by a crash
+    When I open the repo and write again,
+    Then I'm expecting the complete entries to be kept and the log to stay readable
+    """
+    # Given
+    repo = EmbeddedRepo(config=config)
+    await repo.store(Flag(name="complete", value=True))
+    repo.close()
+    with (config.data_dir / LOG_FILE).open("a") as log:
+        log.write('{"op":"put","flag":{"id":')
+
+    # When
+    reopened = EmbeddedRepo(config=config)
+    await reopened.store(Flag(name="after the crash", value=True))
+    reopened.close()
+
+    # Then
+    flags = await EmbeddedRepo(config=config).get_all()
+    assert [flag.name for flag in flags] == ["complete", "after the crash"]
+
+
+@pytest.mark.asyncio
+async def test_embedded_repo_data_dir_is_opened_by_a_single_repo_at_a_time(config):
+    """
+    Given an open `EmbeddedRepo`
+    When another repo opens the same directory, before and after the first one is closed,
+    Then I'm expecting a `RepositoryLockedError` first, and the directory to open once released
+    """
+    # Given
+    repo = EmbeddedRepo(config=config)
+    await repo.store(Flag(name="my flag", value=True))
+
+    # When
+    with pytest.raises(RepositoryLockedError, match="used by another process"):
+        EmbeddedRepo(config=config)
+    repo.close()
+    reopened = EmbeddedRepo(config=config)
+
+    # Then
+    assert (await reopened.get_by_name("my flag")).value is True
+    reopened.close()
@@ -0,0 +1,317 @@
+"""
+Test cases for `events.py`.
+"""
+
+import asyncio
+import signal
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from src.api.app import end_streams_on_exit
+from src.api.dependencies import get_flag_bit_service
+from src.domain.flag import Flag, FlagChanges
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.services.events import EventHub, EventsConfig
+from src.services.flagbit import FlagBitService
+
+
+@pytest.mark.asyncio
+async def test_service_publishes_every_flag_change_to_all_subscribers():
+    """
+    Given a `FlagBitService` with an `EventHub` and two subscribers
+    When I create, update and delete a `Flag`,
+    Then I'm expecting both subscribers to receive the three events in order,
+         with the repo revisions as ids
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    hub = EventHub(repo=repo)
+    await hub.start()
+    flagbit = FlagBitService(repo=repo, events=hub)
+    subscriptions = [await flagbit.subscribe(), await flagbit.subscribe()]
+    streams = [aiter(subscription) for subscription in subscriptions]
+    events = [[], []]
+
+    # When
+    flag = await flagbit.create_flag("my flag", value=True)
+    for stream, received in zip(streams, events, strict=True):
+        received.append(await anext(stream))
+    await flagbit.update_flag(flag.id, {"value": False})
+    for stream, received in zip(streams, events, strict=True):
+        received.append(await anext(stream))
+    await flagbit.delete_flag(flag.id)
+    for stream, received in zip(streams, events, strict=True):
+        received.append(await anext(stream))
+
+    # Then
+    for received in events:
+        assert [event.kind for event in received] == ["created", "updated", "deleted"]
+        assert [event.id for event in received] == [1, 2, 3]
+        assert received[0].flag.value is True, "Events should not follow later changes"
+        assert received[1].flag.value is False
+        assert received[2].flag_id == flag.id
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_hub_drops_a_slow_subscriber_without_blocking_the_others():
+    """
+    Given an `EventHub` with a queue size of 2 and two subscribers
+    When 3 flags are stored and only one subscriber reads their events,
+    Then I'm expecting the slow one to be dropped and its stream to end
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    hub = EventHub(repo=repo, config=EventsConfig(queue_size=2))
+    await hub.start()
+    slow = await hub.subscribe()
+    fast = await hub.subscribe()
+    fast_events = aiter(fast)
+
+    # When
+    for i in range(3):
+        await repo.store(Flag(name=str(i), value=True))
+        await hub.poll()
+        assert (await anext(fast_events)).flag.name == str(i)
+
+    # Then
+    assert slow.dropped and not fast.dropped
+    assert len(hub) == 1
+    assert [event async for event in slow] == [], "A dropped stream should end right away"
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_subscriber_resumes_from_its_last_event_id():
+    """
+    Given an `EventHub` with a queue size of 2 started after 3 flags were stored
+    When I subscribe again after event 1 and after event 0,
+    Then I'm expecting the missed changes read from the repo,
+         or a `reset` when there are more of them than the queue holds
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    for i in range(3):
+        await repo.store(Flag(name=str(i), value=True))
+    hub = EventHub(repo=repo, config=EventsConfig(queue_size=2, heartbeat_seconds=0.01))
+    await hub.start()
+
+    # When
+    resumed = await hub.subscribe(last_event_id=1)
+    too_old = await hub.subscribe(last_event_id=0)
+
+    # Then
+    resumed_events = aiter(resumed)
+    assert [(await anext(resumed_events)).id for _ in range(2)] == [2, 3]
+    assert await anext(resumed_events) is None, "A heartbeat is expected once idle"
+    reset = await anext(aiter(too_old))
+    assert (reset.kind, reset.id) == ("reset", 3)
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_subscriber_ahead_of_the_repo_is_reset_and_then_follows_it():
+    """
+    Given an `EventHub` over a repo at revision 1, e.g. restored from an older backup
+    When I subscribe after event 5 and a `Flag` is stored,
+    Then I'm expecting a `reset` at revision 1, then the new `Flag` at revision 2
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    await repo.store(Flag(name="restored", value=True))
+    hub = EventHub(repo=repo, config=EventsConfig(poll_interval_seconds=0.01))
+    await hub.start()
+
+    # When
+    events = aiter(await hub.subscribe(last_event_id=5))
+    reset = await anext(events)
+    await repo.store(Flag(name="new", value=True))
+    hub.notify()
+    created = await anext(events)
+
+    # Then
+    assert (reset.kind, reset.id) == ("reset", 1)
+    assert (created.kind, created.id, created.flag.name) == ("created", 2, "new")
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_subscriber_stops_reading_the_missed_changes_once_they_overflow_its_queue():
+    """
+    Given an `EventHub` with a queue size of 2 over a repo 10 revisions ahead,
+         which returns 2 changes on each read
+    When I subscribe after event 0,
+    Then I'm expecting the changes to be read twice only, and a `reset` to be sent instead
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    repo.get_revision = AsyncMock(return_value=10)
+
+    async def get_changes(since):
+        return FlagChanges(
+            revision=since + 2,
+            flags=[Flag(name=str(since + i), value=True, revision=since + i) for i in (1, 2)],
+        )
+
+    repo.get_changes = AsyncMock(side_effect=get_changes)
+    hub = EventHub(repo=repo, config=EventsConfig(queue_size=2))
+
+    # When
+    reset = await anext(aiter(await hub.subscribe(last_event_id=0)))
+
+    # Then
+    assert repo.get_changes.await_count == 2
+    assert (reset.kind, reset.id) == ("reset", 4)
+    hub.close()
+
+
+@pytest.mark.asyncio
+async def test_subscribers_receive_the_writes_of_every_worker_and_resume_on_any_of_them():
+    """
+    Given two workers sharing a repo, each with its own `EventHub`, and a subscriber of the second
+    When the first worker creates and updates a `Flag`, and the subscriber resumes after the
+         creation on a third worker started afterwards,
+    Then I'm expecting both writes on the second worker and the update on the third one
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    config = EventsConfig(poll_interval_seconds=0.01)
+    first, second = EventHub(repo=repo, config=config), EventHub(repo=repo, config=config)
+    await first.start()
+    await second.start()
+    flagbit = FlagBitService(repo=repo, events=first)
+    subscription = aiter(await second.subscribe())
+
+    # When
+    flag = await flagbit.create_flag("my flag", value=True)
+    created = await anext(subscription)
+    await flagbit.update_flag(flag.id, {"value": False})
+    updated = await anext(subscription)
+    third = EventHub(repo=repo, config=config)
+    await third.start()
+    resumed = await anext(aiter(await third.subscribe(last_event_id=created.id)))
+
+    # Then
+    assert [(created.kind, created.id), (updated.kind, updated.id)] == [
+        ("created", 1),
+        ("updated", 2),
+    ]
+    assert (resumed.kind, resumed.id, resumed.flag.value) == ("updated", 2, False)
+    for hub in (first, second, third):
+        await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_hub_does_not_read_the_repo_without_subscribers():
+    """
+    Given a started `EventHub` without subscribers
+    When this worker writes and the poll interval goes by,
+    Then I'm expecting the repo not to be read
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    repo.get_revision = AsyncMock(return_value=0)
+    repo.get_changes = AsyncMock()
+    hub = EventHub(repo=repo, config=EventsConfig(poll_interval_seconds=0.01))
+    await hub.start()
+
+    # When
+    hub.notify()
+    await asyncio.sleep(0.05)
+
+    # Then
+    repo.get_revision.assert_not_awaited()
+    repo.get_changes.assert_not_awaited()
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_exit_signal_ends_the_open_streams_before_the_server_handles_it():
+    """
+    Given an `EventHub` with a subscriber and streams ended on exit signals
+    When the process receives `SIGTERM`,
+    Then I'm expecting the stream to end and the previous handler to be called
+    """
+    # Given
+    hub = EventHub(repo=FakeInMemoryRepo())
+    await hub.start()
+    subscription = await hub.subscribe()
+    received = []
+    previous = signal.signal(signal.SIGTERM, lambda sig, _frame: received.append(sig))
+    restore = end_streams_on_exit(hub)
+
+    # When
+    try:
+        signal.raise_signal(signal.SIGTERM)
+        events = await asyncio.wait_for(_collect(subscription), timeout=1)
+    finally:
+        restore()
+        signal.signal(signal.SIGTERM, previous)
+
+    # Then
+    assert events == []
+    assert received == [signal.SIGTERM]
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_subscriptions_made_after_the_hub_closed_end_right_away():
+    """
+    Given a closed `EventHub`, e.g. once the server was asked to exit
+    When I subscribe,
+    Then I'm expecting the stream to end right away, so it does not hold the shutdown up
+    """
+    # Given
+    hub = EventHub(repo=FakeInMemoryRepo())
+    hub.close()
+
+    # When
+    subscription = await hub.subscribe(last_event_id=0)
+
+    # Then
+    assert await _collect(subscription) == []
+    assert len(hub) == 0
+
+
+async def _collect(subscription):
+    return [event async for event in subscription]
+
+
+@pytest.mark.asyncio
+async def test_user_can_stream_flag_changes_as_server_sent_events(test_app):
+    """
+    Given a `FlagBitService` with an `EventHub` and a created `Flag`
+    When I call the `/flags/stream` endpoint from event 0 and the hub is closed,
+    Then I'm expecting the `created` event in the Server-Sent Events format
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    hub = EventHub(repo=repo)
+    await hub.start()
+    flagbit = FlagBitService(repo=repo, events=hub)
+    test_app.dependency_overrides[get_flag_bit_service] = lambda: flagbit
+    flag = await flagbit.create_flag("my flag", value=True)
+
+    async def close_once_subscribed():
+        while not len(hub):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        hub.close()
+
+    closing = asyncio.create_task(close_once_subscribed())
+
+    # When
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=test_app), base_url="http://test"
+    ) as client:
+        response = await client.get("/flags/stream", headers={"Last-Event-ID": "0"})
+
+    # Then
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "id: 1\nevent: created\ndata: {" in response.text
+    assert f'"id":"{flag.id}"' in response.text
+    await closing
+    await hub.stop()
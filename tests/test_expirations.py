@@ -0,0 +1,164 @@
+"""
+Test cases for `expirations.py`.
+"""
+
+import asyncio
+import dataclasses
+from datetime import datetime, timedelta
+
+import pytest
+from pytz import utc
+
+from src.domain.flag import Flag, to_epoch_ms
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.services.events import EventHub, EventsConfig
+from src.services.expirations import ExpirationScheduler
+from src.services.flagbit import FlagBitService
+from src.services.snapshot import FlagSnapshotManager
+
+
+def test_scheduler_fires_due_flags_in_order_and_skips_stale_entries():
+    """
+    Given an `ExpirationScheduler` with flags expiring in 1, 2 and 3 hours
+    When I push the first one back, unschedule the second and fire everything due in 3.5 hours,
+    Then I'm expecting only the third one to fire, and the first one to stay scheduled
+    """
+    # Given
+    now = datetime.now(tz=utc)
+    first, second, third = (
+        Flag(name=f"flag {hours}", value=True, expiration_date=now + timedelta(hours=hours))
+        for hours in (1, 2, 3)
+    )
+    scheduler = ExpirationScheduler()
+    fired: list[str] = []
+    scheduler.add_listener(lambda flag: fired.append(flag.name))
+    for flag in (third, first, second):
+        scheduler.schedule(flag)
+
+    # When
+    first.expiration_date = now + timedelta(hours=4)
+    scheduler.schedule(first)
+    scheduler.unschedule(second.id)
+    scheduler.fire_due(to_epoch_ms(now + timedelta(hours=3, minutes=30)))
+
+    # Then
+    assert fired == ["flag 3"]
+    assert len(scheduler) == 1
+    assert scheduler.next_expiration == to_epoch_ms(first.expiration_date)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_fires_when_the_flag_expires():
+    """
+    Given a running `ExpirationScheduler` waiting on a flag expiring in an hour
+    When I schedule a flag expiring in 50 milliseconds,
+    Then I'm expecting the scheduler to wake up and fire it right after it expires
+    """
+    # Given
+    scheduler = ExpirationScheduler()
+    expired = asyncio.Event()
+    scheduler.add_listener(lambda _: expired.set())
+    now = datetime.now(tz=utc)
+    scheduler.schedule(Flag(name="later", value=True, expiration_date=now + timedelta(hours=1)))
+    await scheduler.start()
+
+    # When
+    soon = Flag(name="soon", value=True, expiration_date=now + timedelta(milliseconds=50))
+    scheduler.schedule(soon)
+
+    # Then
+    await asyncio.wait_for(expired.wait(), timeout=2)
+    assert scheduler.now_ms >= to_epoch_ms(soon.expiration_date)
+    assert len(scheduler) == 1
+    await scheduler.stop()
+
+
+@pytest.mark.asyncio
+async def test_service_keeps_the_scheduler_in_sync_and_evaluates_on_its_clock():
+    """
+    Given a `FlagBitService` with a snapshot, an `EventHub` and an `ExpirationScheduler`
+    When I create and delete flags and then move the cached clock past an expiration,
+    Then I'm expecting the scheduler to follow the writes and the evaluations to use its clock
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    manager = FlagSnapshotManager(repo=repo)
+    scheduler = ExpirationScheduler()
+    flagbit = FlagBitService(repo=repo, snapshot=manager, events=EventHub(repo=repo), expirations=scheduler)
+
+    # When
+    kept = await flagbit.create_flag(name="kept", value=True, exp_unit="h", exp_value=1)
+    deleted = await flagbit.create_flag(name="deleted", value=True)
+    await flagbit.delete_flag(deleted.id)
+    await manager.refresh()
+
+    # Then
+    assert len(scheduler) == 1
+    assert await flagbit.is_enabled("kept") is True
+    scheduler.now_ms = to_epoch_ms(kept.expiration_date)
+    assert await flagbit.is_enabled("kept") is False
+    assert await flagbit.get_values(["kept"]) == {"kept": False}
+
+
+@pytest.mark.asyncio
+async def test_scheduler_follows_the_writes_of_other_workers_through_the_flag_events():
+    """
+    Given a worker without snapshot, its `ExpirationScheduler` following its `EventHub`
+    When another worker deletes a scheduled `Flag`, re-dates another one and creates a third,
+    Then I'm expecting the scheduler to follow all of those writes
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    other = FlagBitService(repo=repo)
+    deleted = await other.create_flag("deleted", value=True, exp_unit="h", exp_value=1)
+    redated = await other.create_flag("re-dated", value=True, exp_unit="h", exp_value=1)
+    scheduler = ExpirationScheduler()
+    scheduler.replace_all([deleted, redated])
+    hub = EventHub(repo=repo)
+    hub.follow(scheduler.follow_event, revision=await repo.get_revision())
+
+    # When
+    await other.delete_flag(deleted.id)
+    later = datetime.now(tz=utc) + timedelta(days=1)
+    await other.update_flag(redated.id, {"expiration_date": later})
+    created = await other.create_flag("created", value=True, exp_unit="h", exp_value=2)
+    await hub.poll()
+
+    # Then
+    assert len(scheduler) == 2
+    assert scheduler.next_expiration == to_epoch_ms(created.expiration_date)
+
+
+@pytest.mark.asyncio
+async def test_expired_event_is_only_published_for_a_flag_still_expired_in_the_repo():
+    """
+    Given a subscriber of an `EventHub`, a renamed expired `Flag`, a deleted one and a re-dated one,
+         all scheduled before those writes
+    When the scheduler fires the three of them
+    Then I'm expecting a single `expired` event, for the renamed `Flag` with its new name
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    flagbit = FlagBitService(repo=repo)
+    past = datetime.now(tz=utc) - timedelta(seconds=1)
+    renamed, deleted, redated = [
+        await flagbit.create_flag(name, value=True) for name in ("renamed", "deleted", "re-dated")
+    ]
+    fired = [
+        dataclasses.replace(flag, expiration_date=past) for flag in (renamed, deleted, redated)
+    ]
+    await flagbit.update_flag(renamed.id, {"name": "new name", "expiration_date": past})
+    await flagbit.delete_flag(deleted.id)
+    hub = EventHub(repo=repo, config=EventsConfig(heartbeat_seconds=0.05))
+    subscription = aiter(await hub.subscribe())
+
+    # When
+    for flag in fired:
+        hub.publish_expired(flag)
+    event = await anext(subscription)
+    heartbeat = await anext(subscription)
+
+    # Then
+    assert (event.kind, event.flag_id, event.flag.name) == ("expired", renamed.id, "new name")
+    assert heartbeat is None, "Only the renamed flag is still expired"
+    await hub.stop()
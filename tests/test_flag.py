@@ -1,4 +1,9 @@
-from src.domain.flag import Flag
+from datetime import datetime, timedelta
+
+from pytz import utc
+
+from src.domain.flag import Flag, FlagRecord, to_epoch_ms
+from src.repo.doc_store import document_to_flag, flag_to_document
 
 
 def test_user_can_create_a_flag_with_its_name_and_value():
@@ -15,3 +20,40 @@ def test_user_can_create_a_flag_with_its_name_and_value():
     assert flag.name == flag_name, "Something went very wrong!"
     assert flag.value is True
     assert flag.desc is None
+
+
+def test_flag_record_evaluates_expiry_against_the_given_now():
+    """
+    Given a `Flag` expiring in one minute and its compact `FlagRecord`
+    When I evaluate both before and after the expiration,
+    Then I'm expecting the same results, with the record using epoch milliseconds
+    """
+    # Given
+    now = datetime.now(tz=utc)
+    flag = Flag(name="my flag", value=True, expiration_date=now + timedelta(minutes=1))
+    record = FlagRecord.from_flag(flag)
+
+    # When / Then
+    assert record.expires_at == to_epoch_ms(now) + 60_000
+    assert flag.is_expired(now) is record.is_expired(to_epoch_ms(now)) is False
+    later = now + timedelta(minutes=2)
+    assert flag.is_expired(later) is record.is_expired(to_epoch_ms(later)) is True
+    assert record.evaluate(to_epoch_ms(later)) is False
+
+
+def test_flag_round_trips_through_a_mongo_document():
+    """
+    Given a `Flag`
+    When I convert it to a MongoDB document and back,
+    Then I'm expecting an equal `Flag` with its id stored as `_id`
+    """
+    # Given
+    flag = Flag(name="my flag", value=True, desc="desc", revision=3)
+
+    # When
+    document = flag_to_document(flag)
+
+    # Then
+    assert document["_id"] == flag.id and "id" not in document
+    assert document_to_flag(document) == flag
+    assert not hasattr(flag, "__dict__"), "Flags should be slotted"
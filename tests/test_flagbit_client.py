@@ -0,0 +1,124 @@
+"""
+Test cases for `flagbit_client.py`.
+"""
+
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from pytz import utc
+
+from src.clients.flagbit_client import FlagBitClient, FlagBitClientConfig
+
+
+@pytest.fixture
+def http_client(test_app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=test_app), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_client_evaluates_flags_locally_after_startup(
+    http_client, flagship_with_in_memory_repo
+):
+    """
+    Given an enabled, a disabled and an expired `Flag` on the server
+    When I start a `FlagBitClient`,
+    Then I'm expecting `is_enabled` to evaluate all of them locally, and unknown flags to the default
+    """
+    # Given
+    await flagship_with_in_memory_repo.create_flag("enabled", value=True)
+    await flagship_with_in_memory_repo.create_flag("disabled", value=False)
+    expired = await flagship_with_in_memory_repo.create_flag("expired", value=True)
+    expired.expiration_date = datetime.now(tz=utc) - timedelta(days=1)
+
+    # When
+    async with FlagBitClient(http_client=http_client) as flagbit:
+        # Then
+        assert flagbit.is_enabled("enabled") is True
+        assert flagbit.is_enabled("disabled") is False
+        assert flagbit.is_enabled("expired") is False
+        assert flagbit.is_enabled("unknown") is False
+        assert flagbit.is_enabled("unknown", default=True) is True
+
+
+@pytest.mark.asyncio
+async def test_client_applies_only_the_changes_on_refresh(
+    http_client, flagship_with_in_memory_repo
+):
+    """
+    Given a started `FlagBitClient`
+    When a `Flag` is renamed, another one deleted and the client refreshes,
+    Then I'm expecting the local flags to follow the server
+    """
+    # Given
+    renamed = await flagship_with_in_memory_repo.create_flag("old name", value=True)
+    deleted = await flagship_with_in_memory_repo.create_flag("deleted", value=True)
+    flagbit = FlagBitClient(
+        config=FlagBitClientConfig(refresh_interval_seconds=60), http_client=http_client
+    )
+    await flagbit.start()
+
+    # When
+    await flagship_with_in_memory_repo.update_flag(renamed.id, {"name": "new name"})
+    await flagship_with_in_memory_repo.delete_flag(deleted.id)
+    await flagbit.refresh()
+
+    # Then
+    assert flagbit.is_enabled("old name") is False
+    assert flagbit.is_enabled("new name") is True
+    assert flagbit.is_enabled("deleted") is False
+    assert flagbit.revision == await flagship_with_in_memory_repo.repo.get_revision()
+    await flagbit.close()
+
+
+@pytest.mark.asyncio
+async def test_client_disables_a_rollout_flag_without_a_user_id_like_the_server(
+    http_client, flagship_with_in_memory_repo
+):
+    """
+    Given an enabled `Flag` rolled out to every user on the server
+    When I evaluate it with the `FlagBitClient`, with and without a user id,
+    Then I'm expecting it to be enabled for the user only, like the server evaluates it
+    """
+    # Given
+    await flagship_with_in_memory_repo.create_flag("rollout", value=True, rollout_percentage=100)
+
+    # When
+    async with FlagBitClient(http_client=http_client) as flagbit:
+        # Then
+        assert flagbit.is_enabled("rollout", user_id="user-1") is True
+        assert flagbit.is_enabled("rollout") is False
+        assert flagbit.is_enabled("rollout") is await flagship_with_in_memory_repo.is_enabled(
+            "rollout"
+        )
+
+
+@pytest.mark.asyncio
+async def test_client_keeps_the_name_of_a_renamed_flag_given_to_another_one(
+    http_client, flagship_with_in_memory_repo
+):
+    """
+    Given a started `FlagBitClient` knowing an enabled `Flag` named "reused"
+    When the `Flag` is renamed, a disabled one created with its old name,
+         and the changes are listed newest first,
+    Then I'm expecting both `Flags` to be known by their new names
+    """
+    # Given
+    renamed = await flagship_with_in_memory_repo.create_flag("reused", value=True)
+    flagbit = FlagBitClient(
+        config=FlagBitClientConfig(refresh_interval_seconds=60), http_client=http_client
+    )
+    await flagbit.start()
+    await flagship_with_in_memory_repo.update_flag(renamed.id, {"name": "renamed"})
+    await flagship_with_in_memory_repo.create_flag("reused", value=False)
+
+    # When
+    response = await http_client.get("/flags/changes", params={"since": flagbit.revision})
+    changes = response.json()
+    changes["flags"].sort(key=lambda flag: flag["revision"], reverse=True)
+    flagbit._apply_changes(changes)
+
+    # Then
+    assert flagbit.is_enabled("renamed") is True
+    assert flagbit.is_enabled("reused", default=True) is False
+    await flagbit.close()
@@ -3,8 +3,9 @@ from datetime import datetime, timedelta
 import pytest
 from pytz import utc
 
-from src.exceptions import FlagNotFoundError
+from src.exceptions import FlagAlreadyExistsError, FlagNotFoundError, InvalidCursorError
 from src.repo.fake_repo import FakeInMemoryRepo
+from src.helpers import encode_cursor
 from src.services.flagbit import FlagAllowedUpdates, FlagBitService
 
 
@@ -142,3 +143,120 @@ async def test_user_can_see_flag_as_disabled_even_if_value_is_true_but_its_expir
     received_value = await flagship.is_enabled("first flag")
     # Then
     assert received_value is False, "Something wrong happened, flag is expired!"
+
+
+@pytest.mark.asyncio
+async def test_user_can_get_only_the_flags_changed_after_some_revision():
+    """
+    Given some `Flags` created, updated and deleted over time
+    When I call the `get_changes` method with the revision I last saw
+    Then I'm expecting only the `Flags` changed after that revision and the deleted ids
+    """
+    # Given
+    flagship = FlagBitService(repo=FakeInMemoryRepo())
+    untouched = await flagship.create_flag("untouched flag", value=True)
+    updated = await flagship.create_flag("updated flag", value=True)
+    deleted = await flagship.create_flag("deleted flag", value=True)
+    last_seen = (await flagship.get_changes()).revision
+
+    await flagship.update_flag(updated.id, FlagAllowedUpdates(value=False))
+    await flagship.delete_flag(deleted.id)
+
+    # When
+    changes = await flagship.get_changes(since=last_seen)
+
+    # Then
+    assert [flag.id for flag in changes.flags] == [updated.id]
+    assert changes.deleted == [deleted.id]
+    assert untouched.revision <= last_seen < changes.revision
+
+
+@pytest.mark.asyncio
+async def test_user_can_get_many_flag_values_at_once():
+    """
+    Given an enabled, a disabled and an expired `Flag`
+    When I call the `get_values` method with their names and an unknown one
+    Then I'm expecting the same values `is_enabled` returns and the unknown name left out
+    """
+    # Given
+    flagship = FlagBitService(repo=FakeInMemoryRepo())
+    await flagship.create_flag("enabled flag", value=True)
+    await flagship.create_flag("disabled flag", value=False)
+    expired = await flagship.create_flag("expired flag", value=True)
+    expired.expiration_date = datetime.now(tz=utc) - timedelta(days=1)
+
+    # When
+    values = await flagship.get_values(
+        ["enabled flag", "disabled flag", "expired flag", "unknown flag"]
+    )
+
+    # Then
+    assert values == {"enabled flag": True, "disabled flag": False, "expired flag": False}
+
+
+@pytest.mark.asyncio
+async def test_user_cannot_create_two_flags_with_the_same_name():
+    """
+    Given an existing `Flag`
+    When I call the `create_flag` method with the same name
+    Then I'm expecting a `FlagAlreadyExistsError` to be raised
+    """
+    # Given
+    flagship = FlagBitService(repo=FakeInMemoryRepo())
+    await flagship.create_flag("my flag", value=True)
+
+    # When / Then
+    with pytest.raises(FlagAlreadyExistsError):
+        await flagship.create_flag("my flag", value=False)
+
+
+@pytest.mark.asyncio
+async def test_user_can_page_through_all_flags_with_a_cursor():
+    """
+    Given five `Flags`
+    When I call the `get_all_flags` method with a `limit` of two, following the cursor each time
+    Then I'm expecting to get every `Flag` exactly once in creation order
+    """
+    # Given
+    flagship = FlagBitService(repo=FakeInMemoryRepo())
+    created = [await flagship.create_flag(f"flag {i}", value=True) for i in range(5)]
+
+    # When
+    pages, after = [], None
+    while page := await flagship.get_all_flags(limit=2, after=after):
+        pages.append(page)
+        after = encode_cursor(page[-1].cursor)
+
+    # Then
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [flag.id for page in pages for flag in page] == [flag.id for flag in created]
+
+
+@pytest.mark.asyncio
+async def test_user_can_filter_flags_by_expiration():
+    """
+    Given an expired and a not expired `Flag`
+    When I call the `get_all_flags` method with `expired` True and False
+    Then I'm expecting only the matching `Flag` each time
+    """
+    # Given
+    flagship = FlagBitService(repo=FakeInMemoryRepo())
+    active = await flagship.create_flag("active", value=True)
+    expired = await flagship.create_flag("expired", value=True)
+    expired.expiration_date = datetime.now(tz=utc) - timedelta(days=1)
+
+    # When / Then
+    assert [flag.id for flag in await flagship.get_all_flags(expired=True)] == [expired.id]
+    assert [flag.id for flag in await flagship.get_all_flags(expired=False)] == [active.id]
+
+
+@pytest.mark.asyncio
+async def test_user_cannot_page_with_an_invalid_cursor():
+    """
+    Given a malformed cursor
+    When I call the `get_all_flags` method with it
+    Then I'm expecting an `InvalidCursorError` to be raised
+    """
+    flagship = FlagBitService(repo=FakeInMemoryRepo())
+    with pytest.raises(InvalidCursorError):
+        await flagship.get_all_flags(after="not-a-cursor")
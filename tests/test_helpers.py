@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 import pytest
 from pytz import utc
 
-from src.helpers import new_expiration_date
+from src.helpers import decode_cursor, encode_cursor, new_expiration_date
 
 MODULE = "src.helpers"
 
@@ -60,3 +60,35 @@ def test_new_expiration_date_raises_value_error_on_invalid_time_unit():
     with pytest.raises(ValueError) as exc_info:
         new_expiration_date(current_datetime=MOCKED_DT_NOW, unit="invalid", value=1)
     assert "Invalid time unit: invalid" in str(exc_info.value)
+
+
+def test_cursor_can_be_decoded_back_to_the_same_position():
+    """
+    Given a `(date_created, id)` pagination position
+    When I encode and then decode it,
+    Then I expect to get the same position back
+    """
+    position = (MOCKED_DT_NOW, "some-flag-id")
+    assert decode_cursor(encode_cursor(position)) == position
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "W10"])
+def test_decode_cursor_raises_value_error_on_invalid_cursor(cursor):
+    """
+    Given a malformed cursor
+    When I call the `decode_cursor` function,
+    Then I expect to get a `ValueError`
+    """
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_decode_cursor_raises_value_error_on_a_date_without_timezone():
+    """
+    Given a cursor whose date has no timezone
+    When I call the `decode_cursor` function,
+    Then I expect to get a `ValueError`
+    """
+    cursor = encode_cursor((MOCKED_DT_NOW.replace(tzinfo=None), "some-flag-id"))
+    with pytest.raises(ValueError, match="no timezone"):
+        decode_cursor(cursor)
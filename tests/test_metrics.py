@@ -0,0 +1,120 @@
+"""
+Test cases for `metrics.py`.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.api.dependencies import get_flag_bit_service
+from src.api.flags_router import flags_router
+from src.api.metrics import MetricsMiddleware
+from src.exceptions import RepositoryNotFoundError
+from src.metrics import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    REPO_CALL_DURATION,
+    REPO_CALL_ERRORS,
+    Counter,
+    Histogram,
+    MetricsRegistry,
+)
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.services.flagbit import FlagBitService
+
+
+def test_registry_renders_metrics_in_the_prometheus_text_format():
+    """
+    Given a `MetricsRegistry` with a labelled counter and histogram
+    When I record some values and render it,
+    Then I'm expecting cumulative buckets, sums, counts and escaped label values
+    """
+    # Given
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("requests_total", "Requests.", ("path",)))
+    histogram = registry.register(Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+
+    # When
+    counter.inc('/a"b')
+    counter.inc('/a"b')
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+    text = registry.render()
+
+    # Then
+    assert "# TYPE requests_total counter\n" in text
+    assert 'requests_total{path="/a\\"b"} 2\n' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2\n' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3\n' in text
+    assert "latency_seconds_sum 5.55\n" in text and "latency_seconds_count 3\n" in text
+
+
+def test_counter_follows_a_count_kept_elsewhere_without_going_down():
+    """
+    Given a counter following the hits of a cache
+    When the hits grow, and start over once the cache is replaced,
+    Then I'm expecting the counter to only ever go up, by what the hits grew
+    """
+    # Given
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("cache_events_total", "Events.", ("cache", "event")))
+
+    # When
+    counter.follow(3, "flags_cache", "hit")
+    counter.follow(5, "flags_cache", "hit")
+    counter.follow(2, "flags_cache", "hit")
+
+    # Then
+    assert counter.value("flags_cache", "hit") == 7
+    assert "# TYPE cache_events_total counter\n" in registry.render()
+
+
+def test_middleware_records_requests_by_route_template():
+    """
+    Given an app with the `MetricsMiddleware`
+    When I request a flag that does not exist and a path without a route,
+    Then I'm expecting them recorded under their route template and `unmatched`
+    """
+    # Given
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(flags_router)
+    app.dependency_overrides[get_flag_bit_service] = lambda: FlagBitService(FakeInMemoryRepo())
+    not_found_before = HTTP_REQUESTS.value("GET", "/flags/{flag_id}", "404")
+    unmatched_before = HTTP_REQUESTS.value("GET", "unmatched", "404")
+    observed_before = HTTP_REQUEST_DURATION.count("GET", "/flags/{flag_id}")
+
+    # When
+    with TestClient(app) as client:
+        client.get("/flags/unknown-id")
+        client.get("/not/a/route")
+
+    # Then
+    assert HTTP_REQUESTS.value("GET", "/flags/{flag_id}", "404") == not_found_before + 1
+    assert HTTP_REQUESTS.value("GET", "unmatched", "404") == unmatched_before + 1
+    assert HTTP_REQUEST_DURATION.count("GET", "/flags/{flag_id}") == observed_before + 1
+
+
+@pytest.mark.asyncio
+async def test_repo_calls_are_timed_and_their_errors_counted():
+    """
+    Given a `FakeInMemoryRepo`
+    When I look up a `Flag` that does not exist,
+    Then I'm expecting the call to be timed and its error counted by type
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    calls_before = REPO_CALL_DURATION.count("memory", "get_by_id")
+    errors_before = REPO_CALL_ERRORS.value("memory", "get_by_id", "RepositoryNotFoundError")
+
+    # When
+    with pytest.raises(RepositoryNotFoundError):
+        await repo.get_by_id("unknown-id")
+
+    # Then
+    assert REPO_CALL_DURATION.count("memory", "get_by_id") == calls_before + 1
+    assert (
+        REPO_CALL_ERRORS.value("memory", "get_by_id", "RepositoryNotFoundError")
+        == errors_before + 1
+    )
@@ -0,0 +1,289 @@
+"""
+Test cases for `mongo_db_client.py`.
+"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from pymongo.errors import DuplicateKeyError, OperationFailure, ServerSelectionTimeoutError
+from pymongo.monitoring import (
+    ConnectionCheckedInEvent,
+    ConnectionCheckedOutEvent,
+    ConnectionCheckOutFailedEvent,
+    ConnectionCreatedEvent,
+    PoolCreatedEvent,
+)
+from pymongo.read_preferences import SecondaryPreferred
+
+from src.clients.mongo_db_client import (
+    FLAGS_INDEXES,
+    MongoDBAsyncClient,
+    MongoDBConfig,
+    PoolMetricsListener,
+    index_drift,
+)
+from src.exceptions import IndexDriftError
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for document in self.documents:
+            yield document
+
+
+def live_index(name, key, unique=False):
+    index = {"v": 2, "name": name, "key": dict(key)}
+    if unique:
+        index["unique"] = True
+    return index
+
+
+def test_index_drift_reports_unexpected_and_changed_indexes():
+    """
+    Given some live indexes with one unexpected and one redefined index
+    When I call the `index_drift` function,
+    Then I'm expecting both of them to be reported and the missing ones to be ignored
+    """
+    # Given
+    live = {
+        "name_unique": live_index("name_unique", [("name", 1)]),
+        "desc_1": live_index("desc_1", [("desc", 1)]),
+    }
+
+    # When
+    drift = index_drift(declared=FLAGS_INDEXES, live=live)
+
+    # Then
+    assert drift == [
+        "index `name_unique` does not match its declaration",
+        "unexpected index `desc_1`",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_creates_only_the_missing_indexes():
+    """
+    Given a collection with only the unique `name` index
+    When I call the `_ensure_indexes` method,
+    Then I'm expecting only the missing declared indexes to be created
+    """
+    # Given
+    collection = MagicMock()
+    collection.list_indexes = AsyncMock(
+        return_value=FakeCursor(
+            [
+                live_index("_id_", [("_id", 1)]),
+                live_index("name_unique", [("name", 1)], unique=True),
+            ]
+        )
+    )
+    collection.create_indexes = AsyncMock()
+    client = MongoDBAsyncClient()
+
+    # When
+    await client._ensure_indexes(collection, FLAGS_INDEXES)
+
+    # Then
+    created = [index.document["name"] for index in collection.create_indexes.call_args[0][0]]
+    assert created == [
+        "date_created_id",
+        "value_date_created_id",
+        "expiration_date",
+        "revision",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_fails_on_drift_when_configured_to():
+    """
+    Given a collection with an index that is not declared and `index_drift="fail"`
+    When I call the `_ensure_indexes` method,
+    Then I'm expecting an `IndexDriftError` to be raised
+    """
+    # Given
+    collection = MagicMock()
+    collection.list_indexes = AsyncMock(
+        return_value=FakeCursor([live_index("desc_1", [("desc", 1)])])
+    )
+    client = MongoDBAsyncClient(config=MongoDBConfig(index_drift="fail"))
+
+    # When / Then
+    with pytest.raises(IndexDriftError):
+        await client._ensure_indexes(collection, FLAGS_INDEXES)
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_names_the_duplicates_keeping_a_unique_index_from_being_created():
+    """
+    Given a collection without indexes holding two flags with the same name,
+          and `index_drift="fail"`
+    When I call the `_ensure_indexes` method,
+    Then I'm expecting the other indexes to be created one at a time,
+         and an `IndexDriftError` naming the duplicate name
+    """
+    # Given
+    def create_indexes(indexes):
+        if any(index.document["name"] == "name_unique" for index in indexes):
+            raise DuplicateKeyError("E11000 duplicate key error", code=11000)
+
+    collection = MagicMock()
+    collection.name = "flags"
+    collection.list_indexes = AsyncMock(return_value=FakeCursor([]))
+    collection.create_indexes = AsyncMock(side_effect=create_indexes)
+    collection.aggregate = AsyncMock(return_value=FakeCursor([{"_id": {"name": "my flag"}}]))
+    client = MongoDBAsyncClient(config=MongoDBConfig(index_drift="fail"))
+
+    # When
+    with pytest.raises(IndexDriftError) as error:
+        await client._ensure_indexes(collection, FLAGS_INDEXES)
+
+    # Then
+    assert "`name_unique` over the duplicate [{'name': 'my flag'}]" in str(error.value)
+    created = [call.args[0] for call in collection.create_indexes.call_args_list[1:]]
+    assert [index.document["name"] for indexes in created for index in indexes] == [
+        index.document["name"] for index in FLAGS_INDEXES
+    ]
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_reports_no_drift_when_every_index_is_created_one_at_a_time():
+    """
+    Given a collection without indexes refusing to create them all at once,
+          and `index_drift="fail"`
+    When I call the `_ensure_indexes` method and each index is created on its own,
+    Then I'm expecting no `IndexDriftError`
+    """
+    # Given
+    def create_indexes(indexes):
+        if len(indexes) > 1:
+            raise OperationFailure("interrupted")
+
+    collection = MagicMock()
+    collection.name = "flags"
+    collection.list_indexes = AsyncMock(return_value=FakeCursor([]))
+    collection.create_indexes = AsyncMock(side_effect=create_indexes)
+    client = MongoDBAsyncClient(config=MongoDBConfig(index_drift="fail"))
+
+    # When
+    await client._ensure_indexes(collection, FLAGS_INDEXES)
+
+    # Then
+    assert collection.create_indexes.await_count == len(FLAGS_INDEXES) + 1
+
+
+def test_client_options_and_read_preference_follow_the_config():
+    """
+    Given a `MongoDBConfig` with a pool size, an idle time, compression and a read preference
+    When I build the `MongoDBAsyncClient` options and its read preference,
+    Then I'm expecting the driver options to be set and the unset ones left to the driver
+    """
+    # Given
+    config = MongoDBConfig(
+        max_pool_size=20,
+        max_idle_time_ms=60_000,
+        compressors="zstd,zlib",
+        read_preference="secondaryPreferred",
+        read_max_staleness_seconds=90,
+    )
+
+    # When
+    client = MongoDBAsyncClient(config=config)
+    options = client._client_options()
+
+    # Then
+    assert options["maxPoolSize"] == 20
+    assert options["maxIdleTimeMS"] == 60_000
+    assert options["serverSelectionTimeoutMS"] == 5_000
+    assert options["compressors"] == "zstd,zlib"
+    assert "waitQueueTimeoutMS" not in options
+    assert client.read_preference == SecondaryPreferred(max_staleness=90)
+
+
+def test_pool_listener_tracks_the_pool_utilization():
+    """
+    Given a `PoolMetricsListener` for pools of 4 connections
+    When one pool opens two connections, checks both out, returns one and fails a checkout,
+    Then I'm expecting its `PoolStats` to count them, with the peak and the utilization
+    """
+    # Given
+    listener = PoolMetricsListener(max_pool_size=4)
+    address = ("localhost", 27017)
+
+    # When
+    listener.pool_created(PoolCreatedEvent(address, {}))
+    for connection_id in (1, 2):
+        listener.connection_created(ConnectionCreatedEvent(address, connection_id))
+        listener.connection_checked_out(ConnectionCheckedOutEvent(address, connection_id, 0.5))
+    listener.connection_checked_in(ConnectionCheckedInEvent(address, 2))
+    listener.connection_check_out_failed(ConnectionCheckOutFailedEvent(address, "timeout", 1.0))
+    stats = listener.stats
+
+    # Then
+    assert (stats.pools, stats.open, stats.checked_out, stats.peak_checked_out) == (1, 2, 1, 2)
+    assert (stats.checkouts, stats.checkout_failures) == (2, 1)
+    assert stats.mean_checkout_seconds == 0.5
+    assert stats.utilization == 0.25
+
+
+@pytest.mark.asyncio
+async def test_open_does_not_wait_for_the_server_and_a_failed_check_keeps_the_client():
+    """
+    Given a `MongoDBAsyncClient` over a server that cannot be reached
+    When I open it and check it, like a fast start does,
+    Then I'm expecting the open not to ping, the check to raise a `ConnectionError`,
+         and the client to be kept so it can still connect later
+    """
+    # Given
+    driver = MagicMock()
+    driver.admin.command = AsyncMock(side_effect=ServerSelectionTimeoutError("unreachable"))
+    client = MongoDBAsyncClient(client=MagicMock(return_value=driver))
+
+    # When
+    client.open()
+    pinged_on_open = driver.admin.command.await_count
+    with pytest.raises(ConnectionError):
+        await client.check()
+
+    # Then
+    assert pinged_on_open == 0
+    assert client.get_flags_collection() is not None
+    driver.close.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("hello", "supports_transactions"),
+    [
+        ({"isWritablePrimary": True}, False),
+        ({"isWritablePrimary": True, "setName": "rs0"}, True),
+        ({"isWritablePrimary": True, "msg": "isdbgrid"}, True),
+    ],
+)
+async def test_check_tells_a_standalone_server_from_a_replica_set_and_mongos(
+    hello, supports_transactions
+):
+    """
+    Given a `MongoDBAsyncClient` over a standalone server, a replica set member or a `mongos`
+    When I check it
+    Then I'm expecting only the standalone server to turn the transactions off
+    """
+    # Given
+    driver = MagicMock()
+    driver.admin.command = AsyncMock(return_value=hello)
+    client = MongoDBAsyncClient(client=MagicMock(return_value=driver))
+    client._check_flags_collection = AsyncMock()
+    client._check_tombstones_collection = AsyncMock()
+    client.open()
+
+    # When
+    await client.check()
+
+    # Then
+    driver.admin.command.assert_awaited_once_with("hello")
+    assert client.supports_transactions is supports_transactions
@@ -0,0 +1,53 @@
+"""
+Test cases for `rollout.py`.
+"""
+
+import random
+
+import pytest
+
+from src.domain import rollout
+from src.domain.rollout import BUCKETS, in_rollout, in_rollout_batch, rollout_bucket
+
+
+def test_vectorized_rollout_matches_the_per_user_hash(monkeypatch):
+    """
+    Given user ids of mixed lengths, some of them not ASCII
+    When I evaluate a rollout for all of them with and without NumPy,
+    Then I'm expecting the same users in the rollout as when hashing one user at a time
+    """
+    # Given
+    pytest.importorskip("numpy")
+    rng = random.Random(42)
+    user_ids = [f"user-{rng.randrange(10 ** rng.randint(1, 9))}" for _ in range(2000)]
+    user_ids += ["", "ü", "用户-7", "x" * 256]
+
+    # When
+    vectorized = in_rollout_batch("flag-id", user_ids, 37.5)
+    monkeypatch.setattr(rollout, "np", None)
+    per_user = in_rollout_batch("flag-id", user_ids, 37.5)
+
+    # Then
+    assert vectorized == per_user == [in_rollout("flag-id", u, 37.5) for u in user_ids]
+
+
+def test_rollout_is_stable_and_grows_with_the_percentage():
+    """
+    Given 20 000 user ids
+    When I roll a flag out to 10% and then to 30% of them,
+    Then I'm expecting about that share of the users, and every user of 10% to stay in at 30%
+    """
+    # Given
+    user_ids = [f"user-{i}" for i in range(20_000)]
+
+    # When
+    ten = in_rollout_batch("flag-id", user_ids, 10)
+    thirty = in_rollout_batch("flag-id", user_ids, 30)
+
+    # Then
+    assert sum(ten) == pytest.approx(2000, rel=0.1)
+    assert sum(thirty) == pytest.approx(6000, rel=0.1)
+    assert all(t for s, t in zip(ten, thirty, strict=True) if s)
+    assert in_rollout_batch("flag-id", user_ids[:3], 0) == [False] * 3
+    assert in_rollout_batch("flag-id", user_ids[:3], 100) == [True] * 3
+    assert 0 <= rollout_bucket("other-flag", "user-1") < BUCKETS
@@ -0,0 +1,194 @@
+"""
+Test cases for `shared_snapshot.py`.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+from pytz import utc
+
+from src.api.app import app
+from src.clients.sql_client import SQLAsyncClient, SQLConfig
+from src.domain.flag import Flag
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.services.flagbit import FlagBitService
+from src.services.shared_snapshot import (
+    MappedFlagSnapshot,
+    SharedFlagSnapshot,
+    SharedSnapshotConfig,
+)
+from src.services.snapshot import FlagSnapshot, FlagSnapshotManager
+
+
+@pytest.fixture
+def config(tmp_path):
+    return SharedSnapshotConfig(
+        enabled=True, path=tmp_path / "flags.snapshot", check_interval_seconds=0
+    )
+
+
+def test_mapped_snapshot_evaluates_flags_like_the_in_memory_snapshot(config):
+    """
+    Given a `FlagSnapshot` with enabled, disabled, expired, rolled out and non-ASCII named `Flags`
+    When I publish it to a file and map it,
+    Then I'm expecting every name to evaluate like the in-memory snapshot, at any time
+    """
+    # Given
+    now = datetime.now(tz=utc)
+    flags = [
+        Flag(name="enabled", value=True),
+        Flag(name="disabled", value=False),
+        Flag(name="expired", value=True, expiration_date=now - timedelta(days=1)),
+        Flag(name="expiring", value=True, expiration_date=now + timedelta(hours=1)),
+        Flag(name="émoji 🚩", value=True),
+        Flag(name="rollout", value=True, rollout_percentage=50.0),
+        Flag(name="Zeta", value=True),
+    ]
+    snapshot = FlagSnapshot.build(flags=flags, revision=7, built_at=0)
+    shared = SharedFlagSnapshot(config=config)
+
+    # When
+    shared.publish(snapshot)
+    mapped = MappedFlagSnapshot(config.path)
+
+    # Then
+    assert (mapped.revision, len(mapped)) == (7, len(flags))
+    later = snapshot.values["expiring"].expires_at + 1
+    for name in [flag.name for flag in flags] + ["unknown", ""]:
+        assert mapped.value_of(name) == snapshot.value_of(name), name
+        assert mapped.value_of(name, later) == snapshot.value_of(name, later), name
+    mapped.close()
+
+
+def test_shared_snapshot_follows_the_replaced_file_and_allows_one_writer(config):
+    """
+    Given two workers sharing the same snapshot file
+    When the first one takes the writer lock and publishes twice,
+    Then I'm expecting the second one to be refused the lock and to map the latest snapshot
+    """
+    # Given
+    writer, reader = SharedFlagSnapshot(config=config), SharedFlagSnapshot(config=config)
+    assert reader.current is None
+
+    # When
+    assert writer.try_acquire_writer() is True
+    assert reader.try_acquire_writer() is False
+    writer.publish(FlagSnapshot.build([Flag(name="a", value=True)], revision=1, built_at=0))
+    first = reader.current
+    writer.publish(FlagSnapshot.build([Flag(name="a", value=False)], revision=2, built_at=0))
+
+    # Then
+    assert first is not None
+    assert first.revision == 1
+    assert reader.current.revision == 2
+    assert reader.current.value_of("a") is False
+    writer.close()
+    assert reader.try_acquire_writer() is True
+    reader.close()
+
+
+@pytest.mark.asyncio
+async def test_service_evaluates_flags_from_the_shared_snapshot_without_repo_calls(config):
+    """
+    Given a writer `FlagSnapshotManager` publishing to the shared file
+    When a worker without its own snapshot calls `is_enabled` and `get_values`,
+    Then I'm expecting the values from the shared file and the repo to be never queried
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    await repo.store(Flag(name="my flag", value=True))
+    writer = SharedFlagSnapshot(config=config)
+    manager = FlagSnapshotManager(repo=repo)
+    manager.add_listener(writer.publish)
+    await manager.refresh()
+    flagbit = FlagBitService(repo=repo, shared=SharedFlagSnapshot(config=config))
+    repo.get_by_name = AsyncMock()
+    repo.get_many_by_name = AsyncMock()
+
+    # When
+    value = await flagbit.is_enabled("my flag")
+    values = await flagbit.get_values(["my flag"])
+
+    # Then
+    assert value is True
+    assert values == {"my flag": True}
+    repo.get_by_name.assert_not_called()
+    repo.get_many_by_name.assert_not_called()
+
+
+def test_reader_worker_opens_no_connection_and_takes_over_once_the_writer_is_gone(
+    tmp_path, config, monkeypatch
+):
+    """
+    Given the shared snapshot lock held by another worker, and a SQL database
+    When the app starts and the other worker is gone later,
+    Then I'm expecting no connection to be opened while it is a reader,
+         and the app to become the writer and publish the shared snapshot afterwards
+    """
+    # Given
+    url = f"sqlite+aiosqlite:///{tmp_path / 'flagbit.db'}"
+    database = SQLAsyncClient(config=SQLConfig(url=url))
+    asyncio.run(database.connect())
+    asyncio.run(database.close())
+    other_worker = SharedFlagSnapshot(config=config)
+    assert other_worker.try_acquire_writer() is True
+    monkeypatch.setenv("FLAGBIT_STORAGE_BACKEND", "sql")
+    monkeypatch.setenv("FLAGBIT_SQL_URL", url)
+    monkeypatch.setenv("FLAGBIT_SHARED_SNAPSHOT_ENABLED", "true")
+    monkeypatch.setenv("FLAGBIT_SHARED_SNAPSHOT_PATH", str(config.path))
+    monkeypatch.setenv("FLAGBIT_SHARED_SNAPSHOT_WRITER_RETRY_SECONDS", "0.01")
+    monkeypatch.delenv("FLAGBIT_SNAPSHOT_ENABLED", raising=False)
+
+    # When
+    with TestClient(app):
+        pool = app.state.sql_client.engine.pool
+        opened_as_reader = pool.checkedin() + pool.checkedout()
+        shared = app.state.shared_snapshot
+        was_writer = shared.is_writer
+        other_worker.close()
+        for _ in range(100):
+            if shared.current is not None:
+                break
+            time.sleep(0.01)
+        is_writer = shared.is_writer
+        published = shared.current
+
+    # Then
+    assert opened_as_reader == 0
+    assert was_writer is False
+    assert is_writer is True
+    assert published is not None
+
+
+def test_writer_only_touches_the_file_for_a_snapshot_at_the_same_revision(config):
+    """
+    Given a writer which published a snapshot file a while ago
+    When it publishes a snapshot at the same revision,
+    Then I'm expecting the file not to be replaced but the readers to see it as fresh again
+    """
+    # Given
+    config.max_staleness_seconds = 60
+    writer, reader = SharedFlagSnapshot(config=config), SharedFlagSnapshot(config=config)
+    writer.try_acquire_writer()
+    snapshot = FlagSnapshot.build([Flag(name="a", value=True)], revision=1, built_at=0)
+    writer.publish(snapshot)
+    inode = config.path.stat().st_ino
+    an_hour_ago = time.time() - 3600
+    os.utime(config.path, (an_hour_ago, an_hour_ago))
+    mapped = reader.current
+    reader._mapped.built_at -= 3600 * 1000
+    assert reader.current is None, "The snapshot written an hour ago should be stale"
+
+    # When
+    writer.publish(snapshot)
+
+    # Then
+    assert config.path.stat().st_ino == inode
+    assert reader.current is mapped
+    writer.close()
+    reader.close()
@@ -0,0 +1,111 @@
+"""
+Test cases for `single_flight.py`.
+"""
+
+import asyncio
+
+import pytest
+
+from src.exceptions import FlagNotFoundError
+from src.metrics import SINGLE_FLIGHT_CALLS
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.services.flagbit import FlagBitService
+from src.services.single_flight import SingleFlight
+
+
+class SlowRepo(FakeInMemoryRepo):
+    """
+    A `FakeInMemoryRepo` whose lookups take a while, and count how often they run.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lookups = 0
+
+    async def get_by_name(self, name):
+        self.lookups += 1
+        await asyncio.sleep(0.01)
+        return await super().get_by_name(name)
+
+    async def get_by_id(self, _id):
+        self.lookups += 1
+        await asyncio.sleep(0.01)
+        return await super().get_by_id(_id)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_of_the_same_flag_share_one_repo_call():
+    """
+    Given a `FlagBitService` with a `SingleFlight` over a slow repo
+    When 100 requests ask for the same flag value at once, and 10 for the same flag by id,
+    Then I'm expecting one repo call per key, and the other calls counted as coalesced
+    """
+    # Given
+    repo = SlowRepo()
+    flagbit = FlagBitService(repo=repo, single_flight=SingleFlight())
+    flag = await flagbit.create_flag("my flag", value=True)
+    coalesced_before = SINGLE_FLIGHT_CALLS.value("name", "coalesced")
+
+    # When
+    values = await asyncio.gather(*(flagbit.is_enabled("my flag") for _ in range(100)))
+    flags = await asyncio.gather(*(flagbit.get_flag(flag.id) for _ in range(10)))
+
+    # Then
+    assert values == [True] * 100
+    assert all(found.id == flag.id for found in flags)
+    assert repo.lookups == 2
+    assert SINGLE_FLIGHT_CALLS.value("name", "coalesced") == coalesced_before + 99
+
+
+@pytest.mark.asyncio
+async def test_coalesced_lookups_share_the_exception_and_outlive_a_cancelled_caller():
+    """
+    Given a `FlagBitService` with a `SingleFlight` over a slow repo
+    When concurrent lookups ask for a missing flag and for an existing one whose first caller
+         gives up,
+    Then I'm expecting every caller of the missing flag to get `FlagNotFoundError`,
+         and the others to still get the value
+    """
+    # Given
+    repo = SlowRepo()
+    flagbit = FlagBitService(repo=repo, single_flight=SingleFlight())
+    await flagbit.create_flag("my flag", value=True)
+
+    # When
+    missing = await asyncio.gather(
+        *(flagbit.is_enabled("missing") for _ in range(5)), return_exceptions=True
+    )
+    leader = asyncio.create_task(flagbit.is_enabled("my flag"))
+    await asyncio.sleep(0)
+    followers = [asyncio.create_task(flagbit.is_enabled("my flag")) for _ in range(5)]
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    # Then
+    assert all(isinstance(error, FlagNotFoundError) for error in missing)
+    assert await asyncio.gather(*followers) == [True] * 5
+    assert repo.lookups == 2
+
+
+@pytest.mark.asyncio
+async def test_lookups_after_a_write_do_not_join_a_lookup_started_before_it():
+    """
+    Given a lookup of a flag in flight
+    When the flag is updated and looked up again before the first lookup lands,
+    Then I'm expecting the second lookup to run its own call and see the update
+    """
+    # Given
+    repo = SlowRepo()
+    flagbit = FlagBitService(repo=repo, single_flight=SingleFlight())
+    flag = await flagbit.create_flag("my flag", value=True)
+    before = asyncio.create_task(flagbit.get_flag(flag.id))
+    await asyncio.sleep(0)
+
+    # When
+    await flagbit.update_flag(flag.id, {"desc": "updated"})
+    after = await flagbit.get_flag(flag.id)
+
+    # Then
+    assert after.desc == "updated"
+    assert repo.lookups == 2
+    await before
@@ -0,0 +1,256 @@
+"""
+Test cases for `snapshot.py`.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+from pytz import utc
+
+from src.domain.flag import Flag, to_epoch_ms
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.services.flagbit import FlagBitService
+from src.services.snapshot import FlagSnapshot, FlagSnapshotManager, SnapshotConfig
+
+
+def test_snapshot_evaluates_flags_with_the_same_expiry_semantics():
+    """
+    Given a `FlagSnapshot` built from an enabled and an expired `Flag`
+    When I evaluate them by name,
+    Then I'm expecting the expired one to be disabled and unknown names to be `None`
+    """
+    # Given
+    expired = Flag(
+        name="expired", value=True, expiration_date=datetime.now(tz=utc) - timedelta(days=1)
+    )
+    snapshot = FlagSnapshot.build(
+        flags=[Flag(name="enabled", value=True), expired], revision=2, built_at=0
+    )
+
+    # When / Then
+    assert snapshot.value_of("enabled") is True
+    assert snapshot.value_of("expired") is False
+    assert snapshot.value_of("unknown") is None
+
+
+@pytest.mark.asyncio
+async def test_snapshot_manager_does_not_serve_a_snapshot_older_than_max_staleness():
+    """
+    Given a `FlagSnapshotManager` with a zero max staleness
+    When I refresh it,
+    Then I'm expecting no current snapshot to be served
+    """
+    # Given
+    manager = FlagSnapshotManager(
+        repo=FakeInMemoryRepo(), config=SnapshotConfig(max_staleness_seconds=-1)
+    )
+
+    # When
+    await manager.refresh()
+
+    # Then
+    assert manager.current is None, "A too stale snapshot should never be served"
+
+
+@pytest.mark.asyncio
+async def test_service_evaluates_flags_from_the_snapshot_without_repo_calls():
+    """
+    Given a `FlagBitService` with a fresh snapshot
+    When I call `is_enabled`, `get_values` and `get_all_flags`,
+    Then I'm expecting the repo to be never queried
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    await repo.store(Flag(name="my flag", value=True))
+    manager = FlagSnapshotManager(repo=repo)
+    await manager.refresh()
+    flagbit = FlagBitService(repo=repo, snapshot=manager)
+    repo.get_by_name = AsyncMock()
+    repo.get_many_by_name = AsyncMock()
+    repo.get_all = AsyncMock()
+
+    # When
+    value = await flagbit.is_enabled("my flag")
+    values = await flagbit.get_values(["my flag"])
+    flags = await flagbit.get_all_flags()
+
+    # Then
+    assert value is True
+    assert values == {"my flag": True}
+    assert [flag.name for flag in flags] == ["my flag"]
+    assert not repo.get_by_name.called and not repo.get_many_by_name.called
+    assert not repo.get_all.called
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_rebuilt_in_the_background_after_a_write():
+    """
+    Given a started `FlagSnapshotManager` with a long refresh interval
+    When I update a `Flag` through the service,
+    Then I'm expecting a new snapshot to be published with the new value
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    manager = FlagSnapshotManager(repo=repo, config=SnapshotConfig(refresh_interval_seconds=60))
+    flagbit = FlagBitService(repo=repo, snapshot=manager)
+    flag = await flagbit.create_flag("my flag", value=True)
+    await manager.start()
+    first_snapshot = manager.current
+
+    # When
+    await flagbit.update_flag(flag.id, {"value": False})
+    await asyncio.sleep(0.01)
+
+    # Then
+    assert manager.current is not first_snapshot, "A new snapshot should be swapped in"
+    assert first_snapshot.value_of("my flag") is True, "Published snapshots never change"
+    assert await flagbit.is_enabled("my flag") is False
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_refresher_keeps_running_after_a_repo_or_listener_error():
+    """
+    Given a started `FlagSnapshotManager` with a failing listener before a working one
+    When a refresh fails with an unexpected repo error and the next one succeeds,
+    Then I'm expecting the previous snapshot to be kept, and the new one to reach
+         the working listener
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    await repo.store(Flag(name="my flag", value=True))
+    manager = FlagSnapshotManager(repo=repo, config=SnapshotConfig(refresh_interval_seconds=60))
+    published = []
+
+    def failing_listener(_snapshot):
+        raise RuntimeError
+
+    manager.add_listener(failing_listener)
+    manager.add_listener(published.append)
+    await manager.start()
+    first_snapshot = manager.current
+
+    # When
+    get_revision = repo.get_revision
+    repo.get_revision = AsyncMock(side_effect=ValueError("unexpected"))
+    manager.request_refresh()
+    await asyncio.sleep(0.01)
+    kept_snapshot = manager.current
+    repo.get_revision = get_revision
+    await repo.store(Flag(name="new flag", value=True))
+    manager.request_refresh()
+    await asyncio.sleep(0.01)
+
+    # Then
+    assert kept_snapshot is first_snapshot
+    assert manager.current.value_of("new flag") is True
+    assert [snapshot.revision for snapshot in published] == [1, 2]
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_pages_flags_like_the_repo():
+    """
+    Given a `FlagSnapshot` built from the same `Flags` as a repo
+    When I page through both with the same cursor,
+    Then I'm expecting the same pages
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    for i in range(5):
+        await repo.store(Flag(name=f"flag {i}", value=bool(i % 2)))
+    snapshot = FlagSnapshot.build(flags=await repo.get_all(), revision=5, built_at=0)
+    after = (await repo.get_all(limit=1))[0].cursor
+
+    # When
+    repo_page = await repo.get_all(flag_value=True, limit=2, after=after)
+    snapshot_page = snapshot.get_all(flag_value=True, limit=2, after=after)
+
+    # Then
+    assert [flag.id for flag in snapshot_page] == [flag.id for flag in repo_page]
+
+
+@pytest.mark.asyncio
+async def test_service_state_tag_follows_the_snapshot_revision_and_expirations():
+    """
+    Given a `FlagBitService` with a fresh snapshot
+    When the snapshot is rebuilt after a write or one of its `Flags` expires,
+    Then I'm expecting a new state tag, and no tag for names the snapshot does not know
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    manager = FlagSnapshotManager(repo=repo)
+    flagbit = FlagBitService(repo=repo, snapshot=manager)
+    flag = await flagbit.create_flag("my flag", value=True, exp_unit="m", exp_value=1)
+    await manager.refresh()
+    first_tag = flagbit.state_tag()
+
+    # When
+    await flagbit.create_flag("other flag", value=True)
+    await manager.refresh()
+    second_tag = flagbit.state_tag()
+    expired_count = manager.current.expired_count(now=to_epoch_ms(flag.expiration_date))
+
+    # Then
+    assert first_tag is not None and first_tag != second_tag
+    assert flagbit.state_tag(name="my flag") == second_tag
+    assert flagbit.state_tag(name="unknown flag") is None
+    assert expired_count == 1, "The flag should count as expired once its expiration passed"
+
+
+@pytest.mark.asyncio
+async def test_refresh_at_the_same_revision_restamps_the_snapshot_without_rebuilding_it():
+    """
+    Given a `FlagSnapshotManager` with a snapshot and a listener
+    When I refresh it again with nothing written meanwhile,
+    Then I'm expecting the flags not to be read again, and the same flags to be published
+         as built later
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    await repo.store(Flag(name="my flag", value=True))
+    manager = FlagSnapshotManager(repo=repo)
+    first = await manager.refresh()
+    published = []
+    manager.add_listener(published.append)
+    repo.get_all = AsyncMock()
+
+    # When
+    second = await manager.refresh()
+
+    # Then
+    assert not repo.get_all.called
+    assert published == [second]
+    assert second.revision == first.revision
+    assert second.flags is first.flags
+    assert second.built_at >= first.built_at
+
+
+@pytest.mark.asyncio
+async def test_service_lists_flags_from_the_repo_when_the_snapshot_is_cut_at_max_flags():
+    """
+    Given a `FlagBitService` with a snapshot holding at most 2 of its 3 `Flags`
+    When I list the `Flags` and look up the one left out,
+    Then I'm expecting all of them to be listed by the repo, without a snapshot tag,
+         and the one left out to be found too
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    for name in ("first", "second", "third"):
+        await repo.store(Flag(name=name, value=True))
+    manager = FlagSnapshotManager(repo=repo, config=SnapshotConfig(max_flags=2))
+    snapshot = await manager.refresh()
+    flagbit = FlagBitService(repo=repo, snapshot=manager)
+
+    # When
+    flags = await flagbit.get_all_flags()
+    value = await flagbit.is_enabled("third")
+
+    # Then
+    assert not snapshot.complete
+    assert len(snapshot.flags) == 2
+    assert [flag.name for flag in flags] == ["first", "second", "third"]
+    assert flagbit.state_tag() is None
+    assert value is True
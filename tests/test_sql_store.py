@@ -0,0 +1,198 @@
+"""
+Test cases for `sql_store.py`.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from pytz import utc
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.clients.sql_client import SQLAsyncClient, SQLConfig
+from src.domain.flag import Flag
+from src.exceptions import (
+    RepositoryConnectionError,
+    RepositoryDuplicateError,
+    RepositoryNotFoundError,
+    RepositoryVersionConflictError,
+)
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.repo.sql_store import SQLStoreRepo
+
+
+@pytest_asyncio.fixture
+async def sql_client(tmp_path):
+    client = SQLAsyncClient(config=SQLConfig(url=f"sqlite+aiosqlite:///{tmp_path / 'flags.db'}"))
+    await client.connect()
+    yield client
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_sql_store_round_trips_a_flag_with_its_timezone(sql_client):
+    """
+    Given a `SQLStoreRepo` over SQLite, which stores no timezones
+    When I store a `Flag` with an expiration date and read it back by id and by name,
+    Then I'm expecting the same `Flag`, with timezone aware dates and its revision
+    """
+    # Given
+    repo = SQLStoreRepo(client=sql_client)
+    flag = Flag(name="my flag", value=True, desc="desc", expiration_date=datetime.now(tz=utc))
+
+    # When
+    await repo.store(flag)
+
+    # Then
+    assert await repo.get_by_id(flag.id) == flag
+    assert await repo.get_by_name("my flag") == flag
+    assert flag.revision == await repo.get_revision() == 1
+    with pytest.raises(RepositoryDuplicateError):
+        await repo.store(Flag(name="my flag", value=False))
+    with pytest.raises(RepositoryNotFoundError):
+        await repo.get_by_name("missing")
+
+
+@pytest.mark.asyncio
+async def test_sql_store_store_many_reports_the_taken_names(sql_client):
+    """
+    Given a `SQLStoreRepo` with a stored `Flag`
+    When I store a batch repeating its name, and repeating a name inside the batch,
+    Then I'm expecting the other `Flags` to be stored, each with its own revision
+    """
+    # Given
+    repo = SQLStoreRepo(client=sql_client)
+    await repo.store(Flag(name="taken", value=True))
+
+    # When
+    results = await repo.store_many(
+        [
+            Flag(name="first", value=True),
+            Flag(name="taken", value=False),
+            Flag(name="second", value=True),
+            Flag(name="first", value=False),
+        ]
+    )
+
+    # Then
+    assert [result.stored for result in results] == [True, False, True, False]
+    assert [result.flag.revision for result in results if result.stored] == [2, 3]
+    names = [flag.name for flag in await repo.get_many_by_name(["first", "second", "nope"])]
+    assert sorted(names) == ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_sql_store_pages_flags_like_the_in_memory_repo(sql_client):
+    """
+    Given the same `Flags` in a `SQLStoreRepo` and a `FakeInMemoryRepo`, some of them expired
+    When I page through both with every filter,
+    Then I'm expecting the same pages, and `iter_all` to stream them all in order
+    """
+    # Given
+    sql, in_memory = SQLStoreRepo(client=sql_client), FakeInMemoryRepo()
+    now = datetime.now(tz=utc)
+    for i in range(20):
+        expiration_date = now + timedelta(days=i % 3 - 1) if i % 4 else None
+        for repo in (sql, in_memory):
+            await repo.store(
+                Flag(
+                    id=f"id-{i:02}",
+                    name=f"flag {i}",
+                    value=bool(i % 2),
+                    expiration_date=expiration_date,
+                    date_created=now + timedelta(seconds=i % 5),
+                )
+            )
+    after = (await in_memory.get_all(limit=3))[-1].cursor
+
+    # When / Then
+    for filters in (
+        {},
+        {"flag_value": True},
+        {"expired": True},
+        {"expired": False},
+        {"flag_value": False, "expired": True},
+        {"flag_name": "flag 7"},
+    ):
+        expected = await in_memory.get_all(limit=4, after=after, **filters)
+        actual = await sql.get_all(limit=4, after=after, **filters)
+        assert [flag.id for flag in actual] == [flag.id for flag in expected], filters
+    streamed = [flag.id async for flag in sql.iter_all(batch_size=3)]
+    assert streamed == [flag.id for flag in await in_memory.get_all(limit=100)]
+
+
+@pytest.mark.asyncio
+async def test_sql_store_tracks_changes_and_tombstones(sql_client):
+    """
+    Given a `SQLStoreRepo` with two stored `Flags`
+    When I update one, delete the other and ask for the changes since the first write,
+    Then I'm expecting the updated `Flag` and the id of the deleted one
+    """
+    # Given
+    repo = SQLStoreRepo(client=sql_client)
+    kept, deleted = Flag(name="kept", value=True), Flag(name="deleted", value=True)
+    await repo.store_many([kept, deleted])
+
+    # When
+    kept.value = False
+    await repo.update(kept)
+    await repo.delete(deleted.id)
+    changes = await repo.get_changes(since=1)
+
+    # Then
+    assert changes.revision == 4
+    assert [(flag.name, flag.value) for flag in changes.flags] == [("kept", False)]
+    assert changes.deleted == [deleted.id]
+    with pytest.raises(RepositoryNotFoundError):
+        await repo.update(deleted)
+    await repo.delete_all()
+    assert await repo.get_all() == []
+    assert (await repo.get_changes(since=4)).deleted == [kept.id]
+
+
+@pytest.mark.asyncio
+async def test_sql_store_maps_an_unreachable_database_to_a_connection_error(tmp_path):
+    """
+    Given a `SQLStoreRepo` over a SQLite file in a directory that does not exist
+    When I read a `Flag`,
+    Then I'm expecting a `RepositoryConnectionError`
+    """
+    # Given
+    client = SQLAsyncClient(
+        config=SQLConfig(url=f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'flags.db'}")
+    )
+    client._engine = create_async_engine(client.config.url)
+    repo = SQLStoreRepo(client=client)
+
+    # When / Then
+    with pytest.raises(RepositoryConnectionError):
+        await repo.get_by_name("my flag")
+    await client.close()
+    with pytest.raises(ConnectionError):
+        await client.connect()
+
+
+@pytest.mark.asyncio
+async def test_sql_store_updates_fields_only_at_the_expected_version(sql_client):
+    """
+    Given a `SQLStoreRepo` with a stored `Flag`
+    When I update some of its fields at its version, and then again at the same version,
+    Then I'm expecting the first update to return the new row with the next version,
+         and the second one to be rejected without changing the flag or the revision
+    """
+    # Given
+    repo = SQLStoreRepo(client=sql_client)
+    flag = Flag(name="my flag", value=True, desc="desc")
+    await repo.store(flag)
+
+    # When
+    updated = await repo.update_fields(flag.id, {"value": False}, expected_version=flag.version)
+    with pytest.raises(RepositoryVersionConflictError):
+        await repo.update_fields(flag.id, {"desc": "lost"}, expected_version=flag.version)
+
+    # Then
+    assert (updated.value, updated.desc, updated.version) == (False, "desc", 2)
+    assert await repo.get_by_id(flag.id) == updated
+    assert await repo.get_revision() == updated.revision
+    with pytest.raises(RepositoryNotFoundError):
+        await repo.update_fields("missing", {"value": True})
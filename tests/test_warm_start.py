@@ -0,0 +1,174 @@
+"""
+Test cases for `warm_start.py` and the warm start of `FlagSnapshotManager`.
+"""
+
+import asyncio
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api.app import app
+from src.domain.flag import Flag
+from src.repo.fake_repo import FakeInMemoryRepo
+from src.services.last_known import LastKnownFlags
+from src.services.snapshot import FlagSnapshot, FlagSnapshotManager, SnapshotConfig
+from src.services.warm_start import WarmSnapshotWriter, load_warm_snapshot
+
+
+@pytest.mark.asyncio
+async def test_warm_snapshot_is_written_on_new_revisions_and_loaded_back(tmp_path):
+    """
+    Given a `WarmSnapshotWriter` that already wrote a snapshot at revision 3
+    When it is called with the same revision again, and the file is loaded back,
+    Then I'm expecting the file not to be rewritten and the same `Flags` to be loaded,
+         unless the file is older than the max age or missing
+    """
+    # Given
+    path = tmp_path / "flags.warm.json"
+    flags = [Flag(name="enabled", value=True, rollout_percentage=25.0), Flag(name="disabled", value=False)]
+    writer = WarmSnapshotWriter(path)
+    writer(FlagSnapshot.build(flags=flags, revision=3, built_at=0))
+    await writer.close()
+    os.utime(path, (0, 0))
+
+    # When
+    writer(FlagSnapshot.build(flags=[], revision=3, built_at=0))
+    await writer.close()
+    loaded = load_warm_snapshot(path, max_age_seconds=float("inf"))
+
+    # Then
+    assert loaded is not None
+    assert loaded.revision == 3
+    assert sorted(loaded.flags, key=lambda flag: flag.name) == sorted(
+        flags, key=lambda flag: flag.name
+    )
+    assert loaded.values["enabled"].rollout_percentage == 25.0
+    assert loaded.value_of("enabled") is False, "No user is known to be in the rollout"
+    assert load_warm_snapshot(path, max_age_seconds=60) is None
+    assert load_warm_snapshot(tmp_path / "missing.json", max_age_seconds=60) is None
+
+
+@pytest.mark.asyncio
+async def test_seeded_snapshot_is_served_until_the_background_refresh_replaces_it():
+    """
+    Given a `FlagSnapshotManager` seeded with a warm snapshot of an old `Flag`
+    When I start it without waiting for the first refresh,
+    Then I'm expecting the warm snapshot to be served right away,
+         and the `Flags` of the repo once the refresh ran in the background
+    """
+    # Given
+    repo = FakeInMemoryRepo()
+    await repo.store(Flag(name="fresh", value=True))
+    manager = FlagSnapshotManager(repo=repo, config=SnapshotConfig(refresh_interval_seconds=60))
+    published = []
+    manager.add_listener(published.append)
+    manager.seed(
+        FlagSnapshot.build(
+            flags=[Flag(name="warm", value=True)], revision=0, built_at=time.monotonic()
+        )
+    )
+
+    # When
+    await manager.start(wait=False)
+    served_right_away = manager.current
+
+    # Then
+    assert served_right_away is not None
+    assert served_right_away.value_of("warm") is True
+    await asyncio.sleep(0.01)
+    assert manager.current.value_of("fresh") is True
+    assert manager.current.value_of("warm") is None
+    assert [snapshot.revision for snapshot in published] == [0, 1]
+    await manager.stop()
+
+
+def test_fast_start_alone_writes_the_warm_snapshot_and_serves_it_on_the_next_start(
+    tmp_path, monkeypatch
+):
+    """
+    Given the embedded storage with only `FLAGBIT_FAST_START_ENABLED` set
+    When a `Flag` is created and the app started again,
+    Then I'm expecting the warm snapshot to be written, and served by the next start
+    """
+    # Given
+    warm_path = tmp_path / "flags.warm.json"
+    monkeypatch.setenv("FLAGBIT_STORAGE_BACKEND", "embedded")
+    monkeypatch.setenv("FLAGBIT_EMBEDDED_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setenv("FLAGBIT_FAST_START_ENABLED", "true")
+    monkeypatch.setenv("FLAGBIT_FAST_START_SNAPSHOT_PATH", str(warm_path))
+    monkeypatch.delenv("FLAGBIT_SNAPSHOT_ENABLED", raising=False)
+
+    # When
+    with TestClient(app) as client:
+        client.post("/flags", json={"name": "my flag", "value": True})
+        for _ in range(100):
+            if (warm := load_warm_snapshot(warm_path, max_age_seconds=60)) and warm.revision:
+                break
+            time.sleep(0.01)
+    with TestClient(app) as client:
+        served = app.state.flag_snapshot.current
+
+    # Then
+    assert warm is not None
+    assert warm.value_of("my flag") is True
+    assert served is not None
+    assert served.value_of("my flag") is True
+
+
+@pytest.mark.asyncio
+async def test_only_the_worker_holding_the_lock_writes_the_warm_snapshot(tmp_path):
+    """
+    Given the `WarmSnapshotWriters` of two workers of the same host
+    When both are called with a new snapshot, and again once the first one is closed,
+    Then I'm expecting only the first one to write it, then the second one to take over
+    """
+    # Given
+    path = tmp_path / "flags.warm.json"
+    first, second = WarmSnapshotWriter(path), WarmSnapshotWriter(path)
+
+    # When
+    first(FlagSnapshot.build(flags=[Flag(name="first", value=True)], revision=1, built_at=0))
+    second(FlagSnapshot.build(flags=[Flag(name="second", value=True)], revision=1, built_at=0))
+    await first.close()
+    await second.close()
+    written_first = load_warm_snapshot(path, max_age_seconds=60)
+    second(FlagSnapshot.build(flags=[Flag(name="second", value=True)], revision=2, built_at=0))
+    await second.close()
+
+    # Then
+    assert [flag.name for flag in written_first.flags] == ["first"]
+    assert [flag.name for flag in load_warm_snapshot(path, max_age_seconds=60).flags] == ["second"]
+
+
+@pytest.mark.asyncio
+async def test_warm_snapshot_is_as_old_as_its_file(tmp_path):
+    """
+    Given a warm snapshot written 10 minutes ago
+    When it is loaded and its `Flags` remembered as the last known good ones,
+    Then I'm expecting both to be 10 minutes old, so the snapshot is not served as fresh
+    """
+    # Given
+    path = tmp_path / "flags.warm.json"
+    writer = WarmSnapshotWriter(path)
+    writer(FlagSnapshot.build(flags=[Flag(name="warm", value=True)], revision=1, built_at=0))
+    await writer.close()
+    ten_minutes_ago = time.time() - 600
+    os.utime(path, (ten_minutes_ago, ten_minutes_ago))
+    last_known = LastKnownFlags(max_age_seconds=3600)
+
+    # When
+    warm = load_warm_snapshot(path, max_age_seconds=3600)
+    last_known.remember_flags(list(warm.flags), remembered_at=warm.built_at)
+    manager = FlagSnapshotManager(repo=FakeInMemoryRepo())
+    manager.seed(warm)
+
+    # Then
+    assert time.monotonic() - warm.built_at == pytest.approx(600, abs=5)
+    _, age_seconds = last_known.recall_flag("warm")
+    assert age_seconds == pytest.approx(600, abs=5)
+    assert manager.current is None, "A 10 minutes old snapshot is too stale to be served"
+    short_lived = LastKnownFlags(max_age_seconds=60)
+    short_lived.remember_flags(list(warm.flags), remembered_at=warm.built_at)
+    assert short_lived.recall_flag("warm") is None, "Flags older than the max age are not kept"